@@ -0,0 +1,166 @@
+# adaptive_threshold.py (Адаптивный порог: скользящий перцентиль оценок за O(log n) на окно)
+
+import heapq
+from collections import deque, defaultdict
+
+import numpy as np
+
+from config import (SCORE_HISTORY_SIZE, ADAPTIVE_THRESHOLD_PERCENTILE_IF, ADAPTIVE_THRESHOLD_PERCENTILE_TF,
+                    ADAPTIVE_THRESHOLD_MIN_SAMPLES)
+
+
+class SlidingPercentile:
+    """
+    Перцентиль последних size значений, совпадающий с np.percentile (линейная интерполяция).
+
+    Значения делятся на две кучи: в low (max-куча) - наименьшие k+1, где
+    k = floor((n-1) * q / 100), в high (min-куча) - остальные. Тогда вершины куч -
+    ровно k-я и (k+1)-я порядковые статистики, между которыми интерполирует NumPy.
+    Вытесненное из окна значение удаляется лениво: запоминается в _delayed и
+    выбрасывается, когда оказывается на вершине кучи. Записи, которые так и не
+    всплыли (например, при монотонном тренде), убираются пересборкой куч, когда
+    их становится больше size: в среднем добавление и вытеснение остаются
+    O(log n) вместо сортировки всей истории на каждое окно.
+    """
+
+    def __init__(self, percentile: float, size: int = SCORE_HISTORY_SIZE):
+        self.percentile = percentile
+        self.size = size
+        self._window = deque()
+        self._low, self._high = [], []  # в low хранятся -x
+        self._low_size = self._high_size = 0
+        self._delayed = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self._window)
+
+    def clear(self):
+        self.__init__(self.percentile, self.size)
+
+    def add(self, value: float):
+        value = float(value)
+        if len(self._window) == self.size:
+            self._remove(self._window.popleft())
+        self._window.append(value)
+        if value <= (-self._low[0] if self._low_size else (self._high[0] if self._high_size else value)):
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        if len(self._low) + len(self._high) > 2 * self.size:
+            self._rebuild()
+        else:
+            self._rebalance()
+
+    def value(self) -> float:
+        """Текущий перцентиль; для пустого окна - nan."""
+        n = len(self._window)
+        if not n:
+            return float('nan')
+        position = (n - 1) * self.percentile / 100
+        fraction = position - int(position)
+        lower = -self._low[0]
+        if fraction == 0 or not self._high_size:
+            return lower
+        return lower + fraction * (self._high[0] - lower)
+
+    def _remove(self, value: float):
+        self._delayed[value] += 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            self._prune(self._high, 1)
+
+    def _prune(self, heap: list, sign: int):
+        """Снимает с вершины heap значения, уже вытесненные из окна."""
+        while heap and self._delayed.get(sign * heap[0]):
+            value = sign * heapq.heappop(heap)
+            self._delayed[value] -= 1
+            if not self._delayed[value]:
+                del self._delayed[value]
+
+    def _target(self) -> int:
+        return int((len(self._window) - 1) * self.percentile / 100) + 1
+
+    def _rebuild(self):
+        ordered = sorted(self._window)
+        target = self._target()
+        self._low = [-value for value in reversed(ordered[:target])]
+        self._high = ordered[target:]
+        self._low_size, self._high_size = len(self._low), len(self._high)
+        self._delayed.clear()
+
+    def _rebalance(self):
+        target = self._target()
+        while self._low_size > target:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        while self._low_size < target and self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, 1)
+
+
+class AdaptiveThreshold:
+    """
+    Порог тревоги, подстраивающийся под последние "безопасные" оценки.
+
+    floor - порог, вычисленный при обучении (initial_threshold), он же постоянная
+    граница: в историю попадают только оценки по нормальную сторону от него, а
+    адаптивный порог никогда не становится менее чувствительным, чем floor.
+    Isolation Forest: аномалия - оценка ниже порога, порог = max(P2 истории, floor).
+    Автоэнкодер (higher_is_anomalous): аномалия - ошибка выше порога, порог = min(P98, floor).
+    Пока в истории меньше min_samples оценок, действует floor.
+    """
+
+    def __init__(self, floor: float, percentile: float, higher_is_anomalous: bool = False,
+                 size: int = SCORE_HISTORY_SIZE, min_samples: int = ADAPTIVE_THRESHOLD_MIN_SAMPLES):
+        self.floor = float(floor)
+        self.higher_is_anomalous = higher_is_anomalous
+        self.min_samples = min_samples
+        self.history = SlidingPercentile(percentile, size)
+        self.value = self.floor
+
+    @classmethod
+    def for_model(cls, model_type: str, floor: float, **kwargs) -> 'AdaptiveThreshold':
+        if model_type == 'tensorflow':
+            return cls(floor, ADAPTIVE_THRESHOLD_PERCENTILE_TF, higher_is_anomalous=True, **kwargs)
+        return cls(floor, ADAPTIVE_THRESHOLD_PERCENTILE_IF, **kwargs)
+
+    def is_anomaly(self, score: float) -> bool:
+        return score > self.value if self.higher_is_anomalous else score < self.value
+
+    def update(self, score: float) -> bool:
+        """Проверяет оценку по текущему порогу, затем (если она безопасна) сдвигает порог. Возвращает тревогу."""
+        is_alert = self.is_anomaly(score)
+        is_safe_to_adapt = score <= self.floor if self.higher_is_anomalous else score >= self.floor
+        if is_safe_to_adapt:
+            self.history.add(score)
+            self._adapt()
+        return is_alert
+
+    def update_batch(self, scores) -> np.ndarray:
+        """Оценки одного окна по узлам/потокам: все проверяются текущим порогом, затем порог сдвигается один раз."""
+        scores = np.asarray(scores, dtype=np.float64)
+        alerts = scores > self.value if self.higher_is_anomalous else scores < self.value
+        for score in scores[scores <= self.floor] if self.higher_is_anomalous else scores[scores >= self.floor]:
+            self.history.add(score)
+        self._adapt()
+        return alerts
+
+    def _adapt(self):
+        if len(self.history) >= self.min_samples:
+            adapted = self.history.value()
+            self.value = min(adapted, self.floor) if self.higher_is_anomalous else max(adapted, self.floor)
+
+    def reset(self, floor: float = None):
+        if floor is not None:
+            self.floor = float(floor)
+        self.history.clear()
+        self.value = self.floor
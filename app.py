@@ -3,22 +3,42 @@
 import os
 import shutil
 import json
+import socket
 from datetime import datetime, timedelta
-from flask import Flask, render_template, jsonify, request, flash, redirect, url_for
+import time
+import queue
+import threading
+import click
+from flask import Flask, Response, render_template, jsonify, request, flash, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
 # --- ВОЗВРАЩАЕМ FLASK-LOGIN ---
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 # ----------------------------
 from werkzeug.security import generate_password_hash, check_password_hash
-from scapy.all import get_if_list
+
+from traffic_store import bucket_start, rebuild_rollups, migrate_domain_blobs
+from db_setup import engine_options, create_readonly_session
+from status_stream import StatusBroadcaster, format_sse
+from score_store import downsample_scores, load_scores
+from interface_monitor import parse_interface_spec, format_interface_spec
+from config import STATUS_STREAM_HEARTBEAT, TIME_WINDOW
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'a_very_secret_and_long_key_for_flask_sessions'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('MLIDS_DATABASE_URI', 'sqlite:///site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
 
 db = SQLAlchemy(app)
+# Тяжёлые чтения панели идут через отдельный пул только для чтения и не мешают записи воркера
+with app.app_context():
+    read_session = create_readonly_session(db.engine.url.database)
+
+
+@app.teardown_appcontext
+def remove_read_session(exception=None):
+    read_session.remove()
 
 # --- ВОЗВРАЩАЕМ LOGIN MANAGER ---
 login_manager = LoginManager(app)
@@ -55,19 +75,94 @@ class TrafficLog(db.Model):
     total_bytes = db.Column(db.BigInteger, default=0)
     packet_count = db.Column(db.Integer, default=0)
     protocols = db.Column(db.String(200))
-    domains = db.Column(db.Text)
+    domains = db.Column(db.Text)  # Устаревшая колонка: домены теперь в Domain/DeviceDomainHour (flask migrate-domains)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
+class TrafficRollupMixin:
+    """Предагрегированный TrafficLog: одна строка на (пользователь, устройство, корзина времени)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    local_ip = db.Column(db.String(50), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False, index=True)
+    total_bytes = db.Column(db.BigInteger, default=0)
+    packet_count = db.Column(db.Integer, default=0)
+    protocols = db.Column(db.String(200))
+
+
+class TrafficRollupMinute(TrafficRollupMixin, db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'bucket', 'local_ip'),)
+
+
+class TrafficRollupHour(TrafficRollupMixin, db.Model):
+    __table_args__ = (db.UniqueConstraint('user_id', 'bucket', 'local_ip'),)
+
+
+class Domain(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+
+
+class DeviceDomainHour(db.Model):
+    """Обращения устройства к домену за час: пакеты (hits) и байты."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    local_ip = db.Column(db.String(50), nullable=False)
+    domain_id = db.Column(db.Integer, db.ForeignKey('domain.id'), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False, index=True)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    total_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    # Первый индекс отвечает на "какие устройства ходили на домен", второй - на "топ доменов устройства"
+    __table_args__ = (db.UniqueConstraint('user_id', 'domain_id', 'bucket', 'local_ip'),
+                      db.Index('ix_device_domain_hour_device', 'user_id', 'local_ip', 'bucket'))
+
+
+# Агрегаты и индекс доменов, которые воркер обновляет при каждой записи TrafficLog
+ROLLUP_TABLES = {'minute': TrafficRollupMinute.__table__, 'hour': TrafficRollupHour.__table__}
+DOMAIN_TABLES = (Domain.__table__, DeviceDomainHour.__table__)
+
+# Период /statistics -> (глубина, таблица агрегатов, подпись)
+STATISTICS_PERIODS = {
+    'hour': (timedelta(hours=1), TrafficRollupMinute, "за последний час"),
+    'day': (timedelta(days=1), TrafficRollupHour, "за последние 24 часа"),
+    'week': (timedelta(days=7), TrafficRollupHour, "за последнюю неделю"),
+    'month': (timedelta(days=30), TrafficRollupHour, "за последние 30 дней"),
+}
+
+
 class ActiveState(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
     is_monitoring = db.Column(db.Boolean, default=False)
     active_model_id = db.Column(db.Integer, nullable=True)
-    interface = db.Column(db.String(100), nullable=True)
+    # Интерфейсы через запятую, у интерфейса может быть своя модель: 'eth0,eth1=5' (interface_monitor.py)
+    interface = db.Column(db.String(255), nullable=True)
     worker_status_json = db.Column(db.Text, default='{}')
 
 
+class WorkerEvent(db.Model):
+    """Журнал событий воркера для /status/stream: окно (score/порог), строка лога, смена состояния."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+
+
+class ScoreRecord(db.Model):
+    """Оценка одного окна мониторинга вместе с вектором признаков (для графиков и переоценки)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    ts = db.Column(db.Float, nullable=False)  # Конец окна, секунды epoch (UTC)
+    model_id = db.Column(db.Integer, nullable=True)
+    interface = db.Column(db.String(100), nullable=True)
+    score = db.Column(db.Float, nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    is_anomaly = db.Column(db.Boolean, nullable=False, default=False)
+    features = db.Column(db.LargeBinary, nullable=False)
+    __table_args__ = (db.Index('ix_score_record_user_ts', 'user_id', 'ts'),)
+
+
 # --- ВОЗВРАЩАЕМ ЗАГРУЗЧИК ПОЛЬЗОВАТЕЛЯ ---
 @login_manager.user_loader
 def load_user(user_id):
@@ -76,6 +171,24 @@ def load_user(user_id):
 
 # ----------------------------------------
 
+def get_interfaces(active_state) -> list:
+    """
+    Интерфейсы для выбора на панели. Веб-процесс не импортирует Scapy: список
+    берётся из статуса, опубликованного воркером, а до его запуска - у ОС.
+    """
+    if active_state and active_state.worker_status_json:
+        try:
+            interfaces = json.loads(active_state.worker_status_json).get('interfaces')
+            if interfaces:
+                return interfaces
+        except json.JSONDecodeError:
+            pass
+    try:
+        return [name for _, name in socket.if_nameindex()]
+    except (AttributeError, OSError):
+        return []
+
+
 # --- Маршруты ---
 @app.route('/')
 def home():
@@ -85,47 +198,111 @@ def home():
 @app.route('/dashboard')
 @login_required  # <-- ЗАЩИЩАЕМ МАРШРУТ
 def dashboard():
-    interfaces = get_if_list()
     user_models = current_user.models.order_by(Model.timestamp.desc()).all()
     active_state = current_user.active_state or ActiveState(user_id=current_user.id)
-    return render_template('dashboard.html', interfaces=interfaces, models=user_models, active_state=active_state)
+    interfaces = get_interfaces(active_state)
+    return render_template('dashboard.html', interfaces=interfaces, models=user_models, active_state=active_state,
+                           selected_interfaces=parse_interface_spec(active_state.interface), time_window=TIME_WINDOW)
 
 
 @app.route('/statistics')
 @login_required  # <-- ЗАЩИЩАЕМ МАРШРУТ
 def statistics():
     period = request.args.get('period', 'hour')
-    now = datetime.utcnow()
-    if period == 'day':
-        start_time = now - timedelta(days=1);
-        title = "за последние 24 часа"
-    else:
-        start_time = now - timedelta(hours=1);
-        title = "за последний час"
-
-    stats_query = db.session.query(
-        TrafficLog.local_ip,
-        func.sum(TrafficLog.total_bytes).label('total_bytes'),
-        func.group_concat(TrafficLog.protocols).label('protocols'),
-        func.group_concat(TrafficLog.domains).label('domains')
+    if period not in STATISTICS_PERIODS: period = 'hour'
+    depth, rollup, title = STATISTICS_PERIODS[period]
+    start_bucket = bucket_start(datetime.utcnow() - depth, 'minute' if rollup is TrafficRollupMinute else 'hour')
+
+    # Только агрегаты: число строк зависит от длины периода, а не от объёма истории
+    stats_query = read_session.query(
+        rollup.local_ip,
+        func.sum(rollup.total_bytes).label('total_bytes'),
+        func.group_concat(rollup.protocols).label('protocols')
     ).filter(
-        TrafficLog.user_id == current_user.id,  # <-- Используем ID текущего пользователя
-        TrafficLog.timestamp >= start_time
-    ).group_by(TrafficLog.local_ip).order_by(func.sum(TrafficLog.total_bytes).desc())
+        rollup.user_id == current_user.id,  # <-- Используем ID текущего пользователя
+        rollup.bucket >= start_bucket
+    ).group_by(rollup.local_ip).order_by(func.sum(rollup.total_bytes).desc())
+
+    # Домены - из часового индекса (для периода "час" это последние 1-2 часа)
+    top_domains = {}
+    for row in domain_hits_query(bucket_start(datetime.utcnow() - depth, 'hour')).order_by(
+            DeviceDomainHour.local_ip, func.sum(DeviceDomainHour.hits).desc()):
+        top_domains.setdefault(row.local_ip, []).append(row.name)
 
     aggregated_stats = []
     for row in stats_query.all():
         all_protocols = sorted(list(set(filter(None, (row.protocols or '').split(',')))))
-        all_domains = sorted(list(set(filter(None, (row.domains or '').split(',')))))
         aggregated_stats.append({
             'local_ip': row.local_ip,
             'total_mbytes': round(row.total_bytes / (1024 * 1024), 2) if row.total_bytes else 0,
             'protocols': ', '.join(all_protocols),
-            'domains': all_domains[:15]
+            'domains': top_domains.get(row.local_ip, [])[:15]
         })
     return render_template('statistics.html', stats=aggregated_stats, title=title, active_period=period)
 
 
+def domain_hits_query(start_bucket, *filters):
+    """(local_ip, домен, пакеты, байты, последний час) текущего пользователя начиная с start_bucket."""
+    return read_session.query(
+        DeviceDomainHour.local_ip, Domain.name,
+        func.sum(DeviceDomainHour.hits).label('hits'),
+        func.sum(DeviceDomainHour.total_bytes).label('total_bytes'),
+        func.max(DeviceDomainHour.bucket).label('last_seen')
+    ).join(Domain, Domain.id == DeviceDomainHour.domain_id).filter(
+        DeviceDomainHour.user_id == current_user.id,
+        DeviceDomainHour.bucket >= start_bucket,
+        *filters
+    ).group_by(DeviceDomainHour.local_ip, DeviceDomainHour.domain_id)
+
+
+def _period_start_bucket():
+    depth = STATISTICS_PERIODS.get(request.args.get('period', 'day'), STATISTICS_PERIODS['day'])[0]
+    return bucket_start(datetime.utcnow() - depth, 'hour')
+
+
+def _domain_hit_json(row, key):
+    return {key: getattr(row, key), 'hits': int(row.hits), 'total_bytes': int(row.total_bytes),
+            'last_seen': str(row.last_seen)}
+
+
+# --- Запросы к индексу доменов ---
+@app.route('/domains/<path:domain>/devices')
+@login_required
+def domain_devices(domain):
+    """Какие устройства обращались к домену за период (?period=hour|day|week|month)."""
+    domain_row = read_session.query(Domain).filter_by(name=domain.strip('.')).first()
+    if not domain_row:
+        return jsonify({"domain": domain, "devices": []})
+    rows = domain_hits_query(_period_start_bucket(), DeviceDomainHour.domain_id == domain_row.id).order_by(
+        func.sum(DeviceDomainHour.total_bytes).desc()).all()
+    return jsonify({"domain": domain_row.name, "devices": [_domain_hit_json(row, 'local_ip') for row in rows]})
+
+
+@app.route('/devices/<local_ip>/domains')
+@login_required
+def device_domains(local_ip):
+    """Топ доменов устройства за период по числу пакетов (?period=...&limit=N)."""
+    limit = min(request.args.get('limit', 20, type=int), 500)
+    rows = domain_hits_query(_period_start_bucket(), DeviceDomainHour.local_ip == local_ip).order_by(
+        func.sum(DeviceDomainHour.hits).desc()).limit(limit).all()
+    return jsonify({"local_ip": local_ip, "domains": [_domain_hit_json(row, 'name') for row in rows]})
+
+
+@app.route('/scores')
+@login_required
+def scores():
+    """
+    История оценок окон для графика: ?start=&end= (секунды epoch) или ?minutes=N
+    (по умолчанию 60), ?points= - сколько точек вернуть, ?model_id= - только одна модель,
+    ?interface= - только один интерфейс.
+    """
+    end = request.args.get('end', type=float) or time.time()
+    start = request.args.get('start', type=float) or end - request.args.get('minutes', 60, type=float) * 60
+    points = min(max(request.args.get('points', 300, type=int), 1), 5000)
+    return jsonify(downsample_scores(read_session, ScoreRecord.__table__, current_user.id, start, end, points,
+                                     request.args.get('model_id', type=int), request.args.get('interface')))
+
+
 # --- API для управления (все защищены) ---
 @app.route('/create_model', methods=['POST'])
 @login_required
@@ -142,18 +319,37 @@ def create_model():
 @login_required
 def activate_model():
     data = request.get_json()
-    model_id = data.get('model_id')
+    try:
+        model_id = int(data.get('model_id'))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Неверный ID модели"}), 400
+    # interface - имя, строка 'eth0,eth1' или список; interface_models - {интерфейс: id модели} для
+    # интерфейсов, которые мониторит не выбранная модель, а своя
     iface = data.get('interface')
+    interfaces = parse_interface_spec(iface) if isinstance(iface, str) else dict.fromkeys(iface or [])
+    trained_ids = {model.id for model in current_user.models.filter(Model.model_path.isnot(None))}
+    overrides = data.get('interface_models') or {}
+    if not isinstance(overrides, dict):
+        return jsonify({"status": "error", "message": "interface_models - не словарь {интерфейс: ID модели}"}), 400
+    for name, override_id in overrides.items():
+        if name not in interfaces or override_id is None:
+            continue
+        try:
+            override_id = int(override_id)
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": f"Неверный ID модели для интерфейса {name}"}), 400
+        if override_id in trained_ids:
+            interfaces[name] = override_id
 
     current_user.models.update({Model.is_active: False})
 
-    target_model = db.session.get(Model, int(model_id))
+    target_model = db.session.get(Model, model_id)
     if target_model and target_model.user_id == current_user.id and target_model.model_path:
         target_model.is_active = True
         active_state = current_user.active_state or ActiveState(user_id=current_user.id)
         active_state.is_monitoring = True
-        active_state.active_model_id = int(model_id)
-        active_state.interface = iface
+        active_state.active_model_id = model_id
+        active_state.interface = format_interface_spec(interfaces) or None
         db.session.add(active_state)
         db.session.commit()
         return jsonify({"status": "ok"})
@@ -217,15 +413,65 @@ def rename_model():
 @app.route('/status')
 @login_required
 def status():
-    state = current_user.active_state
-    if state and state.worker_status_json:
+    worker_status_json = read_session.query(ActiveState.worker_status_json).filter_by(
+        user_id=current_user.id).scalar()
+    if worker_status_json:
         try:
-            return jsonify(json.loads(state.worker_status_json))
+            return jsonify(json.loads(worker_status_json))
         except json.JSONDecodeError:
             pass
     return jsonify({"mode": "Воркер не запущен", "log": ["Запустите воркер с вашим ID пользователя."]})
 
 
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster() -> StatusBroadcaster:
+    """Поток рассылки событий запускается при первом подключении к /status/stream."""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = StatusBroadcaster(db.engine.url.database, WorkerEvent.__tablename__)
+            _broadcaster.start()
+        return _broadcaster
+
+
+@app.route('/status/stream')
+@login_required
+def status_stream():
+    """
+    Server-Sent Events: при подключении - полный статус (snapshot), дальше - только
+    новые события воркера (window, log, state). При переподключении браузер
+    присылает Last-Event-ID и получает пропущенные события вместо повторного snapshot.
+    """
+    user_id = current_user.id
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    broadcaster = get_broadcaster()
+    subscriber = broadcaster.subscribe(user_id, last_event_id)
+    snapshot = None
+    if last_event_id is None:
+        worker_status_json = read_session.query(ActiveState.worker_status_json).filter_by(user_id=user_id).scalar()
+        snapshot = json.loads(worker_status_json) if worker_status_json else {"mode": "Воркер не запущен", "log": []}
+
+    def stream():
+        try:
+            if snapshot is not None:
+                yield format_sse('snapshot', snapshot, broadcaster.last_id)
+            while True:
+                try:
+                    event = subscriber.get(timeout=STATUS_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"  # Держит соединение открытым через прокси
+                    continue
+                yield format_sse(event["kind"], event["data"], event["id"])
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 # --- МАРШРУТЫ АУТЕНТИФИКАЦИИ ---
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -266,6 +512,76 @@ def logout():
     return redirect(url_for('home'))
 
 
+# --- Команды обслуживания (flask --app app <команда>) ---
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Пересчитывает минутные и часовые агрегаты статистики из сырого TrafficLog."""
+    db.create_all()
+    processed = rebuild_rollups(db.session, TrafficLog.__table__, ROLLUP_TABLES)
+    print(f"[ROLLUP] Агрегаты пересчитаны по {processed} строкам TrafficLog.")
+
+
+@app.cli.command('enable-incremental-vacuum')
+def enable_incremental_vacuum_command():
+    """
+    Однократно включает auto_vacuum=INCREMENTAL. Полный VACUUM блокирует запись до окончания
+    и требует около двойного размера базы на диске - запускать при остановленном воркере.
+    """
+    import sqlite3
+    from retention import enable_incremental_vacuum
+
+    connection = sqlite3.connect(db.engine.url.database, timeout=30.0)
+    try:
+        if enable_incremental_vacuum(connection):
+            print("[RETENTION] auto_vacuum=INCREMENTAL включён (выполнен полный VACUUM).")
+        else:
+            print("[RETENTION] auto_vacuum=INCREMENTAL уже включён.")
+    finally:
+        connection.close()
+
+
+@app.cli.command('migrate-domains')
+def migrate_domains_command():
+    """Переносит домены из старой колонки TrafficLog.domains в индекс доменов."""
+    db.create_all()
+    migrated = migrate_domain_blobs(db.session, TrafficLog.__table__, *DOMAIN_TABLES)
+    print(f"[DOMAINS] Перенесено строк TrafficLog: {migrated}.")
+
+
+@app.cli.command('rescore')
+@click.argument('model_id', type=int)
+@click.option('--hours', default=24.0, help="Сколько последних часов истории переоценить.")
+@click.option('--interface', default=None, help="Только окна одного интерфейса.")
+def rescore_command(model_id, hours, interface):
+    """Переоценивает сохранённые окна моделью MODEL_ID (бэктест без повторного захвата)."""
+    from ml_model import create_detector
+    from adaptive_threshold import AdaptiveThreshold
+
+    model = db.session.get(Model, model_id)
+    if not model or not model.model_path:
+        print(f"[RESCORE] Модель {model_id} не найдена или не обучена.")
+        return
+    detector = create_detector(model.model_type)
+    if not detector.load_model(model.model_path, f"{model.model_path}_scaler.joblib"):
+        print(f"[RESCORE] Не удалось загрузить файлы модели {model_id}.")
+        return
+
+    end = time.time()
+    history = load_scores(db.session, ScoreRecord.__table__, model.user_id, end - hours * 3600, end,
+                          interface=interface)
+    if not len(history["ts"]):
+        print("[RESCORE] За этот период окон нет.")
+        return
+    new_scores = detector.predict_batch(history["features"])
+    new_alerts = new_scores > detector.initial_threshold if model.model_type == 'tensorflow' else \
+        new_scores < detector.initial_threshold
+    adaptive = AdaptiveThreshold.for_model(model.model_type, detector.initial_threshold)
+    adaptive_alerts = sum(adaptive.update(score) for score in new_scores)
+    print(f"[RESCORE] Окон: {len(new_scores)}, аномалий было: {int(history['is_anomaly'].sum())}, "
+          f"стало бы с моделью '{model.name}': {int(new_alerts.sum())} (порог {detector.initial_threshold:.4f}), "
+          f"с адаптивным порогом: {adaptive_alerts}")
+
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -0,0 +1,139 @@
+# bench_db.py (Задержка /status и /statistics под интенсивной записью воркера)
+#
+# Запуск: python bench_db.py [--seconds 10] [--readers 4] [--write-interval 0.05]
+# Для каждого режима (настройки SQLite по умолчанию и WAL + PRAGMA из db_setup.py)
+# создаётся временная база; отдельный процесс в роли воркера непрерывно пишет
+# TrafficLog с агрегатами и статус, а потоки веб-панели опрашивают /status и
+# /statistics. Печатаются задержки запросов и число ошибок "database is locked".
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+
+
+def run_writer(seconds: float, write_interval: float):
+    """Процесс-воркер: сброс статистики 200 устройств и обновление статуса каждые write_interval с."""
+    os.environ['MLIDS_DB_ROLE'] = 'worker'
+    from app import app, db, TrafficLog, ROLLUP_TABLES, DOMAIN_TABLES
+    from traffic_store import DeviceStatsAccumulator
+    from worker import write_worker_status
+    from db_watch import DataVersionWatcher
+
+    accumulator = DeviceStatsAccumulator(flush_interval=0)
+    writes, errors, deadline = 0, 0, time.monotonic() + seconds
+    with app.app_context():
+        status_connection = DataVersionWatcher(db.engine.url.database).connection
+        while time.monotonic() < deadline:
+            accumulator.add({f"192.168.1.{i}": {"bytes": random.randint(100, 10000), "packets": 10,
+                                                "protocols": {"TCP", "UDP"},
+                                                "domains": {f"site{random.randint(0, 300)}.com": {"hits": 3, "bytes": 500}}}
+                             for i in range(200)})
+            try:
+                accumulator.flush(db.session, TrafficLog.__table__, 1, ROLLUP_TABLES, DOMAIN_TABLES)
+                write_worker_status(status_connection, json.dumps({"mode": "bench", "writes": writes}))
+                writes += 1
+            except Exception as e:
+                db.session.rollback()
+                errors += 1
+                print(f"[BENCH] Ошибка записи: {e}", file=sys.stderr)
+            time.sleep(write_interval)
+    print(json.dumps({"writes": writes, "errors": errors}))
+
+
+def run_readers(seconds: float, readers: int):
+    """Процесс веб-панели: readers потоков поочерёдно запрашивают /status и /statistics."""
+    from app import app
+
+    latencies = {'/status': [], '/statistics?period=hour': []}
+    errors = []
+    deadline = time.monotonic() + seconds
+
+    def reader():
+        client = app.test_client()
+        client.post('/login', data={'email': 'bench@local', 'password': 'bench'})
+        while time.monotonic() < deadline:
+            for url, samples in latencies.items():
+                started = time.perf_counter()
+                try:
+                    response = client.get(url)
+                    if response.status_code != 200:
+                        errors.append(f"{url}: HTTP {response.status_code}")
+                except Exception as e:
+                    errors.append(f"{url}: {e}")
+                samples.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    print(json.dumps({"latencies": latencies, "errors": errors}))
+
+
+def prepare_database():
+    from werkzeug.security import generate_password_hash
+    from app import app, db, User, ActiveState
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@local', password_hash=generate_password_hash('bench'))
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(ActiveState(id=1, user_id=user.id))
+        db.session.commit()
+
+
+def run_mode(tuned: bool, args) -> dict:
+    directory = tempfile.mkdtemp(prefix='mlids_bench_')
+    env = dict(os.environ, MLIDS_SQLITE_TUNING='1' if tuned else '0',
+               MLIDS_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'bench.db')}")
+    base = [sys.executable, os.path.abspath(__file__)]
+    subprocess.run(base + ['--role', 'prepare'], env=env, check=True)
+
+    writer = subprocess.Popen(base + ['--role', 'writer', '--seconds', str(args.seconds),
+                                      '--write-interval', str(args.write_interval)],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    readers = subprocess.run(base + ['--role', 'readers', '--seconds', str(args.seconds),
+                                     '--readers', str(args.readers)],
+                             env=env, capture_output=True, text=True)
+    writer_out, writer_err = writer.communicate()
+    return {"writer": json.loads(writer_out.strip().splitlines()[-1]),
+            "readers": json.loads(readers.stdout.strip().splitlines()[-1]),
+            "lock_errors": (writer_err + readers.stderr).count('database is locked')}
+
+
+def report(name: str, result: dict, seconds: float):
+    print(f"\n[BENCH] {name}: записей воркера {result['writer']['writes']} "
+          f"({result['writer']['writes'] / seconds:.1f}/с), ошибок записи {result['writer']['errors']}, "
+          f"ошибок чтения {len(result['readers']['errors'])}, 'database is locked': {result['lock_errors']}")
+    for url, samples in result['readers']['latencies'].items():
+        if not samples:
+            continue
+        ms = np.array(samples) * 1000
+        print(f"  {url:<26} n={len(ms):<5} p50={np.percentile(ms, 50):7.1f} мс  "
+              f"p95={np.percentile(ms, 95):7.1f} мс  max={ms.max():7.1f} мс")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Нагрузочный тест SQLite: веб-панель против записи воркера.")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--write-interval', type=float, default=0.05)
+    parser.add_argument('--role', choices=('prepare', 'writer', 'readers'), default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'prepare':
+        prepare_database()
+    elif args.role == 'writer':
+        run_writer(args.seconds, args.write_interval)
+    elif args.role == 'readers':
+        run_readers(args.seconds, args.readers)
+    else:
+        for name, tuned in (("SQLite по умолчанию", False), ("WAL + PRAGMA (db_setup.py)", True)):
+            report(name, run_mode(tuned, args), args.seconds)
@@ -0,0 +1,94 @@
+# bench_pipeline.py (Пропускная способность обработки окон: в воркере против конвейера из N процессов)
+#
+# Запуск: python bench_pipeline.py [--windows 60] [--packets 10000] [--max-workers 4] [--no-model]
+# Синтетические окна (PacketBatch) проходят тот же путь, что и в воркере: статистика
+# устройств, признаки и оценка Isolation Forest. Режим 0 - всё в одном процессе, как
+# при PIPELINE_WORKERS = 0; режимы 1..N - конвейер pipeline.py. Печатаются пакеты/с
+# и проверяется, что векторы признаков и оценки совпадают с режимом 0.
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from config import NUM_FEATURES
+from data_structures import PacketBatch, PROTO_TCP, PROTO_UDP
+from pipeline import ProcessingPipeline, process_window
+
+
+def make_window(packets: int, rng: random.Random) -> PacketBatch:
+    """Окно в духе домашней сети: 30 локальных устройств, 2000 внешних адресов, 200 доменов."""
+    batch = PacketBatch(packets)
+    start = time.time()
+    for i in range(packets):
+        local = 0xC0A80100 + rng.randint(1, 30)
+        remote = rng.randint(0x01000000, 0x01000000 + 2000)
+        outgoing = rng.random() < 0.5
+        protocol = PROTO_TCP if rng.random() < 0.8 else PROTO_UDP
+        batch.append(start + i * 5.0 / packets, local if outgoing else remote, remote if outgoing else local,
+                     rng.randint(1024, 65535), rng.choice((443, 80, 53, 22, rng.randint(1, 65535))),
+                     rng.randint(60, 1500), rng.choice((0x02, 0x10, 0x18, 0x12)) if protocol == PROTO_TCP else 0,
+                     protocol, f"site{rng.randint(0, 200)}.com" if rng.random() < 0.3 else None)
+    return batch
+
+
+def prepare_model(directory: str) -> tuple:
+    from ml_model import create_detector
+
+    model_path = os.path.join(directory, 'bench_iforest')
+    detector = create_detector('isolation_forest')
+    detector.train_and_save_model(np.random.RandomState(0).rand(500, NUM_FEATURES), model_path,
+                                  f"{model_path}_scaler.joblib")
+    detector.load_model(model_path, f"{model_path}_scaler.joblib")
+    return (1, 'isolation_forest', model_path), detector
+
+
+def run_inline(windows: list, window_end: datetime, detector) -> tuple:
+    started = time.perf_counter()
+    results = [process_window(batch, window_end, detector) for batch in windows]
+    return time.perf_counter() - started, results
+
+
+def run_pipeline(windows: list, window_end: datetime, model, workers: int) -> tuple:
+    pipeline = ProcessingPipeline(workers, capacity=max(len(batch) for batch in windows))
+    try:
+        # Прогрев: процессы запущены, модель загружена - в замер идёт только обработка окон
+        pipeline.process([(windows[0], window_end, model, True)] * workers)
+        started = time.perf_counter()
+        results = pipeline.process([(batch, window_end, model, True) for batch in windows])
+        return time.perf_counter() - started, results
+    finally:
+        pipeline.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Пакеты/с при обработке окон в 1..N процессах конвейера.")
+    parser.add_argument('--windows', type=int, default=60)
+    parser.add_argument('--packets', type=int, default=10000, help="Пакетов в окне")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-model', action='store_true', help="Только признаки и статистика, без оценки")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    windows = [make_window(args.packets, rng) for _ in range(args.windows)]
+    total = sum(len(batch) for batch in windows)
+    window_end = datetime.now()
+    model, detector = prepare_model(tempfile.mkdtemp(prefix='mlids_pipeline_')) if not args.no_model else (None, None)
+    print(f"[BENCH] Окон: {args.windows} по {args.packets} пакетов, ядер: {os.cpu_count()}, "
+          f"оценка: {'нет' if args.no_model else 'Isolation Forest'}")
+
+    elapsed, reference = run_inline(windows, window_end, detector)
+    baseline = total / elapsed
+    print(f"[BENCH] без конвейера: {total / elapsed:12,.0f} пакетов/с")
+    for workers in range(1, args.max_workers + 1):
+        elapsed, results = run_pipeline(windows, window_end, model, workers)
+        same = all(np.allclose(a.features, b.features) and a.device_stats == b.device_stats and
+                   (a.score is None or np.isclose(a.score, b.score)) and
+                   (a.group_scores is None or np.allclose(a.group_scores, b.group_scores))
+                   for a, b in zip(reference, results))
+        print(f"[BENCH] процессов {workers:>2}:  {total / elapsed:12,.0f} пакетов/с "
+              f"(x{total / elapsed / baseline:.2f}), результаты совпадают: {'да' if same else 'НЕТ'}")
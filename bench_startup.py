@@ -0,0 +1,39 @@
+# bench_startup.py (Замер холодного времени импорта основных модулей)
+#
+# Запуск: python bench_startup.py
+# Каждый модуль импортируется в отдельном чистом интерпретаторе, поэтому время
+# включает все зависимости; заодно видно, подтянулись ли TensorFlow и Scapy.
+
+import subprocess
+import sys
+
+MODULES = ('app', 'worker', 'ml_model')
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed, 'tensorflow' in sys.modules, 'scapy' in sys.modules, 'sklearn' in sys.modules)
+"""
+
+
+def measure(module: str):
+    result = subprocess.run([sys.executable, '-c', PROBE.format(module=module)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    elapsed, has_tf, has_scapy, has_sklearn = result.stdout.strip().splitlines()[-1].split()
+    return float(elapsed), has_tf == 'True', has_scapy == 'True', has_sklearn == 'True'
+
+
+if __name__ == '__main__':
+    print(f"{'Модуль':<10} {'Импорт, с':>10}  TensorFlow  Scapy  sklearn")
+    for module in MODULES:
+        measurement = measure(module)
+        if measurement is None:
+            print(f"{module:<10} {'ошибка':>10}")
+            continue
+        elapsed, has_tf, has_scapy, has_sklearn = measurement
+        print(f"{module:<10} {elapsed:>10.2f}  {'да' if has_tf else 'нет':<10}  {'да' if has_scapy else 'нет':<5}  "
+              f"{'да' if has_sklearn else 'нет'}")
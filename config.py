@@ -3,15 +3,59 @@ import os
 
 # --- Основные настройки ---
 TIME_WINDOW = 5             # Окно агрегации трафика в секундах (T)
+WINDOW_HOP = None           # Шаг окна (с): None - окна TIME_WINDOW подряд по часам воркера; 0.5 - каждые 0.5 с
+                            # оцениваются последние TIME_WINDOW с по меткам пакетов (кратно шагу);
+                            # с FEATURE_GROUPING не сочетается - воркер откажется запускаться
+WINDOW_ALIGNMENT = 0.0      # Смещение границ шагов от начала эпохи (с): границы в ALIGNMENT + k * HOP
+WINDOW_LATENESS = 0.2       # Сколько после конца шага ждать опоздавшие пакеты, прежде чем закрыть его (с)
 BPF_FILTER = "ip"           # Фильтр для Scapy, ловим весь IP-трафик
 TRAIN_DURATION_MINUTES = 2  # Время обучения в минутах (для ML-панели)
+TRAIN_PCAP_FILE = None      # Путь к .pcap/.pcapng: обучение на записи вместо живого захвата
+TRAINING_WORKERS = 2        # Сколько моделей может обучаться одновременно (процессы, не мешают мониторингу)
+TRAFFIC_FLUSH_INTERVAL = 60 # Раз в сколько секунд накопленная статистика устройств пишется в TrafficLog
+INTERFACE_REFRESH_INTERVAL = 300 # Как часто воркер перечитывает список сетевых интерфейсов ОС (с)
+CONTROL_POLL_INTERVAL = 0.2 # Как часто воркер проверяет PRAGMA data_version (команды из веб-панели)
+STATUS_STREAM_POLL_INTERVAL = 0.25 # Как часто веб-процесс проверяет новые события воркера для /status/stream
+STATUS_STREAM_HEARTBEAT = 15       # Пустой комментарий в поток SSE, если событий нет (с)
+
+# --- Настройки SQLite ---
+SQLITE_CACHE_SIZE_KB = 32768    # Кэш страниц на соединение (PRAGMA cache_size)
+SQLITE_BUSY_TIMEOUT_MS = 5000   # Сколько ждать чужую блокировку записи вместо "database is locked"
+
+# --- Настройки буфера захвата ---
+CAPTURE_BUFFER_SIZE = 10000             # Сколько пакетов одного окна хранится для расчёта признаков
+CAPTURE_OVERFLOW_POLICY = 'drop_oldest' # drop_oldest | drop_newest | sample
+CAPTURE_MODE = 'scapy'                  # scapy - полный разбор Scapy | raw - быстрый разбор заголовков struct'ом
+PIPELINE_WORKERS = 0                    # >0: признаки, статистика и оценка окон - в стольких процессах (pipeline.py)
+PIPELINE_RESULT_TIMEOUT = 30            # Сколько ждать результат окна от процесса конвейера (с)
+DNS_CACHE_SIZE = 20000                  # Сколько адресов (A/AAAA) хранит кэш DNS снифера; лишние вытесняются по LRU
+DNS_CACHE_NAMES_PER_IP = 4              # Сколько имён хранится для одного адреса (CDN, общий хостинг)
+DNS_CACHE_MIN_TTL = 300                 # Нижняя граница TTL ответа (с): соединения живут дольше коротких TTL CDN
+DNS_CACHE_MAX_TTL = 86400               # Верхняя граница TTL ответа (с)
+
+# --- Локальная сеть (какие адреса считаются устройствами) ---
+# По умолчанию IPv4 - те же диапазоны, что у ipaddress.is_private (RFC 1918, loopback, link-local и служебные),
+# IPv6 - loopback, ULA и link-local
+LOCAL_NETWORKS = ['0.0.0.0/8', '10.0.0.0/8', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/29',
+                  '192.0.0.170/31', '192.0.2.0/24', '192.168.0.0/16', '198.18.0.0/15', '198.51.100.0/24',
+                  '203.0.113.0/24', '240.0.0.0/4', '255.255.255.255/32', '::1/128', 'fc00::/7', 'fe80::/10']
+LOCAL_NETWORKS_EXTRA = []               # Свои публичные префиксы, например ['203.0.114.0/24']
+LOCAL_NETWORKS_EXCLUDE = []             # Исключения из локальных, например шлюз провайдера ['10.0.0.1/32']
+LOCAL_IP_CACHE_SIZE = 65536             # Кэш проверки отдельных адресов (LocalNetworks.is_local)
 
 # --- Настройки ML-моделей ---
 MODEL_DIR = "models"
+# Модель настольной версии (main.py): базовое имя файлов, как у моделей веб-панели
+MODEL_PATH = os.path.join(MODEL_DIR, "desktop_isolation_forest")
+SCALER_PATH = f"{MODEL_PATH}_scaler.joblib"
+INITIAL_THRESHOLD_PATH = f"{MODEL_PATH}_threshold.joblib"
 NUM_FEATURES = 13
 CONTAMINATION = 0.035 # Для Isolation Forest
 # --- ВОЗВРАЩАЕМ НЕДОСТАЮЩУЮ НАСТРОЙКУ ---
 BURST_WINDOW_SECONDS = 0.1 # Временное окно для расчета "Burst_Rate"
+FEATURE_GROUPING = None    # None - один вектор на окно | 'host' - строка на локальный узел | 'flow' - на поток
+MONITOR_TOP_GROUPS = 5     # Сколько худших узлов/потоков окна показывать в статусе и журнале
+STREAMING_FEATURES = False # Признаки окна считаются на каждом пакете в потоке захвата (WindowAccumulator), а не по снимку окна
 # ----------------------------------------
 
 # --- Настройки TensorFlow Автоэнкодера ---
@@ -19,9 +63,24 @@ NN_EPOCHS = 100
 NN_LEARNING_RATE = 0.001
 NN_BATCH_SIZE = 32
 NN_HIDDEN_LAYER_SIZE = 6
+TF_INFERENCE_BACKEND = 'numpy'  # numpy | tf_function | keras - как считать ошибку восстановления при мониторинге
 
 # --- Настройки АДАПТИВНОГО ПОРОГА ---
 SCORE_HISTORY_SIZE = 300
 ADAPTIVE_THRESHOLD_PERCENTILE_IF = 2.0  # Для Isolation Forest (ищем низкие значения)
 ADAPTIVE_THRESHOLD_PERCENTILE_TF = 98.0 # Для TensorFlow (ищем высокие значения)
+ADAPTIVE_THRESHOLD_MIN_SAMPLES = 30     # Сколько безопасных оценок нужно, прежде чем порог начнёт сдвигаться
+
 
+# --- Хранение истории (retention) ---
+RETENTION_RAW_HOURS = 48            # Сырые строки TrafficLog; старше - остаются только в агрегатах
+RETENTION_MINUTE_ROLLUP_DAYS = 7    # Минутные агрегаты (дальше - часовые)
+RETENTION_HOUR_ROLLUP_DAYS = 365    # Часовые агрегаты
+RETENTION_DOMAIN_DAYS = 90          # Индекс доменов DeviceDomainHour
+RETENTION_SCORE_DAYS = 30           # История оценок окон ScoreRecord (графики и переоценка)
+RETENTION_EVENT_HOURS = 1           # События воркера для /status/stream (нужны только для переподключения)
+RETENTION_INTERVAL = 600            # Как часто (с) запускается очистка
+RETENTION_BATCH_SIZE = 2000         # Строк в одной транзакции DELETE: воркер не ждёт дольше одной пачки
+RETENTION_BATCH_PAUSE = 0.05        # Пауза между пачками (с), чтобы коммиты воркера проходили без очереди
+VACUUM_INTERVAL_HOURS = 24          # Как часто возвращать свободные страницы файлу (incremental_vacuum)
+VACUUM_PAGES = 5000                 # Страниц за один incremental_vacuum
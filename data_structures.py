@@ -1,9 +1,47 @@
 # data_structures.py (ИСПРАВЛЕННАЯ ВЕРСИЯ 3.0)
 
+import random
+import socket
+import time
 from datetime import datetime
 from typing import Optional, List, Dict
 import numpy as np  # <-- Добавляем импорт numpy
 
+# --- Коды протоколов и TCP-флагов для колоночного хранения ---
+PROTO_TCP = 6
+PROTO_UDP = 17
+PROTO_OTHER = 255  # Протокол, для которого неизвестен номер
+
+# Биты TCP-флагов совпадают с заголовком TCP (и с int(scapy TCP.flags))
+TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+_TCP_FLAG_NAMES = {'FIN': TCP_FIN, 'SYN': TCP_SYN, 'RST': TCP_RST, 'ACK': TCP_ACK}
+
+# Номер IP-протокола -> имя для статистики. Снифер дополняет таблицу
+# именами из Scapy по мере появления новых протоколов.
+PROTOCOL_NAMES: Dict[int, str] = {1: 'ICMP', 2: 'IGMP', PROTO_TCP: 'TCP', PROTO_UDP: 'UDP', 47: 'GRE',
+                                  50: 'ESP', 51: 'AH', 89: 'OSPF', 132: 'SCTP', PROTO_OTHER: 'OTHER'}
+
+
+def ip_to_int(ip: str) -> int:
+    """'192.168.1.10' -> 3232235786"""
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+
+def int_to_ip(value: int) -> str:
+    """3232235786 -> '192.168.1.10'"""
+    return socket.inet_ntoa(int(value).to_bytes(4, 'big'))
+
+
+def protocol_name(code: int) -> str:
+    return PROTOCOL_NAMES.get(int(code), 'OTHER')
+
+
+def protocol_code(name: str) -> int:
+    for code, known_name in PROTOCOL_NAMES.items():
+        if known_name == name:
+            return code
+    return PROTO_OTHER
+
 
 class PacketData:
     """
@@ -28,6 +66,296 @@ class PacketData:
         self.domain = domain
 
 
+def _column(name: str) -> property:
+    return property(lambda self: self._columns[name][:self.size])
+
+
+class PacketBatch:
+    """
+    Колоночное хранилище пакетов одного окна.
+    Каждое поле - отдельный NumPy-массив, который растёт удвоением,
+    поэтому на пакет не создаётся ни одного Python-объекта.
+    Домены интернируются: в колонке domain_id лежит индекс в self.domains (-1 - нет домена).
+    seen_packets/seen_bytes - точные итоги окна, даже если часть пакетов
+    не поместилась в буфер (dropped_packets).
+    stream - WindowAccumulator, который CaptureBuffer ведёт параллельно колонкам
+    (STREAMING_FEATURES); при закрытии окна его признаки остаются в stream_features.
+    """
+
+    COLUMNS = (
+        ('timestamp', np.float64),  # Секунды эпохи
+        ('src_ip', np.uint32),
+        ('dst_ip', np.uint32),
+        ('src_port', np.uint16),  # 0 для пакетов без портов
+        ('dst_port', np.uint16),
+        ('length', np.uint32),
+        ('tcp_flags', np.uint8),  # Битовая маска TCP_*
+        ('protocol', np.uint8),  # Номер IP-протокола
+        ('domain_id', np.int32),
+    )
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.seen_packets = 0
+        self.seen_bytes = 0
+        self.dropped_packets = 0
+        self.ring_head = 0  # Следующая перезаписываемая строка при политике drop_oldest
+        self._capacity = max(int(capacity), 1)
+        self._columns = {name: np.empty(self._capacity, dtype=dtype) for name, dtype in self.COLUMNS}
+        self.domains: List[str] = []
+        self._domain_ids: Dict[str, int] = {}
+        self.stream = None
+        self.stream_features: Optional[List[float]] = None
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray], domains: List[str], seen_packets: Optional[int] = None,
+                     seen_bytes: Optional[int] = None, dropped_packets: int = 0,
+                     stream_features: Optional[List[float]] = None) -> 'PacketBatch':
+        """Окно поверх готовых массивов без копирования (например, из общей памяти конвейера)."""
+        batch = cls.__new__(cls)
+        batch.size = len(columns['timestamp'])
+        batch._capacity = max(batch.size, 1)
+        batch._columns = columns
+        batch.seen_packets = batch.size if seen_packets is None else seen_packets
+        batch.seen_bytes = int(columns['length'].sum()) if seen_bytes is None else seen_bytes
+        batch.dropped_packets = dropped_packets
+        batch.ring_head = 0
+        batch.domains = list(domains)
+        batch._domain_ids = {domain: i for i, domain in enumerate(batch.domains)}
+        batch.stream = None
+        batch.stream_features = stream_features
+        return batch
+
+    timestamp = _column('timestamp')
+    src_ip = _column('src_ip')
+    dst_ip = _column('dst_ip')
+    src_port = _column('src_port')
+    dst_port = _column('dst_port')
+    length = _column('length')
+    tcp_flags = _column('tcp_flags')
+    protocol = _column('protocol')
+    domain_id = _column('domain_id')
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self):
+        self._capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(self._capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self._columns[name] = grown
+
+    def _domain_to_id(self, domain: Optional[str]) -> int:
+        if not domain:
+            return -1
+        domain_id = self._domain_ids.get(domain)
+        if domain_id is None:
+            domain_id = self._domain_ids[domain] = len(self.domains)
+            self.domains.append(domain)
+        return domain_id
+
+    def append(self, timestamp: float, src_ip: int, dst_ip: int, src_port: int, dst_port: int,
+               length: int, tcp_flags: int, protocol: int, domain: Optional[str]):
+        if self.size == self._capacity:
+            self._grow()
+        self.seen_packets += 1
+        self.seen_bytes += length
+        self.write(self.size, timestamp, src_ip, dst_ip, src_port, dst_port, length, tcp_flags, protocol, domain)
+        self.size += 1
+
+    def write(self, i: int, timestamp: float, src_ip: int, dst_ip: int, src_port: int, dst_port: int,
+              length: int, tcp_flags: int, protocol: int, domain: Optional[str]):
+        """Записывает пакет в строку i (используется и для перезаписи при переполнении)."""
+        columns = self._columns
+        columns['timestamp'][i] = timestamp
+        columns['src_ip'][i] = src_ip
+        columns['dst_ip'][i] = dst_ip
+        columns['src_port'][i] = src_port
+        columns['dst_port'][i] = dst_port
+        columns['length'][i] = length
+        columns['tcp_flags'][i] = tcp_flags
+        columns['protocol'][i] = protocol
+        columns['domain_id'][i] = self._domain_to_id(domain)
+
+    def count_dropped(self, length: int):
+        """Учитывает пакет, который не попал в колонки, в точных итогах окна."""
+        self.seen_packets += 1
+        self.seen_bytes += length
+        self.dropped_packets += 1
+
+    def rotate(self, start: int):
+        """Сдвигает строки так, чтобы строка start стала первой (порядок кольцевого буфера)."""
+        if start % max(self.size, 1):
+            for column in self._columns.values():
+                column[:self.size] = np.roll(column[:self.size], -start)
+
+    def clear(self):
+        self.size = 0
+        self.seen_packets = 0
+        self.seen_bytes = 0
+        self.dropped_packets = 0
+        self.ring_head = 0
+        self.domains = []
+        self._domain_ids = {}
+        self.stream_features = None
+        if self.stream is not None:
+            self.stream.reset()
+
+    def select(self, indices: np.ndarray) -> 'PacketBatch':
+        """Копия строк indices (итоги окна - только по ним, без отброшенных пакетов)."""
+        return PacketBatch.from_columns({name: column[:self.size][indices] for name, column in self._columns.items()},
+                                        self.domains)
+
+    @classmethod
+    def concat(cls, batches: List['PacketBatch']) -> 'PacketBatch':
+        """Склеивает окна в одно; домены объединяются, domain_id переводятся в общий список."""
+        if len(batches) == 1:
+            return batches[0]
+        merged = cls(capacity=sum(len(batch) for batch in batches))
+        for batch in batches:
+            remap = np.array([merged._domain_to_id(domain) for domain in batch.domains] + [-1], dtype=np.int32)
+            start, end = merged.size, merged.size + len(batch)
+            for name, column in batch._columns.items():
+                merged._columns[name][start:end] = column[:len(batch)]
+            merged._columns['domain_id'][start:end] = remap[batch.domain_id]
+            merged.size = end
+            merged.seen_packets += batch.seen_packets
+            merged.seen_bytes += batch.seen_bytes
+            merged.dropped_packets += batch.dropped_packets
+        return merged
+
+    # --- Адаптеры для кода, работающего с PacketData ---
+    @classmethod
+    def from_packets(cls, packets: List[PacketData]) -> 'PacketBatch':
+        batch = cls(capacity=len(packets))
+        for pkt in packets:
+            if pkt.is_tcp:
+                proto = PROTO_TCP
+            elif pkt.is_udp:
+                proto = PROTO_UDP
+            else:
+                proto = protocol_code(pkt.protocol)
+            flags = 0
+            for flag_name, bit in _TCP_FLAG_NAMES.items():
+                if pkt.tcp_flags.get(flag_name, False):
+                    flags |= bit
+            batch.append(pkt.timestamp.timestamp(), ip_to_int(pkt.src_ip), ip_to_int(pkt.dst_ip),
+                         pkt.src_port or 0, pkt.dst_port or 0, pkt.length, flags, proto, pkt.domain)
+        return batch
+
+    def to_packets(self) -> List[PacketData]:
+        packets = []
+        for i in range(self.size):
+            proto = int(self.protocol[i])
+            is_tcp, is_udp = proto == PROTO_TCP, proto == PROTO_UDP
+            flags = int(self.tcp_flags[i])
+            domain_id = int(self.domain_id[i])
+            packets.append(PacketData(
+                timestamp=datetime.fromtimestamp(self.timestamp[i]),
+                src_ip=int_to_ip(self.src_ip[i]), dst_ip=int_to_ip(self.dst_ip[i]),
+                src_port=int(self.src_port[i]) if is_tcp or is_udp else None,
+                dst_port=int(self.dst_port[i]) if is_tcp or is_udp else None,
+                length=int(self.length[i]), is_tcp=is_tcp, is_udp=is_udp,
+                tcp_flags={name: bool(flags & bit) for name, bit in _TCP_FLAG_NAMES.items()} if is_tcp else {},
+                protocol=protocol_name(proto),
+                domain=self.domains[domain_id] if domain_id >= 0 else None
+            ))
+        return packets
+
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'sample')
+
+
+class CaptureBuffer:
+    """
+    Двойной буфер захвата: поток снифера пишет в активный PacketBatch,
+    а читатель одной подменой ссылки забирает его целиком и ставит на место
+    заранее подготовленный пустой. Писатель не берёт блокировку на каждый пакет.
+
+    Политики переполнения (capacity пакетов на окно):
+      drop_oldest - кольцевой буфер, в окне остаются последние capacity пакетов;
+      drop_newest - лишние пакеты окна отбрасываются;
+      sample      - резервуарная выборка: capacity равномерно выбранных пакетов окна.
+    При любой политике seen_packets/seen_bytes у окна остаются точными.
+    streaming - у каждого окна свой WindowAccumulator: признаки считаются по всем
+    пакетам, включая не попавшие в колонки, и готовы сразу при подмене буфера.
+    """
+
+    def __init__(self, capacity: int, overflow_policy: str, streaming: bool = False):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow_policy}")
+        self.capacity = max(int(capacity), 1)
+        self.overflow_policy = overflow_policy
+        self.streaming = streaming
+        self._active = self._new_batch()
+        self._spare = self._new_batch()
+        self._rng = random.Random()
+        # Счётчики входов/выходов писателя: по ним читатель узнаёт,
+        # что пакет, начатый до подмены, дописан в старый буфер.
+        self._entered = 0
+        self._exited = 0
+        self.totals = {"seen": 0, "kept": 0, "dropped": 0}
+
+    def _new_batch(self) -> PacketBatch:
+        batch = PacketBatch(self.capacity)
+        if self.streaming:
+            from window_accumulator import WindowAccumulator
+
+            batch.stream = WindowAccumulator()
+        return batch
+
+    def append(self, timestamp: float, src_ip: int, dst_ip: int, src_port: int, dst_port: int,
+               length: int, tcp_flags: int, protocol: int, domain: Optional[str]):
+        """Вызывается только из потока захвата (один писатель)."""
+        self._entered += 1
+        try:
+            batch = self._active
+            if batch.stream is not None:
+                batch.stream.add(timestamp, src_ip, dst_ip, dst_port, length, tcp_flags, protocol)
+            if batch.size < self.capacity:
+                batch.append(timestamp, src_ip, dst_ip, src_port, dst_port, length, tcp_flags, protocol, domain)
+            elif self.overflow_policy == 'drop_newest':
+                batch.count_dropped(length)
+            elif self.overflow_policy == 'drop_oldest':
+                batch.write(batch.ring_head, timestamp, src_ip, dst_ip, src_port, dst_port, length, tcp_flags,
+                            protocol, domain)
+                batch.count_dropped(length)
+                batch.ring_head = (batch.ring_head + 1) % self.capacity
+            else:
+                batch.count_dropped(length)
+                slot = self._rng.randrange(batch.seen_packets)
+                if slot < self.capacity:
+                    batch.write(slot, timestamp, src_ip, dst_ip, src_port, dst_port, length, tcp_flags,
+                                protocol, domain)
+        finally:
+            # Даже если запись упала, читатель не должен ждать этот пакет вечно
+            self._exited += 1
+
+    def swap(self, timeout: float = 1.0) -> PacketBatch:
+        """
+        Забирает накопленное окно и подставляет пустой буфер (O(1), без копирования).
+        Пакет, который писатель начал до подмены, ждём не дольше timeout секунд:
+        если поток захвата завис, окно отдаётся без него.
+        """
+        full, self._active = self._active, self._spare
+        entered = self._entered
+        deadline = time.monotonic() + timeout
+        while self._exited < entered and time.monotonic() < deadline:
+            time.sleep(0)
+        if full.ring_head:
+            full.rotate(full.ring_head)
+            full.ring_head = 0
+        if full.stream is not None:
+            full.stream_features, full.stream = full.stream.features(), None
+        self._spare = self._new_batch()
+
+        self.totals["seen"] += full.seen_packets
+        self.totals["kept"] += full.size
+        self.totals["dropped"] += full.dropped_packets
+        return full
+
+
 class FeatureVector:
     """Хранит агрегированный вектор признаков."""
 
@@ -0,0 +1,70 @@
+# db_setup.py (Настройка SQLite: WAL, PRAGMA соединений, отдельные движки веба и воркера)
+
+import os
+import sqlite3
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from config import SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+
+# Роль процесса: web (по умолчанию) или worker. Воркер выставляет её до импорта app.
+DB_ROLE = os.environ.get('MLIDS_DB_ROLE', 'web')
+# MLIDS_SQLITE_TUNING=0 возвращает настройки SQLite по умолчанию (для сравнения в bench_db.py)
+SQLITE_TUNING = os.environ.get('MLIDS_SQLITE_TUNING', '1') != '0'
+
+
+def apply_pragmas(connection: sqlite3.Connection, readonly: bool = False):
+    """
+    WAL позволяет читателям не ждать писателя (и наоборот), synchronous=NORMAL в WAL
+    не теряет согласованность и убирает fsync на каждый commit, busy_timeout вместо
+    мгновенного "database is locked" ждёт освобождения блокировки.
+    """
+    if not SQLITE_TUNING:
+        return
+    cursor = connection.cursor()
+    if not readonly:
+        cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA cache_size = -{int(SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.close()
+
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_pragmas(dbapi_connection, readonly=getattr(dbapi_connection, 'mlids_readonly', False))
+
+
+def engine_options(role: str = DB_ROLE) -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS основного движка. У воркера это одно соединение-писатель
+    (pool_size=1): все его записи идут последовательно и не конкурируют между собой.
+    """
+    options = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    if role == 'worker' and SQLITE_TUNING:
+        options.update(pool_size=1, max_overflow=0)
+    return options
+
+
+class _ReadOnlyConnection(sqlite3.Connection):
+    mlids_readonly = True
+
+
+def create_readonly_session(db_path: str) -> scoped_session:
+    """
+    Сессия только для чтения для тяжёлых запросов веб-панели (/status, /statistics):
+    соединения открываются с mode=ro, поэтому никогда не берут блокировку записи.
+    Без настройки (MLIDS_SQLITE_TUNING=0) - обычные соединения, как раньше.
+    """
+    if SQLITE_TUNING:
+        url = f"sqlite:///file:{os.path.abspath(db_path)}?mode=ro&uri=true"
+        connect_args = {"factory": _ReadOnlyConnection, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        url = f"sqlite:///{os.path.abspath(db_path)}"
+        connect_args = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    engine = create_engine(url, connect_args=connect_args, pool_size=8, max_overflow=8)
+    return scoped_session(sessionmaker(bind=engine))
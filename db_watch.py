@@ -0,0 +1,48 @@
+# db_watch.py (Отслеживание изменений SQLite без опроса таблиц)
+
+import sqlite3
+import time
+from typing import Optional
+
+from config import CONTROL_POLL_INTERVAL
+from db_setup import apply_pragmas
+
+
+class DataVersionWatcher:
+    """
+    Следит за PRAGMA data_version на собственном соединении с базой.
+    Значение меняется, только когда базу изменило ДРУГОЕ соединение, поэтому
+    проверка стоит микросекунды и не читает ни одной таблицы: веб-приложение
+    делает commit - воркер узнаёт об этом за CONTROL_POLL_INTERVAL.
+
+    Записи, сделанные через self.connection, не будят самого наблюдателя.
+    """
+
+    def __init__(self, db_path: str, poll_interval: float = CONTROL_POLL_INTERVAL):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.connection = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+        apply_pragmas(self.connection)
+        self._version = self._read_version()
+
+    def _read_version(self) -> int:
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def has_changed(self) -> bool:
+        version = self._read_version()
+        changed, self._version = version != self._version, version
+        return changed
+
+    def wait_for_change(self, timeout: Optional[float]) -> bool:
+        """Ждёт изменения базы не дольше timeout секунд. True - база изменилась."""
+        deadline = None if timeout is None else time.monotonic() + max(timeout, 0.0)
+        while True:
+            if self.has_changed():
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,59 @@
+# device_stats.py (Устройства окна и их статистика по колонкам PacketBatch)
+#
+# Модуль-лист: только numpy, данные пакетов и классификатор локальной сети, поэтому
+# его импортируют и воркер, и feature_engineer, и процессы конвейера без SQLAlchemy.
+
+from typing import Optional
+
+import numpy as np
+
+from data_structures import PacketBatch, int_to_ip, protocol_name
+from local_networks import local_networks
+
+
+def device_column(batch: PacketBatch) -> tuple:
+    """
+    Устройство каждого пакета: src_ip, если он локальный, иначе dst_ip (если локальный).
+    Обе колонки адресов классифицируются таблицей диапазонов LocalNetworks за один searchsorted.
+    Возвращает (маска пакетов с устройством, IP устройства этих пакетов).
+    """
+    networks = local_networks()
+    src_local, dst_local = networks.classify(batch.src_ip), networks.classify(batch.dst_ip)
+    has_device = src_local | dst_local
+    return has_device, np.where(src_local, batch.src_ip, batch.dst_ip)[has_device]
+
+
+def collect_device_stats(batch: PacketBatch, devices: Optional[tuple] = None) -> dict:
+    """
+    Статистика по локальным устройствам за окно прямо по колонкам PacketBatch.
+    domains - {домен: {"hits": пакеты, "bytes": байты}} для пар устройство-домен.
+    devices - уже вычисленный device_column(batch), если он есть.
+    """
+    has_device, device_ips = devices if devices is not None else device_column(batch)
+    if not has_device.any():
+        return {}
+    devices, device_idx = np.unique(device_ips, return_inverse=True)
+    lengths = batch.length[has_device]
+
+    bytes_per_device = np.bincount(device_idx, weights=lengths, minlength=devices.size)
+    packets_per_device = np.bincount(device_idx, minlength=devices.size)
+    device_stats = {int_to_ip(ip): {"bytes": int(bytes_per_device[i]), "packets": int(packets_per_device[i]),
+                                    "protocols": set(), "domains": {}}
+                    for i, ip in enumerate(devices)}
+    ip_names = list(device_stats)
+
+    # Уникальные пары (устройство, протокол) и (устройство, домен)
+    for pair in np.unique(device_idx.astype(np.int64) * 256 + batch.protocol[has_device]):
+        device_stats[ip_names[pair // 256]]["protocols"].add(protocol_name(pair % 256))
+    domain_ids = batch.domain_id[has_device]
+    with_domain = domain_ids >= 0
+    if with_domain.any():
+        stride = len(batch.domains)
+        pairs, pair_idx = np.unique(device_idx[with_domain].astype(np.int64) * stride + domain_ids[with_domain],
+                                    return_inverse=True)
+        hits_per_pair = np.bincount(pair_idx)
+        bytes_per_pair = np.bincount(pair_idx, weights=lengths[with_domain])
+        for pair, hits, pair_bytes in zip(pairs, hits_per_pair, bytes_per_pair):
+            device_stats[ip_names[pair // stride]]["domains"][batch.domains[pair % stride]] = {
+                "hits": int(hits), "bytes": int(pair_bytes)}
+    return device_stats
@@ -0,0 +1,116 @@
+# dns_cache.py (Кэш ответов DNS для подписи пакетов доменами: ограниченный размер, LRU и TTL)
+
+import socket
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from config import DNS_CACHE_SIZE, DNS_CACHE_NAMES_PER_IP, DNS_CACHE_MIN_TTL, DNS_CACHE_MAX_TTL
+
+Address = Union[int, bytes]  # IPv4 - число, как в колонках PacketBatch; IPv6 - 16 байт
+
+
+def address_key(address: str) -> Address:
+    """Строка адреса из rdata ответа -> ключ кэша."""
+    if ':' in address:
+        return socket.inet_pton(socket.AF_INET6, address)
+    return int.from_bytes(socket.inet_aton(address), 'big')
+
+
+class _Entry:
+    """Имена одного адреса: имя -> [ответов с этим адресом, истекает]; best - имя для подписи пакетов."""
+
+    __slots__ = ('names', 'best', 'best_expires')
+
+    def __init__(self):
+        self.names: Dict[str, list] = {}
+        self.best: Optional[str] = None
+        self.best_expires = 0.0
+
+    def choose(self):
+        # Больше всего ответов; при равенстве - дольше живущее (то есть полученное позже) имя
+        if self.names:
+            self.best = max(self.names, key=self.names.get)
+            self.best_expires = self.names[self.best][1]
+        else:
+            self.best, self.best_expires = None, 0.0
+
+
+class DnsCache:
+    """
+    Адрес -> имена из ответов DNS (A и AAAA). Размер ограничен size адресами:
+    при переполнении вытесняется адрес, к которому дольше всего не обращались (LRU).
+    Имя живёт TTL ответа, ограниченный снизу min_ttl (соединения переживают короткие
+    TTL CDN) и сверху max_ttl. У адреса хранится до names_per_ip имён со счётчиком
+    ответов; пакет подписывается самым частым из живых.
+    Время - метки пакетов (секунды эпохи), поэтому при воспроизведении pcap TTL
+    отсчитывается по записи. Писатель и читатель - поток захвата; stats можно
+    читать из другого потока.
+    """
+
+    def __init__(self, size: int = DNS_CACHE_SIZE, names_per_ip: int = DNS_CACHE_NAMES_PER_IP,
+                 min_ttl: float = DNS_CACHE_MIN_TTL, max_ttl: float = DNS_CACHE_MAX_TTL):
+        self.size = max(int(size), 1)
+        self.names_per_ip = max(int(names_per_ip), 1)
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self._entries: 'OrderedDict[Address, _Entry]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, address: Address, name: str, ttl: float, now: float):
+        entry = self._entries.get(address)
+        if entry is None:
+            entry = self._entries[address] = _Entry()
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._entries.move_to_end(address)
+        expires = now + min(max(ttl, self.min_ttl), self.max_ttl)
+        record = entry.names.get(name)
+        if record is None:
+            if len(entry.names) >= self.names_per_ip:
+                # Место уступает имя с наименьшим числом ответов (при равенстве - самое старое)
+                del entry.names[min(entry.names.items(), key=lambda item: item[1])[0]]
+            entry.names[name] = [1, expires]
+        else:
+            record[0] += 1
+            record[1] = max(record[1], expires)
+        entry.choose()
+
+    def get(self, address: Address, now: float) -> Optional[str]:
+        """Имя адреса без учёта в hits/misses (None, если его нет или все имена истекли)."""
+        entry = self._entries.get(address)
+        if entry is None:
+            return None
+        if entry.best_expires <= now:
+            expired = [name for name, (_, expires) in entry.names.items() if expires <= now]
+            for name in expired:
+                del entry.names[name]
+            self.expired += len(expired)
+            if not entry.names:
+                del self._entries[address]
+                return None
+            entry.choose()
+        self._entries.move_to_end(address)
+        return entry.best
+
+    def domain_for(self, src_ip: Address, dst_ip: Address, now: float) -> Optional[str]:
+        """Домен пакета: по адресу назначения, иначе по источнику (ответ сервера). Одно попадание/промах на пакет."""
+        domain = self.get(dst_ip, now) or self.get(src_ip, now)
+        if domain is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return domain
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "size": self.size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "evicted": self.evicted, "expired": self.expired}
@@ -1,14 +1,20 @@
 #feature_engineer
 import numpy as np
 import math
-from typing import List
+from typing import List, Optional, Union
 from collections import Counter
-from datetime import datetime, timedelta
-# --- Добавляем модуль для временных расчётов ---
-import pandas as pd
+from datetime import datetime
+
+from data_structures import (PacketData, PacketBatch, FeatureVector, PROTO_TCP, PROTO_UDP, TCP_SYN, TCP_ACK,
+                             int_to_ip, protocol_name)
+from config import BURST_WINDOW_SECONDS, NUM_FEATURES # Импортируем константу
+from device_stats import device_column
+
+# datetime хранит время с точностью до 1 мкс, а в float64 эпохи эта точность
+# теряется на последних битах. Полмикросекунды запаса на границе окна Burst_Rate
+# дают тот же результат, что и точное сравнение datetime.
+_BURST_EPSILON = 5e-7
 
-from data_structures import PacketData, FeatureVector
-from config import BURST_WINDOW_SECONDS # Импортируем константу
 
 def shannon_entropy(data: List) -> float:
     """
@@ -29,10 +35,48 @@ def shannon_entropy(data: List) -> float:
 
     return entropy
 
-def extract_features(packet_snapshot: List[PacketData], window_end_time: datetime) -> FeatureVector:
+
+def _entropy_from_counts(counts: np.ndarray) -> float:
+    """Энтропия Шеннона по массиву частот (векторный вариант shannon_entropy)."""
+    if counts.size == 0:
+        return 0.0
+    probabilities = counts / counts.sum()
+    return float(0.0 - np.sum(probabilities * np.log2(probabilities)))
+
+
+def _burst_rate(timestamps: np.ndarray) -> float:
+    """
+    Максимум пакетов в окне [ts - BURST_WINDOW_SECONDS, ts] по всем ts.
+    timestamps должны быть отсортированы; два searchsorted дают O(n log n) вместо O(n²).
+    """
+    upper = np.searchsorted(timestamps, timestamps, side='right')
+    lower = np.searchsorted(timestamps, timestamps - BURST_WINDOW_SECONDS - _BURST_EPSILON, side='left')
+    return float(np.max(upper - lower))
+
+
+def _time_features(timestamps: np.ndarray) -> tuple:
+    """Признаки 11-13 по отсортированным временным меткам (секунды эпохи)."""
+    if timestamps.size < 2:
+        # Если пакетов < 2, невозможно рассчитать интервалы
+        return 0.0, 0.0, 0.0
+
+    inter_arrival_times = np.diff(timestamps)
+    # 11. Mean_Inter_Arrival_Time
+    feature_11 = float(inter_arrival_times.mean())
+    # 12. Std_Inter_Arrival_Time (несмещённая, как pandas.Series.std). Отличие от исходной версии:
+    # у окна из 2 пакетов один интервал, и pandas давал NaN, на котором ломалась оценка моделью;
+    # теперь 0.0 (так же в WindowAccumulator и SlidingWindow, проверка - test_feature_engineer.py)
+    feature_12 = float(inter_arrival_times.std(ddof=1)) if inter_arrival_times.size > 1 else 0.0
+    # 13. Burst_Rate (максимум пакетов за BURST_WINDOW_SECONDS)
+    feature_13 = _burst_rate(timestamps)
+    return feature_11, feature_12, feature_13
+
+
+def extract_features(packet_snapshot: Union[PacketBatch, List[PacketData]], window_end_time: datetime) -> FeatureVector:
     """
-    Преобразует список сырых пакетов (за Time-Window) в единый вектор признаков (13 признаков).
+    Преобразует пакеты окна (PacketBatch или список PacketData) в единый вектор признаков (13 признаков).
     (Фаза 3.2 + Улучшения + Временные признаки)
+    Все расчёты идут по NumPy-массивам за O(n log n).
     """
     if not packet_snapshot:
         # Если пакетов нет, возвращаем вектор из нулей для ML-модели
@@ -43,83 +87,40 @@ def extract_features(packet_snapshot: List[PacketData], window_end_time: datetim
             source_info={'Total_Packets': 0}
         )
 
+    batch = packet_snapshot if isinstance(packet_snapshot, PacketBatch) else PacketBatch.from_packets(packet_snapshot)
+
     # Сортируем пакеты по времени прибытия для расчёта временных признаков
-    sorted_packets = sorted(packet_snapshot, key=lambda p: p.timestamp)
-
-    # Инициализация структур для расчета
-    total_packets = len(sorted_packets)
-    total_bytes = 0
-    packet_lengths = []
-    dst_ports = []
-    tcp_packets = []
-    udp_packets = []
-    timestamps = [] # <--- Новый список для временных меток
-
-    other_ip_packets = 0
-    unique_src_ips = set()
-    unique_dst_ips = set()
-
-    start_time = sorted_packets[0].timestamp
-
-    # Итерация и сбор данных
-    for pkt in sorted_packets:
-        total_bytes += pkt.length
-        packet_lengths.append(pkt.length)
-        unique_src_ips.add(pkt.src_ip)
-        unique_dst_ips.add(pkt.dst_ip)
-        timestamps.append(pkt.timestamp) # <--- Сохраняем время
-
-        if pkt.is_tcp:
-            tcp_packets.append(pkt)
-            if pkt.dst_port is not None:
-                dst_ports.append(pkt.dst_port)
-        elif pkt.is_udp:
-            udp_packets.append(pkt)
-            if pkt.dst_port is not None:
-                dst_ports.append(pkt.dst_port)
-        else:
-            other_ip_packets += 1
+    order = np.argsort(batch.timestamp, kind='stable')
+    timestamps = batch.timestamp[order]
+    src_ips = batch.src_ip[order]
+
+    is_tcp = batch.protocol == PROTO_TCP
+    is_udp = batch.protocol == PROTO_UDP
+    syn_only = (batch.tcp_flags & (TCP_SYN | TCP_ACK)) == TCP_SYN
+
+    # Доли и распределения считаются по сохранённым пакетам, а объём окна -
+    # по точным счётчикам буфера (при переполнении часть пакетов не сохраняется).
+    total_packets = len(batch)
+    tcp_count = int(np.count_nonzero(is_tcp))
+    udp_count = int(np.count_nonzero(is_udp))
+    other_ip_packets = total_packets - tcp_count - udp_count
+    _, port_counts = np.unique(batch.dst_port[is_tcp | is_udp], return_counts=True)
+    unique_src_ips, first_seen, src_counts = np.unique(src_ips, return_index=True, return_counts=True)
 
     # --- РАСЧЁТ СТАТИСТИЧЕСКИХ ПРИЗНАКОВ (1-10) ---
-    feature_1 = float(total_packets)
-    feature_2 = float(total_bytes)
-    feature_3 = np.median(packet_lengths) if packet_lengths else 0.0
-    feature_4 = shannon_entropy(dst_ports)
-    syn_count = sum(1 for pkt in tcp_packets if pkt.tcp_flags.get('SYN', False) and not pkt.tcp_flags.get('ACK', False))
-    feature_5 = syn_count / len(tcp_packets) if len(tcp_packets) > 0 else 0.0
-    feature_6 = len(udp_packets) / total_packets
-    feature_7 = float(len(unique_src_ips))
-    feature_8 = len(tcp_packets) / total_packets
+    feature_1 = float(batch.seen_packets)
+    feature_2 = float(batch.seen_bytes)
+    feature_3 = float(np.median(batch.length))
+    feature_4 = _entropy_from_counts(port_counts)
+    feature_5 = np.count_nonzero(syn_only & is_tcp) / tcp_count if tcp_count > 0 else 0.0
+    feature_6 = udp_count / total_packets
+    feature_7 = float(unique_src_ips.size)
+    feature_8 = tcp_count / total_packets
     feature_9 = other_ip_packets / total_packets
-    feature_10 = float(len(unique_dst_ips))
+    feature_10 = float(np.unique(batch.dst_ip).size)
 
     # --- РАСЧЁТ ВРЕМЕННЫХ ПРИЗНАКОВ (11-13) ---
-    if len(timestamps) > 1:
-        # Преобразуем в pandas Series для удобства
-        ts_series = pd.Series([t.timestamp() for t in timestamps])
-        inter_arrival_times = ts_series.diff().dropna() # Получаем интервалы
-
-        # 11. Mean_Inter_Arrival_Time
-        feature_11 = inter_arrival_times.mean() if not inter_arrival_times.empty else 0.0
-
-        # 12. Std_Inter_Arrival_Time
-        feature_12 = inter_arrival_times.std() if not inter_arrival_times.empty else 0.0
-
-        # 13. Burst_Rate (максимум пакетов за BURST_WINDOW_SECONDS)
-        burst_rates = []
-        if not inter_arrival_times.empty:
-            window_td = timedelta(seconds=BURST_WINDOW_SECONDS)
-            for i, ts in enumerate(timestamps):
-                # Считаем пакеты в окне [ts - window_td, ts]
-                window_start = ts - window_td
-                count_in_window = sum(1 for pkt_ts in timestamps if window_start <= pkt_ts <= ts)
-                burst_rates.append(count_in_window)
-        feature_13 = max(burst_rates) if burst_rates else 0.0
-    else:
-        # Если пакетов < 2, невозможно рассчитать интервалы
-        feature_11 = 0.0
-        feature_12 = 0.0
-        feature_13 = 0.0
+    feature_11, feature_12, feature_13 = _time_features(timestamps)
 
     # Финальный вектор признаков
     feature_vector_list = [
@@ -128,15 +129,18 @@ def extract_features(packet_snapshot: List[PacketData], window_end_time: datetim
         feature_9, feature_10, feature_11, feature_12, feature_13
     ]
 
+    # Самый активный источник; при равенстве - тот, что появился раньше (как Counter.most_common)
+    top = np.lexsort((first_seen, -src_counts))[0]
+
     # Дополнительная информация для логирования (можно обновить)
     source_info = {
-        'Total_Packets': total_packets,
+        'Total_Packets': batch.seen_packets,
+        'Dropped_Packets': batch.dropped_packets,
         'Unique_Src_IPs': feature_7,
         'Unique_Dst_IPs': feature_10,
         'Entropy_DPort': feature_4,
-        'Unique_DPorts_Count': len(Counter(dst_ports)),
-        'Most_Active_IP': Counter([p.src_ip for p in sorted_packets]).most_common(1)[0][0]
-        if total_packets > 0 else "N/A",
+        'Unique_DPorts_Count': int(port_counts.size),
+        'Most_Active_IP': int_to_ip(unique_src_ips[top]),
         # --- Добавляем информацию о временных признаках ---
         'Mean_Inter_Arrival_Time': feature_11,
         'Std_Inter_Arrival_Time': feature_12,
@@ -144,8 +148,144 @@ def extract_features(packet_snapshot: List[PacketData], window_end_time: datetim
     }
 
     return FeatureVector(
-        start_time=start_time,
+        start_time=datetime.fromtimestamp(timestamps[0]),
         end_time=window_end_time,
         features=feature_vector_list,
         source_info=source_info
     )
+
+
+# --- Признаки по узлам и потокам ---
+GROUPINGS = ('host', 'flow')
+
+
+class GroupFeatures:
+    """
+    Матрица признаков окна по группам: строка i - группа groups[i], 13 столбцов.
+    groups - IP устройств (uint32) или потоки (строки [сторона_1, сторона_2, протокол],
+    сторона - IP << 16 | порт); в текст key(i) переводится только по запросу, например
+    для строки тревоги, а не для каждого из тысяч потоков окна.
+    """
+
+    def __init__(self, by: str, groups: np.ndarray, matrix: np.ndarray, packets: np.ndarray):
+        self.by = by
+        self.groups = groups
+        self.matrix = matrix
+        self.packets = packets  # Пакетов в каждой группе
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def key(self, i: int) -> str:
+        if self.by == 'host':
+            return int_to_ip(self.groups[i])
+        low, high, proto = (int(value) for value in self.groups[i])
+        return (f"{int_to_ip(low >> 16)}:{low & 0xFFFF} <-> {int_to_ip(high >> 16)}:{high & 0xFFFF}"
+                f"/{protocol_name(proto)}")
+
+
+def _group_unique_counts(group: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Число различных values в каждой группе (одна сортировка пар вместо цикла по группам)."""
+    pairs = np.unique(group.astype(np.int64) << 32 | values.astype(np.int64))
+    return np.bincount(pairs >> 32, minlength=n_groups)
+
+
+def _flow_keys(batch: PacketBatch) -> tuple:
+    """Двунаправленный поток: (адрес, порт) сторон упорядочены, так что запрос и ответ - один поток."""
+    a = batch.src_ip.astype(np.uint64) << 16 | batch.src_port
+    b = batch.dst_ip.astype(np.uint64) << 16 | batch.dst_port
+    low, high = np.minimum(a, b), np.maximum(a, b)
+    flows, group = np.unique(np.stack([low, high, batch.protocol.astype(np.uint64)], axis=1), axis=0,
+                             return_inverse=True)
+    return np.ones(len(batch), dtype=bool), group.ravel(), flows
+
+
+def _host_keys(batch: PacketBatch, devices: Optional[tuple]) -> tuple:
+    """Устройство пакета - как в статистике: локальный src_ip, иначе локальный dst_ip; прочие пакеты не входят."""
+    has_device, device_ips = devices if devices is not None else device_column(batch)
+    hosts, group = np.unique(device_ips, return_inverse=True)
+    return has_device, group, hosts
+
+
+def extract_group_features(batch: PacketBatch, by: str = 'host', devices: Optional[tuple] = None) -> GroupFeatures:
+    """
+    Те же 13 признаков, что у extract_features, но для каждого локального узла (by='host')
+    или двунаправленного потока (by='flow') окна: матрица (число групп x 13) за один проход.
+    Пакеты сортируются один раз по (группа, время); суммы, медианы, доли, энтропия портов
+    и межпакетные интервалы считаются по границам групп через bincount/reduceat, без
+    цикла по группам, поэтому сотни узлов в окне стоят как несколько проходов по массиву.
+    Строку группы можно подать в модель, обученную на строках того же режима.
+    devices - уже вычисленный device_stats.device_column(batch), чтобы не классифицировать адреса дважды.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Неизвестная группировка: {by}")
+    if not batch:
+        return GroupFeatures(by, np.zeros(0, dtype=np.uint32), np.zeros((0, NUM_FEATURES)), np.zeros(0, dtype=np.int64))
+
+    selected, group, groups = _host_keys(batch, devices) if by == 'host' else _flow_keys(batch)
+    n_groups = len(groups)
+    timestamps = batch.timestamp[selected]
+    order = np.lexsort((timestamps, group))
+    group, timestamps = group[order], timestamps[order]
+    lengths = batch.length[selected][order].astype(np.float64)
+    protocol = batch.protocol[selected][order]
+    tcp_flags = batch.tcp_flags[selected][order]
+    src_ip, dst_ip = batch.src_ip[selected][order], batch.dst_ip[selected][order]
+    dst_port = batch.dst_port[selected][order]
+
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    is_tcp, is_udp = protocol == PROTO_TCP, protocol == PROTO_UDP
+    tcp_counts = np.bincount(group, weights=is_tcp, minlength=n_groups)
+    udp_counts = np.bincount(group, weights=is_udp, minlength=n_groups)
+    syn_only = is_tcp & ((tcp_flags & (TCP_SYN | TCP_ACK)) == TCP_SYN)
+
+    features = np.zeros((n_groups, NUM_FEATURES))
+    features[:, 0] = counts
+    features[:, 1] = np.bincount(group, weights=lengths, minlength=n_groups)
+
+    # 3. Медиана длины: длины внутри группы упорядочены вторым ключом сортировки
+    by_length = np.lexsort((lengths, group))
+    sorted_lengths = lengths[by_length]
+    features[:, 2] = (sorted_lengths[starts + (counts - 1) // 2] + sorted_lengths[starts + counts // 2]) / 2
+
+    # 4. Энтропия портов назначения TCP/UDP: частоты пар (группа, порт)
+    with_ports = is_tcp | is_udp
+    pairs, pair_counts = np.unique(group[with_ports].astype(np.int64) << 16 | dst_port[with_ports],
+                                   return_counts=True)
+    pair_group = pairs >> 16
+    probabilities = pair_counts / np.bincount(group[with_ports], minlength=n_groups)[pair_group]
+    features[:, 3] = 0.0 - np.bincount(pair_group, weights=probabilities * np.log2(probabilities),
+                                       minlength=n_groups)
+
+    features[:, 4] = np.divide(np.bincount(group, weights=syn_only, minlength=n_groups), tcp_counts,
+                               out=np.zeros(n_groups), where=tcp_counts > 0)
+    features[:, 5] = udp_counts / counts
+    features[:, 6] = _group_unique_counts(group, src_ip, n_groups)
+    features[:, 7] = tcp_counts / counts
+    features[:, 8] = (counts - tcp_counts - udp_counts) / counts
+    features[:, 9] = _group_unique_counts(group, dst_ip, n_groups)
+
+    # 11-12. Межпакетные интервалы внутри групп (разности на границах групп отбрасываются)
+    gaps = np.diff(timestamps)
+    same_group = group[1:] == group[:-1]
+    gap_group, gaps = group[1:][same_group], gaps[same_group]
+    gap_counts = counts - 1
+    mean_gap = np.divide(np.bincount(gap_group, weights=gaps, minlength=n_groups), gap_counts,
+                         out=np.zeros(n_groups), where=gap_counts > 0)
+    squares = np.bincount(gap_group, weights=(gaps - mean_gap[gap_group]) ** 2, minlength=n_groups)
+    features[:, 10] = mean_gap
+    features[:, 11] = np.divide(squares, gap_counts - 1, out=np.zeros(n_groups), where=gap_counts > 1)
+    features[:, 11] = np.sqrt(features[:, 11])
+
+    # 13. Burst_Rate: группы разнесены по оси времени на span, и один searchsorted
+    # находит начало окна BURST_WINDOW_SECONDS для всех пакетов сразу
+    relative = timestamps - timestamps.min()
+    span = relative.max() + BURST_WINDOW_SECONDS + 1.0
+    shifted = group * span + relative
+    lower = np.searchsorted(shifted, shifted - BURST_WINDOW_SECONDS - _BURST_EPSILON, side='left')
+    upper = np.searchsorted(shifted, shifted, side='right')
+    features[:, 12] = np.maximum.reduceat(upper - lower, starts)
+    features[counts < 2, 10:] = 0.0  # Как у extract_features: меньше двух пакетов - временных признаков нет
+
+    return GroupFeatures(by, groups, features, counts)
@@ -0,0 +1,143 @@
+# interface_monitor.py (Захват на нескольких интерфейсах: свой снифер, окна и модель у каждого)
+
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import INTERFACE_REFRESH_INTERVAL, MONITOR_TOP_GROUPS, WINDOW_HOP, WINDOW_LATENESS
+
+# Scapy (через sniffer.py) импортируется только в процессе воркера: модуль используется
+# и веб-приложением для разбора списка интерфейсов из ActiveState.interface.
+
+
+def parse_interface_spec(spec: Optional[str]) -> Dict[str, Optional[int]]:
+    """
+    ActiveState.interface -> {интерфейс: id модели или None}.
+    'eth0' (как раньше) -> {'eth0': None}; 'eth0,eth1=5' -> {'eth0': None, 'eth1': 5}.
+    None означает модель, выбранную на панели (active_model_id).
+    """
+    interfaces = {}
+    for item in (spec or '').split(','):
+        name, _, model_id = item.strip().partition('=')
+        if name:
+            interfaces[name] = int(model_id) if model_id.strip().isdigit() else None
+    return interfaces
+
+
+def format_interface_spec(interfaces: Dict[str, Optional[int]]) -> str:
+    return ','.join(name if model_id is None else f"{name}={model_id}" for name, model_id in interfaces.items())
+
+
+class InterfaceCache:
+    """Список интерфейсов ОС (get_if_list), перечитывается не чаще раза в ttl секунд."""
+
+    def __init__(self, ttl: float = INTERFACE_REFRESH_INTERVAL):
+        self.ttl = ttl
+        self._interfaces: List[str] = []
+        self._loaded_at = None
+
+    def get(self) -> List[str]:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            from scapy.all import get_if_list
+
+            self._interfaces = get_if_list()
+            self._loaded_at = time.monotonic()
+        return self._interfaces
+
+
+class InterfaceMonitor:
+    """
+    Один отслеживаемый интерфейс: собственный PacketSniffer (поток захвата и
+    двойной буфер), окна и, если назначена, модель со своим адаптивным порогом.
+    Окна всех интерфейсов закрываются по общим часам воркера, но буферы и
+    признаки у каждого свои: трафик WAN и LAN не смешивается в одном векторе.
+    При WINDOW_HOP снимки буфера идут в SlidingWindow, и окна режутся по меткам пакетов.
+    """
+
+    def __init__(self, name: str, bpf_filter: str):
+        from sniffer import PacketSniffer
+        from window_accumulator import SlidingWindow
+
+        self.name = name
+        self.sniffer = PacketSniffer()
+        self.sniffer.set_config(name, bpf_filter)
+        self.sliding = SlidingWindow() if WINDOW_HOP else None
+        self.model_id: Optional[int] = None
+        self.model_type: Optional[str] = None
+        self.model_path: Optional[str] = None
+        self.detector = None
+        self.threshold = None
+        self.status = {"model_id": None, "model_type": None, "score": None, "threshold": None, "is_anomaly": False,
+                       "capture": {"seen": 0, "kept": 0, "dropped": 0}, "dns_cache": self.sniffer.dns_cache.stats}
+
+    def start(self):
+        self.sniffer.start_sniffing()
+
+    def stop(self):
+        self.sniffer.stop_sniffing()
+
+    @property
+    def is_running(self) -> bool:
+        return self.sniffer.is_running
+
+    def set_model(self, model_id: Optional[int], model_type: Optional[str] = None, detector=None,
+                  model_path: Optional[str] = None):
+        """Назначает модель (или снимает при model_id=None); адаптивный порог начинается с порога обучения."""
+        from adaptive_threshold import AdaptiveThreshold
+
+        self.model_id, self.model_type, self.detector, self.model_path = model_id, model_type, detector, model_path
+        self.threshold = AdaptiveThreshold.for_model(model_type, detector.initial_threshold) if detector else None
+        self.status.update({"model_id": model_id, "model_type": model_type, "score": None,
+                            "threshold": self.threshold.value if self.threshold else None, "is_anomaly": False})
+        self.status.pop("groups", None)
+
+    def take_window(self):
+        """Пакеты закончившегося окна (PacketBatch); счётчики захвата попадают в status."""
+        snapshot = self.sniffer.get_and_clear_buffer()
+        self.status["capture"] = {"seen": snapshot.seen_packets, "kept": len(snapshot),
+                                  "dropped": snapshot.dropped_packets}
+        self.status["dns_cache"] = self.sniffer.dns_cache.stats
+        return snapshot
+
+    def close_windows(self, snapshot, now: float) -> List[Tuple[datetime, object, bool]]:
+        """
+        Окна, готовые к обработке: [(конец окна, PacketBatch, окно полное)]. Без WINDOW_HOP -
+        сам снимок (если в нём есть пакеты); иначе закончившиеся шаги SlidingWindow, у пакетов
+        шага stream_features - признаки всего окна. Шаги неполных окон после старта идут только
+        в статистику устройств.
+        """
+        if self.sliding is None:
+            return [(datetime.fromtimestamp(now), snapshot, True)] if snapshot else []
+        self.sliding.push(snapshot)
+        return [(datetime.fromtimestamp(window_end), batch, full)
+                for window_end, batch, full in self.sliding.close(now - WINDOW_LATENESS)]
+
+    @property
+    def model_ref(self) -> Optional[tuple]:
+        """(id, тип, путь) модели для процессов конвейера, которые загружают детектор сами."""
+        return (self.model_id, self.model_type, self.model_path) if self.detector else None
+
+    def apply_score(self, anomaly_score: float) -> tuple:
+        """Проверяет оценку окна адаптивным порогом: (порог, по которому проверялось окно, тревога)."""
+        threshold = self.threshold.value
+        is_alert = self.threshold.update(anomaly_score)
+        self.status.update({"score": anomaly_score, "threshold": self.threshold.value, "is_anomaly": bool(is_alert)})
+        return threshold, is_alert
+
+    def apply_group_scores(self, groups, scores: np.ndarray) -> tuple:
+        """
+        Оценки строк узлов/потоков окна (FEATURE_GROUPING) против одного адаптивного порога:
+        (порог, тревоги по строкам, индекс самой аномальной строки). В status - она же и
+        MONITOR_TOP_GROUPS худших строк.
+        """
+        threshold = self.threshold.value
+        alerts = self.threshold.update_batch(scores)
+        order = np.argsort(-scores if self.threshold.higher_is_anomalous else scores, kind='stable')
+        worst = int(order[0])
+        self.status.update({
+            "score": float(scores[worst]), "threshold": self.threshold.value, "is_anomaly": bool(alerts.any()),
+            "groups": [{"key": groups.key(i), "score": float(scores[i]), "is_anomaly": bool(alerts[i])}
+                       for i in order[:MONITOR_TOP_GROUPS]]})
+        return threshold, alerts, worst
@@ -0,0 +1,88 @@
+# local_networks.py (Какие адреса - устройства своей сети: таблица диапазонов CIDR вместо ipaddress на пакет)
+
+import bisect
+import ipaddress
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from config import LOCAL_NETWORKS, LOCAL_NETWORKS_EXTRA, LOCAL_NETWORKS_EXCLUDE, LOCAL_IP_CACHE_SIZE
+
+
+def _ranges(include: Iterable[ipaddress.IPv4Network], exclude: Iterable[ipaddress.IPv4Network]) -> List[Tuple[int, int]]:
+    """Префиксы include минус exclude -> отсортированные непересекающиеся диапазоны [start, end]."""
+    merged = []
+    for start, end in sorted((int(net.network_address), int(net.broadcast_address)) for net in include):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    for net in exclude:
+        cut_start, cut_end = int(net.network_address), int(net.broadcast_address)
+        remaining = []
+        for start, end in merged:
+            if end < cut_start or start > cut_end:
+                remaining.append([start, end])
+                continue
+            if start < cut_start:
+                remaining.append([start, cut_start - 1])
+            if end > cut_end:
+                remaining.append([cut_end + 1, end])
+        merged = remaining
+    return [(start, end) for start, end in merged]
+
+
+class LocalNetworks:
+    """
+    Локальные адреса - префиксы networks и extra (например, свои публичные сети)
+    за вычетом exclude. IPv4-префиксы один раз сводятся в отсортированные
+    непересекающиеся диапазоны целых чисел, поэтому колонка адресов PacketBatch
+    классифицируется одним searchsorted, а отдельный адрес - бинарным поиском
+    с кэшем на LOCAL_IP_CACHE_SIZE адресов. IPv6-префиксы проверяются только
+    для адресов-строк (в PacketBatch попадает лишь IPv4).
+    """
+
+    def __init__(self, networks: Iterable[str] = LOCAL_NETWORKS, extra: Iterable[str] = LOCAL_NETWORKS_EXTRA,
+                 exclude: Iterable[str] = LOCAL_NETWORKS_EXCLUDE):
+        include = [ipaddress.ip_network(net, strict=False) for net in [*networks, *extra]]
+        excluded = [ipaddress.ip_network(net, strict=False) for net in exclude]
+        ranges = _ranges([net for net in include if net.version == 4], [net for net in excluded if net.version == 4])
+        self.starts = np.array([start for start, _ in ranges], dtype=np.int64)
+        self.ends = np.array([end for _, end in ranges], dtype=np.int64)
+        self._start_list = self.starts.tolist()
+        self._end_list = self.ends.tolist()
+        self._v6_include = [net for net in include if net.version == 6]
+        self._v6_exclude = [net for net in excluded if net.version == 6]
+        self.is_local = lru_cache(maxsize=LOCAL_IP_CACHE_SIZE)(self._is_local)
+
+    def classify(self, addresses: np.ndarray) -> np.ndarray:
+        """Маска локальных адресов для массива IPv4 в виде чисел (колонки src_ip/dst_ip)."""
+        addresses = np.asarray(addresses, dtype=np.int64)
+        index = np.searchsorted(self.starts, addresses, side='right') - 1
+        return (index >= 0) & (addresses <= self.ends[np.maximum(index, 0)]) if self.starts.size \
+            else np.zeros(addresses.shape, dtype=bool)
+
+    def _is_local(self, address: Union[int, str]) -> bool:
+        if isinstance(address, str):
+            try:
+                parsed = ipaddress.ip_address(address)
+            except ValueError:
+                return False
+            if parsed.version == 6:
+                return any(parsed in net for net in self._v6_include) and \
+                    not any(parsed in net for net in self._v6_exclude)
+            address = int(parsed)
+        index = bisect.bisect_right(self._start_list, address) - 1
+        return index >= 0 and address <= self._end_list[index]
+
+
+_default: Optional[LocalNetworks] = None
+
+
+def local_networks() -> LocalNetworks:
+    """Классификатор по настройкам LOCAL_NETWORKS* (строится один раз на процесс)."""
+    global _default
+    if _default is None:
+        _default = LocalNetworks()
+    return _default
@@ -8,17 +8,17 @@ import sys
 import numpy as np
 import os
 import ctypes
-from collections import deque
 from typing import Any
 import socket
 import ssl
 
-from config import (TIME_WINDOW, NUM_FEATURES, BPF_FILTER, SCORE_HISTORY_SIZE,
-                    ADAPTIVE_THRESHOLD_PERCENTILE, MODEL_PATH, SCALER_PATH,
-                    INITIAL_THRESHOLD_PATH, TRAIN_DURATION_MINUTES, CONTAMINATION)
+from config import (TIME_WINDOW, BPF_FILTER, MODEL_DIR, MODEL_PATH, SCALER_PATH, INITIAL_THRESHOLD_PATH,
+                    TRAIN_DURATION_MINUTES, TRAIN_PCAP_FILE)
 from sniffer import PacketSniffer
+from replay import PcapReplaySource
 from feature_engineer import extract_features
-from ml_model import MLAnomalyDetector
+from ml_model import create_detector
+from adaptive_threshold import AdaptiveThreshold
 from gui_app import MLIDS_GUI
 
 
@@ -53,17 +53,16 @@ class MLIDS_System:
         self.root = root;
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
         self.sniffer = PacketSniffer();
-        self.detector = MLAnomalyDetector()
+        self.detector = create_detector('isolation_forest')
         self.gui_app = MLIDS_GUI(root, self.start_monitoring, self.stop_monitoring, self.reset_model)
         self.ml_thread: threading.Thread = None;
         self.ml_thread_running = False
-        self.current_adaptive_threshold = -0.1
-        self.score_history = deque(maxlen=SCORE_HISTORY_SIZE)
+        self.adaptive_threshold = AdaptiveThreshold.for_model('isolation_forest', -0.1)
         if not check_admin_rights(): self.gui_app.log_message("ВНИМАНИЕ: Запустите с правами администратора!", 'alert')
 
     def reset_model(self):
         try:
-            for fp in [MODEL_PATH, SCALER_PATH, INITIAL_THRESHOLD_PATH]:
+            for fp in [f"{MODEL_PATH}.joblib", SCALER_PATH, INITIAL_THRESHOLD_PATH]:
                 if os.path.exists(fp): os.remove(fp); self.gui_app.log_message(f"Удален: {fp}", 'info')
         except Exception as e:
             self.gui_app.log_message(f"Ошибка сброса: {e}", 'alert')
@@ -85,18 +84,18 @@ class MLIDS_System:
 
     def _ml_monitor_loop(self):
         try:
-            if not self.detector.load_model():
+            if not self.detector.load_model(MODEL_PATH, SCALER_PATH):
                 self.gui_app.log_message(f"Сбор реальных данных ({TRAIN_DURATION_MINUTES} мин)...", 'info')
                 self.sniffer.start_sniffing()
                 X_train, _ = self._collect_baseline_data()
-                self.detector.train_and_save_model(X_train, contamination=CONTAMINATION)
-                self.detector.load_model()
+                os.makedirs(MODEL_DIR, exist_ok=True)
+                self.detector.train_and_save_model(X_train, MODEL_PATH, SCALER_PATH)
+                self.detector.load_model(MODEL_PATH, SCALER_PATH)
                 self.gui_app.log_message("Обучение завершено.", 'info')
 
-            permanent_floor_threshold = self.detector.initial_threshold
-            self.current_adaptive_threshold = permanent_floor_threshold
-            self.score_history.clear()
-            self.gui_app.log_message(f"Модель загружена. Порог: {permanent_floor_threshold:.4f}", 'info')
+            # Порог обучения - постоянный нижний предел адаптивного порога
+            self.adaptive_threshold.reset(self.detector.initial_threshold)
+            self.gui_app.log_message(f"Модель загружена. Порог: {self.adaptive_threshold.floor:.4f}", 'info')
 
             if not self.sniffer.is_running: self.sniffer.start_sniffing()
 
@@ -108,16 +107,9 @@ class MLIDS_System:
                 feature_vector_obj = extract_features(packet_snapshot, datetime.now())
                 anomaly_score = self.detector.predict(feature_vector_obj.get_ml_vector())
 
-                is_alert = anomaly_score < self.current_adaptive_threshold
-                is_safe_to_adapt = anomaly_score >= permanent_floor_threshold
+                is_alert = self.adaptive_threshold.update(anomaly_score)
 
-                if is_safe_to_adapt:
-                    self.score_history.append(anomaly_score)
-                    new_adaptive_threshold = self.detector.calculate_adaptive_threshold(list(self.score_history),
-                                                                                        ADAPTIVE_THRESHOLD_PERCENTILE)
-                    self.current_adaptive_threshold = max(new_adaptive_threshold, permanent_floor_threshold)
-
-                self.root.after_idle(self.gui_app.update_gui, anomaly_score, is_alert, self.current_adaptive_threshold)
+                self.root.after_idle(self.gui_app.update_gui, anomaly_score, is_alert, self.adaptive_threshold.value)
                 if is_alert: self.root.after_idle(self.gui_app.log_message, f"ALERT! Score: {anomaly_score:.3f}",
                                                   'alert')
 
@@ -127,7 +119,12 @@ class MLIDS_System:
             self.root.after_idle(self.gui_app.log_message, f"КРИТИЧЕСКАЯ ОШИБКА: {e}", 'alert')
 
     def _collect_baseline_data(self) -> tuple[np.ndarray, list]:
-        """Собирает данные, СЛУШАЯ РЕАЛЬНЫЙ ТРАФИК ПОЛЬЗОВАТЕЛЯ."""
+        """Собирает данные, СЛУШАЯ РЕАЛЬНЫЙ ТРАФИК ПОЛЬЗОВАТЕЛЯ (или из записи TRAIN_PCAP_FILE)."""
+        if TRAIN_PCAP_FILE:
+            self.root.after_idle(self.gui_app.log_message, f"BASELINE: Чтение записи {TRAIN_PCAP_FILE}", 'info')
+            # Как и при живом сборе, пустые окна ("тишина") тоже идут в обучение
+            return PcapReplaySource(TRAIN_PCAP_FILE).feature_matrix(skip_empty=False), []
+
         X_train_list, num_cycles = [], (TRAIN_DURATION_MINUTES * 60) // TIME_WINDOW
 
         # --- ИЗМЕНЕНИЕ: Генератор трафика отключен ---
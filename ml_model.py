@@ -3,25 +3,37 @@
 import numpy as np
 import joblib
 import os
-import tensorflow as tf
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import IsolationForest
 
-from tf_autoencoder import create_autoencoder
-from config import (NUM_FEATURES, NN_HIDDEN_LAYER_SIZE, NN_EPOCHS, NN_LEARNING_RATE, NN_BATCH_SIZE, CONTAMINATION)
+from config import (NUM_FEATURES, NN_HIDDEN_LAYER_SIZE, NN_EPOCHS, NN_LEARNING_RATE, NN_BATCH_SIZE, CONTAMINATION,
+                    TF_INFERENCE_BACKEND)
+
+# scikit-learn и TensorFlow импортируются внутри детекторов, когда модель
+# создаётся, обучается или загружается: развертыванию только с Isolation Forest
+# TensorFlow не нужен вовсе, а веб-процессу - ни то, ни другое.
+
+_NUMPY_ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0.0),
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'linear': lambda x: x,
+}
 
 
 # --- Детектор на базе Isolation Forest ---
 class IsolationForestDetector:
     def __init__(self):
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.ensemble import IsolationForest
+
         self.model = IsolationForest(contamination=CONTAMINATION, random_state=42, n_estimators=100)
         self.scaler = StandardScaler()
         self.initial_threshold = -0.1
 
-    def train_and_save_model(self, X_train, model_path, scaler_path, initial_threshold_percentile=5.0):
+    def train_and_save_model(self, X_train, model_path, scaler_path, initial_threshold_percentile=5.0,
+                             progress_callback=None):
         print("[IFOREST] Начало обучения Isolation Forest...")
         X_scaled = self.scaler.fit_transform(X_train)
         self.model.fit(X_scaled)
+        if progress_callback: progress_callback(1, 1)
 
         baseline_scores = self.model.decision_function(X_scaled)
         self.initial_threshold = np.percentile(baseline_scores, initial_threshold_percentile)
@@ -43,28 +55,55 @@ class IsolationForestDetector:
         print(f"[IFOREST] Модель '{model_file}' успешно загружена.")
         return True
 
-    def predict(self, X_new):
-        if self.scaler is None: return 0.0
+    def predict_batch(self, X_new) -> np.ndarray:
+        """Оценки для каждой строки X_new (чем меньше, тем аномальнее)."""
+        if self.scaler is None: return np.zeros(len(X_new))
         X_scaled = self.scaler.transform(X_new)
-        return self.model.decision_function(X_scaled)[0]
+        return self.model.decision_function(X_scaled)
+
+    def predict(self, X_new):
+        return self.predict_batch(X_new)[0]
 
 
 # --- Детектор на базе TensorFlow Autoencoder ---
 class TFAutoencoderDetector:
-    def __init__(self):
+    """
+    inference_backend - как считать восстановление при мониторинге:
+      numpy       - веса Dense-слоёв извлекаются из модели, прогон - обычные матричные умножения;
+      tf_function - кэшированный tf.function с фиксированной сигнатурой входа;
+      keras       - model.predict (медленно на одной строке, зато без допущений об архитектуре).
+    """
+
+    def __init__(self, inference_backend: str = TF_INFERENCE_BACKEND):
+        from sklearn.preprocessing import StandardScaler
+
         self.model = None
         self.scaler = StandardScaler()
         self.initial_threshold = 0.1
+        self.inference_backend = inference_backend
+        self._reconstruct = None
+
+    def train_and_save_model(self, X_train, model_path, scaler_path, initial_threshold_percentile=95.0,
+                             progress_callback=None):
+        """progress_callback(эпоха, всего эпох) вызывается после каждой эпохи; исключение из него прерывает обучение."""
+        import tensorflow as tf
+        from tf_autoencoder import create_autoencoder
 
-    def train_and_save_model(self, X_train, model_path, scaler_path, initial_threshold_percentile=95.0):
         print("[TF] Начало обучения TensorFlow Autoencoder...")
         X_scaled = self.scaler.fit_transform(X_train)
 
+        callbacks = []
+        if progress_callback:
+            callbacks.append(tf.keras.callbacks.LambdaCallback(
+                on_epoch_end=lambda epoch, logs: progress_callback(epoch + 1, NN_EPOCHS)))
+
         self.model = create_autoencoder(NUM_FEATURES, NN_HIDDEN_LAYER_SIZE, NN_LEARNING_RATE)
-        self.model.fit(X_scaled, X_scaled, epochs=NN_EPOCHS, batch_size=NN_BATCH_SIZE, shuffle=True, verbose=2)
+        self.model.fit(X_scaled, X_scaled, epochs=NN_EPOCHS, batch_size=NN_BATCH_SIZE, shuffle=True, verbose=2,
+                       callbacks=callbacks)
+        self._prepare_inference()
 
-        reconstructed_X = self.model.predict(X_scaled, verbose=0)
-        reconstruction_errors = tf.keras.losses.MeanSquaredError()(X_scaled, reconstructed_X)
+        # Порог - перцентиль ошибок восстановления по строкам обучающей выборки
+        reconstruction_errors = self._reconstruction_errors(X_scaled)
         self.initial_threshold = np.percentile(reconstruction_errors, initial_threshold_percentile)
 
         # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
@@ -77,7 +116,9 @@ class TFAutoencoderDetector:
         joblib.dump(self.initial_threshold, f"{model_path}_threshold.joblib")
         print(f"[TF] Обучение завершено. Модель сохранена в '{keras_model_path}'")
 
-    def load_model(self, model_path, scaler_path):
+    def load_model(self, model_path, scaler_path, inference_backend=None):
+        import tensorflow as tf
+
         # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
         # Проверяем и загружаем файл .keras
         keras_model_path = f"{model_path}.keras"
@@ -90,13 +131,68 @@ class TFAutoencoderDetector:
 
         self.scaler = joblib.load(scaler_path)
         self.initial_threshold = joblib.load(threshold_file)
-        print(f"[TF] Модель '{keras_model_path}' успешно загружена.")
+        if inference_backend:
+            self.inference_backend = inference_backend
+        self._prepare_inference()
+        print(f"[TF] Модель '{keras_model_path}' успешно загружена (инференс: {self.inference_backend}).")
         return True
 
-    def predict(self, X_new):
-        if self.model is None or self.scaler is None: return 0.0
+    def _prepare_inference(self):
+        """Готовит функцию восстановления для выбранного inference_backend."""
+        import tensorflow as tf
+
+        if self.inference_backend == 'numpy':
+            layers = []
+            for layer in self.model.layers:
+                if not layer.get_weights():
+                    continue  # Входной слой
+                activation = getattr(getattr(layer, 'activation', None), '__name__', None)
+                if not isinstance(layer, tf.keras.layers.Dense) or activation not in _NUMPY_ACTIVATIONS:
+                    print(f"[TF] Слой '{layer.name}' не поддерживается NumPy-инференсом, используется keras.")
+                    self.inference_backend = 'keras'
+                    return self._prepare_inference()
+                kernel, bias = layer.get_weights()
+                layers.append((kernel.astype(np.float64), bias.astype(np.float64), _NUMPY_ACTIVATIONS[activation]))
+
+            def reconstruct(X_scaled):
+                out = np.asarray(X_scaled, dtype=np.float64)
+                for kernel, bias, activation in layers:
+                    out = activation(out @ kernel + bias)
+                return out
+        elif self.inference_backend == 'tf_function':
+            graph = tf.function(self.model, input_signature=[tf.TensorSpec([None, NUM_FEATURES], tf.float32)])
+
+            def reconstruct(X_scaled):
+                return graph(tf.constant(X_scaled, dtype=tf.float32)).numpy()
+        else:
+            def reconstruct(X_scaled):
+                return self.model.predict(X_scaled, verbose=0)
+        self._reconstruct = reconstruct
+
+    def _reconstruction_errors(self, X_scaled) -> np.ndarray:
+        """MSE восстановления для каждой строки отдельно (а не одно среднее по всему батчу)."""
+        reconstructed = self._reconstruct(X_scaled)
+        return np.mean(np.square(X_scaled - reconstructed), axis=1)
+
+    def predict_batch(self, X_new) -> np.ndarray:
+        """Ошибка восстановления для каждой строки X_new (чем больше, тем аномальнее)."""
+        if self._reconstruct is None or self.scaler is None: return np.zeros(len(X_new))
         X_scaled = self.scaler.transform(X_new)
-        reconstructed = self.model.predict(X_scaled, verbose=0)
-        mse = tf.keras.losses.MeanSquaredError()(X_scaled, reconstructed)
-        return float(mse.numpy())
+        return self._reconstruction_errors(X_scaled)
+
+    def predict(self, X_new):
+        return float(self.predict_batch(X_new)[0])
+
+
+# --- Реестр детекторов ---
+# Model.model_type -> класс детектора. Бэкенд (sklearn/TensorFlow) импортируется
+# только при создании детектора нужного типа.
+DETECTOR_REGISTRY = {
+    'isolation_forest': IsolationForestDetector,
+    'tensorflow': TFAutoencoderDetector,
+}
+
 
+def create_detector(model_type: str):
+    """Создаёт детектор по типу модели; неизвестные типы, как и раньше, - Isolation Forest."""
+    return DETECTOR_REGISTRY.get(model_type, IsolationForestDetector)()
@@ -0,0 +1,208 @@
+# pipeline.py (Многопроцессный конвейер: захват в воркере, признаки/статистика/оценка - в дочерних процессах)
+
+import queue
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import CAPTURE_BUFFER_SIZE, PIPELINE_WORKERS, PIPELINE_RESULT_TIMEOUT, FEATURE_GROUPING
+from data_structures import PacketBatch
+from device_stats import collect_device_stats, device_column
+
+
+class WindowResult(NamedTuple):
+    """
+    Итог обработки одного окна: вектор признаков, статистика устройств, оценка модели (или None).
+    При группировке (FEATURE_GROUPING) features - матрица строк узлов/потоков, groups -
+    GroupFeatures окна, group_scores - оценка каждой строки, score не заполняется.
+    """
+    features: Optional[np.ndarray]
+    device_stats: dict
+    score: Optional[float]
+    error: Optional[str] = None
+    groups: Optional[object] = None
+    group_scores: Optional[np.ndarray] = None
+
+
+# (id модели, тип, базовый путь файлов): по нему дочерний процесс загружает детектор
+ModelRef = Tuple[int, str, str]
+
+
+def process_window(batch: PacketBatch, window_end: datetime, detector=None, with_features: bool = True,
+                   grouping: Optional[str] = FEATURE_GROUPING) -> WindowResult:
+    """
+    Вся работа над окном после захвата; одинакова в воркере (без конвейера) и в процессах конвейера.
+    С grouping модель оценивает строки узлов/потоков одним predict_batch, поэтому должна быть
+    обучена на строках того же режима (при обучении в выборку идёт вся матрица окна).
+    """
+    from feature_engineer import extract_features, extract_group_features
+
+    devices = device_column(batch)  # Общий для статистики и группировки по узлам
+    device_stats = collect_device_stats(batch, devices)
+    if not (with_features or detector):
+        return WindowResult(None, device_stats, None)
+    if grouping:
+        groups = extract_group_features(batch, grouping, devices)
+        group_scores = np.asarray(detector.predict_batch(groups.matrix), dtype=np.float64) \
+            if detector and len(groups) else None
+        return WindowResult(groups.matrix, device_stats, None, groups=groups, group_scores=group_scores)
+    # При STREAMING_FEATURES вектор уже посчитан снифером по мере прихода пакетов
+    features = batch.stream_features if batch.stream_features is not None else \
+        extract_features(batch, window_end).features
+    score = float(detector.predict(np.array([features]))) if detector else None
+    return WindowResult(features, device_stats, score)
+
+
+class SharedBatchSlots:
+    """
+    slots ячеек по capacity строк колонок PacketBatch в одном сегменте SharedMemory.
+    Колонка каждой ячейки - срез NumPy поверх общей памяти: воркер копирует окно в
+    свободную ячейку одним np.copyto на колонку, дочерний процесс читает его на месте,
+    через очередь передаются только номер ячейки, размер и список доменов.
+    """
+
+    def __init__(self, slots: int, capacity: int, name: Optional[str] = None):
+        self.slots = slots
+        self.capacity = capacity
+        self._offsets = {}
+        size = 0
+        for column, dtype in PacketBatch.COLUMNS:
+            self._offsets[column] = size
+            size += -(-slots * capacity * np.dtype(dtype).itemsize // 8) * 8  # Выравнивание по 8 байт
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.name = self.memory.name
+
+    def columns(self, slot: int, size: Optional[int] = None) -> Dict[str, np.ndarray]:
+        size = self.capacity if size is None else size
+        views = {}
+        for column, dtype in PacketBatch.COLUMNS:
+            base = np.ndarray(self.slots * self.capacity, dtype=dtype, buffer=self.memory.buf,
+                              offset=self._offsets[column])
+            views[column] = base[slot * self.capacity:slot * self.capacity + size]
+        return views
+
+    def write(self, slot: int, batch: PacketBatch):
+        for column, view in self.columns(slot, len(batch)).items():
+            np.copyto(view, getattr(batch, column))
+
+    def read(self, slot: int, meta: dict, domains: List[str]) -> PacketBatch:
+        return PacketBatch.from_columns(self.columns(slot, meta["size"]), domains, meta["seen_packets"],
+                                        meta["seen_bytes"], meta["dropped_packets"], meta["stream_features"])
+
+    def close(self, unlink: bool = False):
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _pipeline_process(memory_name: str, slots: int, capacity: int, tasks, results):
+    """Дочерний процесс: окна из общей памяти -> WindowResult. Детекторы загружаются один раз на модель."""
+    from ml_model import create_detector
+
+    shared = SharedBatchSlots(slots, capacity, name=memory_name)
+    detectors = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, slot, meta, domains, model, with_features = task
+            try:
+                detector, load_error = None, None
+                if model is not None:
+                    model_id, model_type, model_path = model
+                    if model_id not in detectors:
+                        detectors[model_id] = create_detector(model_type)
+                        if not detectors[model_id].load_model(model_path, f"{model_path}_scaler.joblib"):
+                            # Ошибка сообщается один раз; дальше окна модели считаются без оценки
+                            detectors[model_id] = None
+                            load_error = f"Не удалось загрузить модель ID {model_id} из '{model_path}'"
+                    detector = detectors[model_id]
+                batch = shared.read(slot, meta, domains)
+                result = process_window(batch, datetime.fromtimestamp(meta["window_end"]), detector, with_features)
+                if load_error:
+                    result = result._replace(error=load_error)
+            except Exception as e:
+                result = WindowResult(None, {}, None, f"{type(e).__name__}: {e}")
+            results.put((task_id, result))
+    finally:
+        shared.close()
+
+
+class ProcessingPipeline:
+    """
+    Признаки, статистика устройств (LocalNetworks.classify) и оценка моделью выполняются в
+    workers процессах, а в воркере остаются только захват с разбором пакетов,
+    адаптивные пороги и запись в базу - GIL больше не делится между ними.
+    Окна раздаются процессам по мере освобождения; process() возвращает
+    результаты в порядке окон, поэтому адаптивный порог видит оценки по порядку.
+    """
+
+    def __init__(self, workers: int = PIPELINE_WORKERS, capacity: int = CAPTURE_BUFFER_SIZE,
+                 slots: Optional[int] = None):
+        # spawn, как и у пула обучения: дочерние процессы не наследуют потоки снифера
+        context = multiprocessing.get_context('spawn')
+        self.workers = max(int(workers), 1)
+        self.shared = SharedBatchSlots(slots or self.workers * 2, capacity)
+        self._free_slots = deque(range(self.shared.slots))
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._slot_of = {}
+        self._done = {}
+        self._next_id = 0
+        self.processes = [context.Process(target=_pipeline_process, name=f"pipeline-{i}", daemon=True,
+                                          args=(self.shared.name, self.shared.slots, capacity, self._tasks,
+                                                self._results))
+                          for i in range(self.workers)]
+        for process in self.processes:
+            process.start()
+
+    def _collect(self, timeout: float):
+        task_id, result = self._results.get(timeout=timeout)
+        self._free_slots.append(self._slot_of.pop(task_id))
+        self._done[task_id] = result
+
+    def fits(self, batch: PacketBatch) -> bool:
+        """Помещается ли окно в ячейку общей памяти (иначе его нужно обработать без конвейера)."""
+        return len(batch) <= self.shared.capacity
+
+    def submit(self, batch: PacketBatch, window_end: datetime, model: Optional[ModelRef] = None,
+               with_features: bool = True) -> int:
+        """Копирует окно в свободную ячейку и ставит в очередь; если ячеек нет - ждёт готовых результатов."""
+        if len(batch) > self.shared.capacity:
+            raise ValueError(f"Окно из {len(batch)} пакетов больше ячейки конвейера ({self.shared.capacity})")
+        while not self._free_slots:
+            self._collect(PIPELINE_RESULT_TIMEOUT)
+        slot = self._free_slots.popleft()
+        self.shared.write(slot, batch)
+        task_id = self._next_id
+        self._next_id += 1
+        self._slot_of[task_id] = slot
+        meta = {"size": len(batch), "seen_packets": batch.seen_packets, "seen_bytes": batch.seen_bytes,
+                "dropped_packets": batch.dropped_packets, "window_end": window_end.timestamp(),
+                "stream_features": batch.stream_features}
+        self._tasks.put((task_id, slot, meta, list(batch.domains), model, with_features))
+        return task_id
+
+    def result(self, task_id: int, timeout: float = PIPELINE_RESULT_TIMEOUT) -> WindowResult:
+        while task_id not in self._done:
+            self._collect(timeout)
+        return self._done.pop(task_id)
+
+    def process(self, windows: List[tuple]) -> List[WindowResult]:
+        """windows - (batch, window_end, model, with_features); результаты - в том же порядке."""
+        task_ids = [self.submit(*window) for window in windows]
+        return [self.result(task_id) for task_id in task_ids]
+
+    def close(self):
+        for _ in self.processes:
+            self._tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.shared.close(unlink=True)
@@ -0,0 +1,122 @@
+# replay.py (Офлайн-воспроизведение pcap/pcapng)
+
+import time
+import argparse
+from datetime import datetime
+from typing import Iterator, Tuple, Optional, Callable
+
+import numpy as np
+
+from config import TIME_WINDOW, CAPTURE_BUFFER_SIZE, CAPTURE_OVERFLOW_POLICY, CAPTURE_MODE, FEATURE_GROUPING, NUM_FEATURES
+from data_structures import PacketBatch
+from feature_engineer import extract_features, extract_group_features
+from sniffer import PacketSniffer
+
+try:
+    from scapy.all import PcapReader, RawPcapReader
+except ImportError:
+    print("[REPLAY] Ошибка: Scapy не найдена.")
+    raise
+
+
+class PcapReplaySource:
+    """
+    Потоково читает pcap/pcapng и нарезает пакеты на окна так же, как PacketSniffer
+    при живом захвате. Границы окон задаются временными метками пакетов, а не
+    time.sleep(TIME_WINDOW), поэтому результат детерминирован.
+
+    speed=None - максимально быстро; speed=1.0 - в исходном темпе записи;
+    speed=10.0 - в 10 раз быстрее исходного темпа.
+    capture_mode='raw' читает кадры без разбора Scapy (как PacketSniffer в режиме raw).
+    """
+
+    def __init__(self, pcap_path: str, window_seconds: float = TIME_WINDOW, speed: Optional[float] = None,
+                 buffer_size: int = CAPTURE_BUFFER_SIZE, overflow_policy: str = CAPTURE_OVERFLOW_POLICY,
+                 capture_mode: str = CAPTURE_MODE):
+        self.pcap_path = pcap_path
+        self.window_seconds = window_seconds
+        self.speed = speed
+        self.buffer_size = buffer_size
+        self.overflow_policy = overflow_policy
+        self.capture_mode = capture_mode
+        self.packets_read = 0
+
+    def _packets(self, sniffer: PacketSniffer) -> Iterator[Tuple[float, Callable[[], None]]]:
+        """(время пакета, функция, которая кладёт пакет в sniffer)."""
+        if self.capture_mode == 'raw':
+            with RawPcapReader(self.pcap_path) as reader:
+                for frame, meta in reader:
+                    if hasattr(meta, 'tsresol'):  # pcapng
+                        ts = ((meta.tshigh << 32) + meta.tslow) / meta.tsresol
+                        linktype = meta.linktype
+                    else:
+                        ts = meta.sec + meta.usec * (1e-9 if reader.nano else 1e-6)
+                        linktype = reader.linktype
+                    yield ts, lambda: sniffer.process_raw_frame(frame, linktype, ts)
+        else:
+            with PcapReader(self.pcap_path) as reader:
+                for packet in reader:
+                    yield float(packet.time), lambda: sniffer.process_packet(packet)
+
+    def windows(self) -> Iterator[Tuple[datetime, PacketBatch]]:
+        """Выдаёт (время конца окна, PacketBatch окна), включая пустые окна в паузах трафика."""
+        # Офлайн признаки считаются по окну целиком (feature_matrix), потоковые не нужны
+        sniffer = PacketSniffer(self.buffer_size, self.overflow_policy, self.capture_mode, streaming=False)
+        self.packets_read = 0
+        first_ts, wall_start, window_end = None, None, None
+
+        for ts, feed in self._packets(sniffer):
+            if window_end is None:
+                first_ts, wall_start = ts, time.monotonic()
+                window_end = ts + self.window_seconds
+
+            while ts >= window_end:
+                self._pace(window_end - first_ts, wall_start)
+                yield datetime.fromtimestamp(window_end), sniffer.get_and_clear_buffer()
+                window_end += self.window_seconds
+
+            self._pace(ts - first_ts, wall_start)
+            feed()
+            self.packets_read += 1
+
+        # Последнее (неполное) окно
+        if window_end is not None:
+            yield datetime.fromtimestamp(window_end), sniffer.get_and_clear_buffer()
+
+    def _pace(self, capture_offset: float, wall_start: float):
+        """В режиме исходной скорости ждёт, пока не наступит момент capture_offset."""
+        if not self.speed:
+            return
+        delay = capture_offset / self.speed - (time.monotonic() - wall_start)
+        if delay > 0:
+            time.sleep(delay)
+
+    def feature_matrix(self, skip_empty: bool = True, grouping: Optional[str] = FEATURE_GROUPING) -> np.ndarray:
+        """Векторы признаков всех окон файла - готовая обучающая выборка (при grouping - строки узлов/потоков)."""
+        if grouping:
+            matrices = [extract_group_features(batch, grouping).matrix for _, batch in self.windows() if batch]
+            return np.vstack(matrices) if matrices else np.empty((0, NUM_FEATURES))
+        vectors = [extract_features(batch, window_end).features
+                   for window_end, batch in self.windows() if batch or not skip_empty]
+        return np.array(vectors).reshape(-1, NUM_FEATURES)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Превращает pcap/pcapng в векторы признаков ML-IDS.")
+    parser.add_argument('pcap', help="Путь к файлу .pcap или .pcapng")
+    parser.add_argument('--window', type=float, default=TIME_WINDOW, help="Длина окна в секундах")
+    parser.add_argument('--speed', type=float, default=None, help="Множитель исходной скорости (по умолчанию - максимально быстро)")
+    parser.add_argument('--mode', choices=('scapy', 'raw'), default=CAPTURE_MODE, help="Режим разбора пакетов")
+    parser.add_argument('--out', default=None, help="Сохранить матрицу признаков в .npy")
+    args = parser.parse_args()
+
+    source = PcapReplaySource(args.pcap, window_seconds=args.window, speed=args.speed, capture_mode=args.mode)
+    started = time.perf_counter()
+    X = source.feature_matrix()
+    elapsed = time.perf_counter() - started
+
+    print(f"[REPLAY] Пакетов: {source.packets_read}, окон с трафиком: {len(X)}, время: {elapsed:.2f} с "
+          f"({source.packets_read / elapsed if elapsed else 0:.0f} пакетов/с)")
+    if args.out:
+        np.save(args.out, X)
+        print(f"[REPLAY] Матрица признаков сохранена в '{args.out}'")
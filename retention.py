@@ -0,0 +1,155 @@
+# retention.py (Очистка старой истории и возврат места в файле базы)
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from config import (RETENTION_INTERVAL, RETENTION_BATCH_SIZE, RETENTION_BATCH_PAUSE, VACUUM_INTERVAL_HOURS,
+                    VACUUM_PAGES)
+from db_setup import apply_pragmas
+
+# Формат, в котором SQLAlchemy хранит DateTime в SQLite: строки сравниваются как даты
+_SQLITE_DATETIME = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def enable_incremental_vacuum(connection: sqlite3.Connection) -> bool:
+    """
+    Однократно переводит базу в auto_vacuum=INCREMENTAL: режим применяется только полным
+    VACUUM, который держит блокировку записи всё время работы и временно требует около
+    двойного размера файла. Поэтому это отдельная команда (flask --app app
+    enable-incremental-vacuum), а не работа фонового потока. False - режим уже включён.
+    """
+    if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    connection.execute("VACUUM")
+    return True
+
+
+class RetentionPolicy(NamedTuple):
+    """Строки table старше keep (по колонке time_column) удаляются; epoch - колонка в секундах epoch."""
+    table: str
+    time_column: str
+    keep: timedelta
+    epoch: bool = False
+
+
+class RetentionEngine(threading.Thread):
+    """
+    Фоновый поток воркера. Раз в interval секунд удаляет устаревшие строки по
+    policies пачками по batch_size строк; каждая пачка - отдельная короткая
+    транзакция на собственном соединении, между пачками пауза, поэтому коммиты
+    воркера не ждут дольше одной пачки. Понижение детализации происходит при записи:
+    сырой TrafficLog сразу попадает в минутные и часовые агрегаты, здесь лишь
+    отрезается хвост каждого уровня.
+
+    Раз в vacuum_interval_hours освободившиеся страницы возвращаются файлу через
+    PRAGMA incremental_vacuum (первый раз - через vacuum_interval_hours после
+    запуска, а не сразу). Если база создана без auto_vacuum=INCREMENTAL, поток
+    только сообщает об этом: полный VACUUM запускается вручную
+    (enable_incremental_vacuum).
+
+    orphan_cleanup - (таблица словаря, таблица-ссылка, колонка ссылки): записи
+    словаря, на которые больше ничто не ссылается, тоже удаляются.
+    """
+
+    def __init__(self, db_path: str, policies: List[RetentionPolicy], orphan_cleanup: Optional[tuple] = None,
+                 interval: float = RETENTION_INTERVAL, batch_size: int = RETENTION_BATCH_SIZE,
+                 batch_pause: float = RETENTION_BATCH_PAUSE, vacuum_interval_hours: float = VACUUM_INTERVAL_HOURS,
+                 vacuum_pages: int = VACUUM_PAGES):
+        super().__init__(name="retention", daemon=True)
+        self.db_path = db_path
+        self.policies = policies
+        self.orphan_cleanup = orphan_cleanup
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_interval = vacuum_interval_hours * 3600
+        self.vacuum_pages = vacuum_pages
+        self._stop_event = threading.Event()
+        self._last_vacuum = None
+        self.stats = {"runs": 0, "deleted_total": 0, "last_deleted": {}, "last_run_s": 0.0, "rows_per_s": 0.0,
+                      "last_run_at": None, "last_vacuum_at": None, "vacuum_freed_bytes": 0, "disk": {}}
+
+    def run(self):
+        connection = sqlite3.connect(self.db_path, timeout=30.0)
+        apply_pragmas(connection)
+        self._last_vacuum = time.monotonic()  # Перезапуск воркера не должен сразу запускать очистку файла
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.run_once(connection)
+                except Exception as e:
+                    # Любая ошибка прохода (не только SQLite) не должна останавливать поток очистки
+                    print(f"[RETENTION] Ошибка очистки ({type(e).__name__}): {e}")
+                self._stop_event.wait(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run_once(self, connection: sqlite3.Connection):
+        started = time.perf_counter()
+        deleted = {}
+        now = datetime.utcnow()
+        for policy in self.policies:
+            cutoff = (time.time() - policy.keep.total_seconds() if policy.epoch
+                      else (now - policy.keep).strftime(_SQLITE_DATETIME))
+            deleted[policy.table] = self._delete_in_batches(
+                connection, policy.table, f"{policy.time_column} < ?", (cutoff,))
+        if self.orphan_cleanup:
+            table, referencing_table, column = self.orphan_cleanup
+            deleted[table] = self._delete_in_batches(
+                connection, table, f"id NOT IN (SELECT {column} FROM {referencing_table})", ())
+        elapsed = time.perf_counter() - started
+
+        total = sum(deleted.values())
+        self.stats.update({"runs": self.stats["runs"] + 1, "deleted_total": self.stats["deleted_total"] + total,
+                           "last_deleted": deleted, "last_run_s": round(elapsed, 3),
+                           "rows_per_s": round(total / elapsed) if elapsed > 0 else 0,
+                           "last_run_at": datetime.now().strftime('%H:%M:%S')})
+
+        if time.monotonic() - self._last_vacuum >= self.vacuum_interval:
+            self.vacuum(connection)
+        self.stats["disk"] = self.disk_usage(connection)
+        if total:
+            print(f"[RETENTION] Удалено строк: {total} за {elapsed:.2f} с ({self.stats['rows_per_s']} строк/с)")
+
+    def _delete_in_batches(self, connection: sqlite3.Connection, table: str, condition: str, params: tuple) -> int:
+        deleted = 0
+        while not self._stop_event.is_set():
+            with connection:
+                cursor = connection.execute(
+                    f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT ?)",
+                    params + (self.batch_size,))
+            deleted += cursor.rowcount
+            if cursor.rowcount < self.batch_size:
+                break
+            time.sleep(self.batch_pause)
+        return deleted
+
+    def vacuum(self, connection: sqlite3.Connection):
+        self._last_vacuum = time.monotonic()
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("[RETENTION] База не в режиме auto_vacuum=INCREMENTAL, место не возвращается. "
+                  "Однократно выполните: flask --app app enable-incremental-vacuum")
+            return
+        freelist_before = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        connection.execute(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})").fetchall()
+        freelist_after = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        self.stats["last_vacuum_at"] = datetime.now().strftime('%H:%M:%S')
+        self.stats["vacuum_freed_bytes"] = max(freelist_before - freelist_after, 0) * page_size
+
+    def disk_usage(self, connection: sqlite3.Connection) -> dict:
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        freelist = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        wal_path = f"{self.db_path}-wal"
+        return {"file_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+                "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+                "used_bytes": (page_count - freelist) * page_size, "free_bytes": freelist * page_size}
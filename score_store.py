@@ -0,0 +1,70 @@
+# score_store.py (История оценок по окнам: запись, выборка по диапазону, прореживание для графиков)
+
+import sqlite3
+from typing import Optional, Iterable, Tuple
+
+import numpy as np
+from sqlalchemy import select, func, Integer
+
+from config import NUM_FEATURES
+
+# Вектор признаков хранится как 13 float64 (104 байта): этого достаточно, чтобы
+# переоценить окно другой моделью без повторного захвата трафика.
+_FEATURE_DTYPE = np.dtype('<f8')
+
+
+def encode_features(features) -> bytes:
+    return np.asarray(features, dtype=_FEATURE_DTYPE).reshape(NUM_FEATURES).tobytes()
+
+
+def insert_score_records(connection: sqlite3.Connection, table: str, user_id: int,
+                         records: Iterable[Tuple[float, Optional[int], float, float, bool, np.ndarray,
+                                                 Optional[str]]]):
+    """records - (ts, model_id, score, threshold, is_anomaly, features, interface); commit - за вызывающим."""
+    connection.executemany(
+        f"INSERT INTO {table} (user_id, ts, model_id, interface, score, threshold, is_anomaly, features) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(user_id, ts, model_id, interface, float(score), float(threshold), bool(is_anomaly),
+          encode_features(features)) for ts, model_id, score, threshold, is_anomaly, features, interface in records])
+
+
+def _range_filter(table, user_id: int, start: float, end: float, model_id: Optional[int], interface: Optional[str]):
+    conditions = [table.c.user_id == user_id, table.c.ts >= start, table.c.ts < end]
+    if model_id is not None:
+        conditions.append(table.c.model_id == model_id)
+    if interface is not None:
+        conditions.append(table.c.interface == interface)
+    return conditions
+
+
+def downsample_scores(session, table, user_id: int, start: float, end: float, points: int,
+                      model_id: Optional[int] = None, interface: Optional[str] = None) -> dict:
+    """
+    Диапазон [start, end) (секунды epoch), сжатый SQL-группировкой в не более чем points
+    корзин: среднее/минимум/максимум оценки, средний порог и флаг "в корзине была
+    аномалия". Читается индекс (user_id, ts), наружу уходят только корзины.
+    """
+    step = max((end - start) / max(points, 1), 1e-6)
+    bucket = func.cast((table.c.ts - start) / step, Integer).label('bucket')
+    rows = session.execute(
+        select(bucket, func.min(table.c.ts), func.avg(table.c.score), func.min(table.c.score),
+               func.max(table.c.score), func.avg(table.c.threshold), func.max(table.c.is_anomaly), func.count())
+        .where(*_range_filter(table, user_id, start, end, model_id, interface))
+        .group_by(bucket).order_by(bucket)).all()
+    columns = list(zip(*rows)) if rows else [[]] * 8
+    return {"ts": list(columns[1]), "score": list(columns[2]), "score_min": list(columns[3]),
+            "score_max": list(columns[4]), "threshold": list(columns[5]),
+            "anomaly": [bool(flag) for flag in columns[6]], "windows": list(columns[7])}
+
+
+def load_scores(session, table, user_id: int, start: float, end: float, model_id: Optional[int] = None,
+                interface: Optional[str] = None) -> dict:
+    """Все окна диапазона как массивы NumPy (features - матрица n x 13) для переоценки и анализа."""
+    rows = session.execute(
+        select(table.c.ts, table.c.model_id, table.c.score, table.c.threshold, table.c.is_anomaly, table.c.features)
+        .where(*_range_filter(table, user_id, start, end, model_id, interface)).order_by(table.c.ts)).all()
+    ts, model_ids, scores, thresholds, anomalies, blobs = zip(*rows) if rows else ([], [], [], [], [], [])
+    return {"ts": np.array(ts, dtype=np.float64), "model_id": np.array(model_ids),
+            "score": np.array(scores, dtype=np.float64), "threshold": np.array(thresholds, dtype=np.float64),
+            "is_anomaly": np.array(anomalies, dtype=bool),
+            "features": np.frombuffer(b''.join(blobs), dtype=_FEATURE_DTYPE).reshape(-1, NUM_FEATURES)}
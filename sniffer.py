@@ -1,30 +1,113 @@
 # sniffer.py (ПОЛНАЯ УНИВЕРСАЛЬНАЯ ВЕРСИЯ)
 
-from collections import deque
+import struct
 import threading
-from datetime import datetime
-from typing import List, Optional
+import time
+from typing import Optional, Tuple
 
-from config import BPF_FILTER
-from data_structures import PacketData
+from config import BPF_FILTER, CAPTURE_BUFFER_SIZE, CAPTURE_OVERFLOW_POLICY, CAPTURE_MODE, STREAMING_FEATURES
+from data_structures import PacketBatch, CaptureBuffer, PROTO_TCP, PROTO_UDP, PROTOCOL_NAMES, ip_to_int
+from dns_cache import DnsCache, address_key
 
 try:
-    from scapy.all import sniff, IP, TCP, UDP, DNS, DNSQR
+    from scapy.all import sniff, conf, IP, TCP, UDP, DNS, DNSQR
+    from scapy.data import DLT_EN10MB, DLT_RAW, DLT_LINUX_SLL, DLT_NULL, DLT_LOOP, DLT_IPV4
 except ImportError:
     print("[SNIFFER] Ошибка: Scapy не найдена.")
     raise
 
+ETH_P_IP, ETH_P_IPV6 = 0x0800, 0x86DD
+_VLAN_ETHERTYPES = (0x8100, 0x88A8)
+DNS_PORTS = (53, 5353)
+DNS_ADDRESS_TYPES = (1, 28)  # A, AAAA
+
+# Канальный уровень -> (длина заголовка, смещение EtherType или None).
+# Для DLT_NULL/DLT_LOOP версия IP определяется по первому байту пакета.
+_LINK_HEADERS = {
+    DLT_EN10MB: (14, 12),
+    DLT_LINUX_SLL: (16, 14),
+    DLT_RAW: (0, None),
+    DLT_IPV4: (0, None),
+    101: (0, None),  # LINKTYPE_RAW в файлах pcap
+    DLT_NULL: (4, None),
+    DLT_LOOP: (4, None),
+}
+
+_IPV4_HEADER = struct.Struct('!B5xHxBxxII')  # ver/ihl, flags+frag, proto, src, dst
+_IPV6_NEXT_HEADER = struct.Struct('!6xB')
+_PORTS = struct.Struct('!HH')
+_IP_PROTO_NAMES = IP().get_field('proto').i2s
+
+
+def _register_protocol(code: int) -> int:
+    """Добавляет имя IP-протокола из таблицы Scapy в PROTOCOL_NAMES (один раз на протокол)."""
+    if code not in PROTOCOL_NAMES:
+        PROTOCOL_NAMES[code] = _IP_PROTO_NAMES.get(code, 'OTHER').upper()
+    return code
+
+
+def parse_raw_frame(frame: bytes, linktype: int) -> Optional[Tuple]:
+    """
+    Разбирает Ethernet/SLL/raw + IPv4/IPv6 + TCP/UDP без Scapy.
+    Возвращает (src_ip, dst_ip, src_port, dst_port, tcp_flags, protocol) или None,
+    если кадр не IP. Для IPv6 адреса равны None: колонки PacketBatch только IPv4,
+    но порты нужны, чтобы не пропустить ответы DNS.
+    """
+    header = _LINK_HEADERS.get(linktype)
+    if header is None:
+        return None
+    offset, ethertype_offset = header
+    if ethertype_offset is not None:
+        if len(frame) < offset:
+            return None
+        ethertype = (frame[ethertype_offset] << 8) | frame[ethertype_offset + 1]
+        while ethertype in _VLAN_ETHERTYPES and linktype == DLT_EN10MB:
+            offset += 4
+            if len(frame) < offset:
+                return None
+            ethertype = (frame[offset - 2] << 8) | frame[offset - 1]
+    else:
+        if len(frame) <= offset:
+            return None
+        version = frame[offset] >> 4
+        ethertype = ETH_P_IP if version == 4 else ETH_P_IPV6 if version == 6 else 0
+
+    if ethertype == ETH_P_IP:
+        if len(frame) < offset + 20:
+            return None
+        version_ihl, fragment, protocol, src_ip, dst_ip = _IPV4_HEADER.unpack_from(frame, offset)
+        l4_offset = offset + (version_ihl & 0x0F) * 4
+        if fragment & 0x1FFF:
+            # Не первый фрагмент: заголовка TCP/UDP в нём нет
+            return src_ip, dst_ip, 0, 0, 0, protocol
+    elif ethertype == ETH_P_IPV6:
+        if len(frame) < offset + 40:
+            return None
+        src_ip = dst_ip = None
+        protocol = _IPV6_NEXT_HEADER.unpack_from(frame, offset)[0]
+        l4_offset = offset + 40
+    else:
+        return None
+
+    src_port, dst_port, tcp_flags = 0, 0, 0
+    if protocol == PROTO_TCP and len(frame) >= l4_offset + 14:
+        src_port, dst_port = _PORTS.unpack_from(frame, l4_offset)
+        tcp_flags = frame[l4_offset + 13]
+    elif protocol == PROTO_UDP and len(frame) >= l4_offset + 8:
+        src_port, dst_port = _PORTS.unpack_from(frame, l4_offset)
+    return src_ip, dst_ip, src_port, dst_port, tcp_flags, protocol
+
 
 class PacketSniffer:
-    def __init__(self):
-        # MAX_BUFFER_SIZE теперь не импортируется, но можно его задать здесь
-        self.buffer = deque(maxlen=10000)
-        self.lock = threading.Lock()
+    def __init__(self, buffer_size: int = CAPTURE_BUFFER_SIZE, overflow_policy: str = CAPTURE_OVERFLOW_POLICY,
+                 capture_mode: str = CAPTURE_MODE, streaming: bool = STREAMING_FEATURES):
+        self.buffer = CaptureBuffer(buffer_size, overflow_policy, streaming)
+        self.capture_mode = capture_mode
         self.is_running = False
         self.sniffer_thread: Optional[threading.Thread] = None
         self.iface_to_use: Optional[str] = None
         self.bpf_filter: str = BPF_FILTER
-        self.dns_cache = {}
+        self.dns_cache = DnsCache()
 
     def set_config(self, iface_name: str, bpf_filter: str):
         self.iface_to_use = iface_name
@@ -36,13 +119,17 @@ class PacketSniffer:
             print("[SNIFFER] КРИТИЧЕСКАЯ ОШИБКА: Сетевой интерфейс не задан!")
             return
         self.is_running = True
-        print(f"[SNIFFER] Запуск захвата на '{self.iface_to_use}' с фильтром: '{self.bpf_filter}'")
-        self.sniffer_thread = threading.Thread(
-            target=sniff,
-            kwargs={'prn': self._packet_callback, 'iface': self.iface_to_use, 'filter': self.bpf_filter, 'store': 0,
-                    'stop_filter': lambda _: not self.is_running},
-            daemon=True
-        )
+        print(f"[SNIFFER] Запуск захвата на '{self.iface_to_use}' с фильтром: '{self.bpf_filter}' "
+              f"(режим: {self.capture_mode})")
+        if self.capture_mode == 'raw':
+            self.sniffer_thread = threading.Thread(target=self._raw_capture_loop, daemon=True)
+        else:
+            self.sniffer_thread = threading.Thread(
+                target=sniff,
+                kwargs={'prn': self.process_packet, 'iface': self.iface_to_use, 'filter': self.bpf_filter, 'store': 0,
+                        'stop_filter': lambda _: not self.is_running},
+                daemon=True
+            )
         self.sniffer_thread.start()
 
     def stop_sniffing(self):
@@ -51,15 +138,11 @@ class PacketSniffer:
             self.sniffer_thread.join(timeout=1.5)
         print("[SNIFFER] Захват трафика остановлен.")
 
-    def _packet_callback(self, packet):
+    def process_packet(self, packet):
+        """Разбирает один пакет Scapy и кладёт его в буфер (используется и при воспроизведении pcap)."""
         # 1. Парсим DNS
-        if packet.haslayer(DNS) and packet.getlayer(DNS).qr == 1 and packet.getlayer(DNS).an:
-            for answer in packet.getlayer(DNS).an:
-                if answer.type == 1:
-                    try:
-                        self.dns_cache[answer.rdata] = answer.rrname.decode('utf-8').strip('.')
-                    except Exception:
-                        pass
+        timestamp = float(packet.time)
+        self._update_dns_cache(packet, timestamp)
 
         if not packet.haslayer(IP):
             return
@@ -67,42 +150,82 @@ class PacketSniffer:
         ip_layer = packet[IP]
 
         # 2. Инициализируем все переменные
-        src_ip, dst_ip = ip_layer.src, ip_layer.dst
-        pkt_len = len(packet)
-        domain = self.dns_cache.get(dst_ip) or self.dns_cache.get(src_ip)
-
-        is_tcp = packet.haslayer(TCP)
-        is_udp = packet.haslayer(UDP)
-        src_port, dst_port, tcp_flags, protocol = None, None, {}, 'OTHER'
+        src_ip, dst_ip = ip_to_int(ip_layer.src), ip_to_int(ip_layer.dst)
+        src_port, dst_port, tcp_flags = 0, 0, 0
 
         # 3. Заполняем переменные в зависимости от протокола
-        if is_tcp:
+        if packet.haslayer(TCP):
             tcp_layer = packet.getlayer(TCP)
             src_port, dst_port = tcp_layer.sport, tcp_layer.dport
-            flags_str = str(tcp_layer.flags)
-            tcp_flags = {'SYN': 'S' in flags_str, 'ACK': 'A' in flags_str, 'FIN': 'F' in flags_str,
-                         'RST': 'R' in flags_str}
-            protocol = 'TCP'
-        elif is_udp:
+            tcp_flags = int(tcp_layer.flags) & 0xFF
+            protocol = PROTO_TCP
+        elif packet.haslayer(UDP):
             udp_layer = packet.getlayer(UDP)
             src_port, dst_port = udp_layer.sport, udp_layer.dport
-            protocol = 'UDP'
+            protocol = PROTO_UDP
         else:
-            protocol = ip_layer.get_field('proto').i2s.get(ip_layer.proto, 'OTHER').upper()
-
-        # 4. Создаем универсальный объект PacketData
-        pkt_data = PacketData(
-            timestamp=datetime.now(), src_ip=src_ip, dst_ip=dst_ip,
-            src_port=src_port, dst_port=dst_port, length=pkt_len,
-            is_tcp=is_tcp, is_udp=is_udp, tcp_flags=tcp_flags,
-            protocol=protocol, domain=domain
-        )
-
-        with self.lock:
-            self.buffer.append(pkt_data)
-
-    def get_and_clear_buffer(self) -> List[PacketData]:
-        with self.lock:
-            buffer_snapshot = list(self.buffer)
-            self.buffer.clear()
-            return buffer_snapshot
+            protocol = _register_protocol(ip_layer.proto)
+
+        # 4. Пишем пакет сразу в колонки PacketBatch, без промежуточных объектов
+        domain = self.dns_cache.domain_for(src_ip, dst_ip, timestamp)
+        self.buffer.append(timestamp, src_ip, dst_ip,
+                           src_port, dst_port, len(packet), tcp_flags, protocol, domain)
+
+    def process_raw_frame(self, frame: bytes, linktype: int, timestamp: float):
+        """
+        Быстрый путь: заголовки разбираются struct'ом прямо из байтов кадра.
+        Полный разбор Scapy делается только для ответов DNS, которые наполняют dns_cache.
+        """
+        parsed = parse_raw_frame(frame, linktype)
+        if parsed is None:
+            self._fallback_dissect(frame, linktype, timestamp)
+            return
+        src_ip, dst_ip, src_port, dst_port, tcp_flags, protocol = parsed
+
+        if protocol == PROTO_UDP and src_port in DNS_PORTS:
+            self._update_dns_cache(conf.l2types.num2layer.get(linktype, conf.raw_layer)(frame), timestamp)
+        if src_ip is None:
+            # IPv6: как и в пути Scapy, в буфер попадает только IPv4
+            return
+        if protocol not in PROTOCOL_NAMES:
+            _register_protocol(protocol)
+
+        domain = self.dns_cache.domain_for(src_ip, dst_ip, timestamp)
+        self.buffer.append(timestamp, src_ip, dst_ip, src_port, dst_port, len(frame), tcp_flags, protocol, domain)
+
+    def _fallback_dissect(self, frame: bytes, linktype: int, timestamp: float):
+        """Кадры, которые быстрый парсер не понимает (другой канальный уровень), разбирает Scapy."""
+        layer = conf.l2types.num2layer.get(linktype)
+        if layer is None or linktype in _LINK_HEADERS:
+            return
+        packet = layer(frame)
+        packet.time = timestamp
+        self.process_packet(packet)
+
+    def _update_dns_cache(self, packet, timestamp: float):
+        if packet.haslayer(DNS) and packet.getlayer(DNS).qr == 1 and packet.getlayer(DNS).an:
+            for answer in packet.getlayer(DNS).an:
+                if answer.type in DNS_ADDRESS_TYPES:
+                    try:
+                        self.dns_cache.add(address_key(answer.rdata), answer.rrname.decode('utf-8').strip('.'),
+                                           answer.ttl, timestamp)
+                    except Exception:
+                        pass
+
+    def _raw_capture_loop(self):
+        """Захват без разбора Scapy: сокет отдаёт сырые кадры в process_raw_frame."""
+        sock = conf.L2listen(iface=self.iface_to_use, filter=self.bpf_filter)
+        try:
+            while self.is_running:
+                if not sock.select([sock], 0.5):
+                    continue
+                layer, frame, timestamp = sock.recv_raw()
+                if frame is None:
+                    continue
+                self.process_raw_frame(frame, conf.l2types.layer2num.get(layer, DLT_EN10MB),
+                                       timestamp or time.time())
+        finally:
+            sock.close()
+
+    def get_and_clear_buffer(self) -> PacketBatch:
+        return self.buffer.swap()
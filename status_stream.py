@@ -0,0 +1,100 @@
+# status_stream.py (Рассылка событий воркера подписчикам Server-Sent Events)
+
+import json
+import queue
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from config import STATUS_STREAM_POLL_INTERVAL
+from db_setup import apply_pragmas
+
+
+class Subscriber:
+    """Очередь событий одного открытого /status/stream."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.events = queue.Queue(maxsize=1000)
+
+    def put(self, event: dict):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            pass  # Вкладка не читает поток - пропускаем, браузер переподключится с Last-Event-ID
+
+    def get(self, timeout: float) -> dict:
+        return self.events.get(timeout=timeout)
+
+
+class StatusBroadcaster(threading.Thread):
+    """
+    Один поток на веб-процесс: следит за PRAGMA data_version (как воркер в db_watch.py)
+    и только при изменении базы читает новые строки таблицы событий, раздавая их всем
+    подписчикам. Сколько бы вкладок ни было открыто, база читается одним запросом
+    на изменение, а не одним запросом на вкладку каждые 2 секунды.
+    """
+
+    def __init__(self, db_path: str, event_table: str, poll_interval: float = STATUS_STREAM_POLL_INTERVAL):
+        super().__init__(name="status-stream", daemon=True)
+        self.event_table = event_table
+        self.poll_interval = poll_interval
+        self.connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5.0, check_same_thread=False)
+        apply_pragmas(self.connection, readonly=True)
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Subscriber] = {}
+        self._stop_event = threading.Event()
+        self.last_id = self._query("SELECT COALESCE(MAX(id), 0) FROM {table}")[0][0]
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        return self.connection.execute(sql.format(table=self.event_table), params).fetchall()
+
+    @staticmethod
+    def _event(row) -> dict:
+        event_id, user_id, kind, payload = row
+        return {"id": event_id, "user_id": user_id, "kind": kind, "data": json.loads(payload)}
+
+    def subscribe(self, user_id: int, last_event_id: Optional[int] = None) -> Subscriber:
+        """Новый подписчик; с last_event_id сначала получает пропущенные после него события."""
+        subscriber = Subscriber(user_id)
+        with self._lock:
+            if last_event_id is not None:
+                for row in self._query("SELECT id, user_id, kind, payload FROM {table} "
+                                       "WHERE id > ? AND id <= ? AND user_id = ? ORDER BY id",
+                                       (last_event_id, self.last_id, user_id)):
+                    subscriber.put(self._event(row))
+            self._subscribers[id(subscriber)] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.pop(id(subscriber), None)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        version = None
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                current = self.connection.execute("PRAGMA data_version").fetchone()[0]
+                if current == version:
+                    continue
+                version = current
+                with self._lock:
+                    rows = self._query("SELECT id, user_id, kind, payload FROM {table} WHERE id > ? ORDER BY id",
+                                       (self.last_id,))
+                    for row in rows:
+                        event = self._event(row)
+                        for subscriber in self._subscribers.values():
+                            if subscriber.user_id == event["user_id"]:
+                                subscriber.put(event)
+                        self.last_id = event["id"]
+            except sqlite3.Error as e:
+                print(f"[STREAM] Ошибка чтения событий: {e}")
+
+
+def format_sse(kind: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {kind}", f"data: {json.dumps(data, ensure_ascii=False)}"]
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,70 @@
+# test_adaptive_threshold.py (Регрессия SlidingPercentile: две кучи с ленивым удалением против np.percentile)
+#
+# Запуск: python test_adaptive_threshold.py
+# Последовательности (фиксированный seed): случайные, с повторами, растущий и падающий тренд,
+# пила. После каждого добавления значение сверяется с np.percentile по последним size значениям,
+# а число записей в кучах - с пределом, который держит пересборка.
+import math
+import random
+import sys
+
+import numpy as np
+
+from adaptive_threshold import SlidingPercentile
+
+SEED = 20240615
+TOLERANCE = 1e-9
+
+
+def sequences(rng: random.Random, length: int) -> dict:
+    return {
+        "случайные": [rng.gauss(0, 1) for _ in range(length)],
+        "повторы": [float(rng.randint(0, 5)) for _ in range(length)],
+        "рост": [i * 0.01 + rng.random() * 1e-3 for i in range(length)],
+        "падение": [-i * 0.01 for i in range(length)],
+        "пила": [float(i % 17) for i in range(length)],
+        "константа": [0.25] * length,
+    }
+
+
+def check(values: list, percentile: float, size: int, label: str) -> list:
+    tracker = SlidingPercentile(percentile, size)
+    errors = []
+    for i, value in enumerate(values):
+        tracker.add(value)
+        expected = float(np.percentile(values[max(0, i + 1 - size):i + 1], percentile))
+        got = tracker.value()
+        if not math.isclose(expected, got, rel_tol=TOLERANCE, abs_tol=TOLERANCE):
+            errors.append(f"{label}, шаг {i}: ожидалось {expected}, получено {got}")
+            break
+        if len(tracker._low) + len(tracker._high) > 2 * size + 1:
+            errors.append(f"{label}, шаг {i}: в кучах {len(tracker._low) + len(tracker._high)} записей "
+                          f"при окне {size}")
+            break
+    return errors
+
+
+if __name__ == '__main__':
+    rng = random.Random(SEED)
+    errors = []
+    checked = 0
+    for size in (1, 2, 7, 50, 200):
+        for percentile in (0, 1, 50, 90, 95, 99, 100):
+            for name, values in sequences(rng, 4 * size + 50).items():
+                errors += check(values, percentile, size, f"{name}, окно {size}, p{percentile}")
+                checked += 1
+
+    empty = SlidingPercentile(95, 10)
+    if not math.isnan(empty.value()):
+        errors.append(f"пустое окно: {empty.value()} вместо nan")
+    empty.add(1.0)
+    empty.clear()
+    if len(empty) or not math.isnan(empty.value()):
+        errors.append("clear() не очистил окно")
+
+    for error in errors[:20]:
+        print(f"[TEST] {error}")
+    if errors:
+        print(f"[TEST] ПРОВАЛ: {len(errors)} расхождений")
+        sys.exit(1)
+    print(f"[TEST] OK: {checked} последовательностей совпали с np.percentile на каждом шаге")
@@ -0,0 +1,167 @@
+# test_feature_engineer.py (Регрессия extract_features: векторная версия против исходного цикла)
+#
+# Запуск: python test_feature_engineer.py
+# Исходная реализация (цикл по пакетам + pandas) встроена ниже без изменений в расчётах,
+# и обе версии прогоняются на одних и тех же окнах со случайными пакетами (фиксированный seed).
+import math
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from config import BURST_WINDOW_SECONDS
+from data_structures import PacketData, PacketBatch
+from feature_engineer import extract_features, shannon_entropy
+
+SEED = 20240518
+TOLERANCE = 1e-9
+WINDOW_END = datetime(2024, 5, 18, 12, 0, 0)
+
+
+def baseline_features(packet_snapshot):
+    """Исходный extract_features (до векторизации): признаки и source_info."""
+    sorted_packets = sorted(packet_snapshot, key=lambda p: p.timestamp)
+    total_packets = len(sorted_packets)
+    total_bytes = 0
+    packet_lengths, dst_ports, tcp_packets, udp_packets, timestamps = [], [], [], [], []
+    other_ip_packets = 0
+    unique_src_ips, unique_dst_ips = set(), set()
+
+    for pkt in sorted_packets:
+        total_bytes += pkt.length
+        packet_lengths.append(pkt.length)
+        unique_src_ips.add(pkt.src_ip)
+        unique_dst_ips.add(pkt.dst_ip)
+        timestamps.append(pkt.timestamp)
+        if pkt.is_tcp:
+            tcp_packets.append(pkt)
+            if pkt.dst_port is not None:
+                dst_ports.append(pkt.dst_port)
+        elif pkt.is_udp:
+            udp_packets.append(pkt)
+            if pkt.dst_port is not None:
+                dst_ports.append(pkt.dst_port)
+        else:
+            other_ip_packets += 1
+
+    feature_4 = shannon_entropy(dst_ports)
+    syn_count = sum(1 for pkt in tcp_packets if pkt.tcp_flags.get('SYN', False) and not pkt.tcp_flags.get('ACK', False))
+    features = [
+        float(total_packets), float(total_bytes), np.median(packet_lengths) if packet_lengths else 0.0, feature_4,
+        syn_count / len(tcp_packets) if len(tcp_packets) > 0 else 0.0, len(udp_packets) / total_packets,
+        float(len(unique_src_ips)), len(tcp_packets) / total_packets, other_ip_packets / total_packets,
+        float(len(unique_dst_ips)),
+    ]
+
+    if len(timestamps) > 1:
+        inter_arrival_times = pd.Series([t.timestamp() for t in timestamps]).diff().dropna()
+        window_td = timedelta(seconds=BURST_WINDOW_SECONDS)
+        burst_rates = [sum(1 for pkt_ts in timestamps if ts - window_td <= pkt_ts <= ts) for ts in timestamps]
+        features += [inter_arrival_times.mean(), inter_arrival_times.std(), max(burst_rates)]
+    else:
+        features += [0.0, 0.0, 0.0]
+
+    source_info = {
+        'Total_Packets': total_packets,
+        'Unique_Src_IPs': features[6],
+        'Unique_Dst_IPs': features[9],
+        'Entropy_DPort': feature_4,
+        'Unique_DPorts_Count': len(Counter(dst_ports)),
+        'Most_Active_IP': Counter([p.src_ip for p in sorted_packets]).most_common(1)[0][0],
+    }
+    return features, source_info
+
+
+def make_packet(rng: random.Random, timestamp: datetime) -> PacketData:
+    kind = rng.choice(('tcp', 'tcp', 'udp', 'icmp'))
+    flags = {'SYN': rng.random() < 0.3, 'ACK': rng.random() < 0.6, 'FIN': False, 'RST': False} \
+        if kind == 'tcp' else None
+    return PacketData(
+        timestamp=timestamp,
+        src_ip=f"192.168.1.{rng.randint(1, 12)}",
+        dst_ip=f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 20)}",
+        src_port=rng.randint(1024, 65535) if kind != 'icmp' else None,
+        dst_port=rng.choice((53, 80, 443, 8080, rng.randint(1, 65535))) if kind != 'icmp' else None,
+        length=rng.randint(40, 1500),
+        is_tcp=kind == 'tcp', is_udp=kind == 'udp', tcp_flags=flags,
+        protocol=kind.upper(), domain=None)
+
+
+def make_window(rng: random.Random, packets: int) -> list:
+    """
+    Окно из packets пакетов. Метки - сетка с шагом BURST_WINDOW_SECONDS (точные границы
+    Burst_Rate) вперемешку со случайными, часть меток повторяется (одновременные пакеты).
+    """
+    start = WINDOW_END - timedelta(seconds=10)
+    timestamps = []
+    for _ in range(packets):
+        roll = rng.random()
+        if timestamps and roll < 0.2:
+            timestamps.append(rng.choice(timestamps))
+        elif roll < 0.6:
+            timestamps.append(start + timedelta(seconds=BURST_WINDOW_SECONDS) * rng.randint(0, 60))
+        else:
+            timestamps.append(start + timedelta(microseconds=rng.randint(0, 6_000_000)))
+    rng.shuffle(timestamps)
+    return [make_packet(rng, timestamp) for timestamp in timestamps]
+
+
+def compare(packets: list, label: str) -> list:
+    """Расхождения векторной версии с исходной (список строк; пустой - совпало)."""
+    expected, expected_info = baseline_features(packets)
+    errors = []
+    for source, snapshot in (("список", packets), ("PacketBatch", PacketBatch.from_packets(packets))):
+        vector = extract_features(snapshot, WINDOW_END)
+        for i, (want, got) in enumerate(zip(expected, vector.features)):
+            if not math.isclose(want, got, rel_tol=TOLERANCE, abs_tol=TOLERANCE):
+                errors.append(f"{label} ({source}): признак {i + 1}: ожидалось {want}, получено {got}")
+        for key, want in expected_info.items():
+            got = vector.source_info[key]
+            if got != want and not (isinstance(want, float) and math.isclose(want, got, abs_tol=TOLERANCE)):
+                errors.append(f"{label} ({source}): {key}: ожидалось {want}, получено {got}")
+    return errors
+
+
+def check_two_packet_window(rng: random.Random) -> list:
+    """Окно из двух пакетов: исходная версия давала NaN в Std_Inter_Arrival_Time, теперь 0.0."""
+    packets = [make_packet(rng, WINDOW_END - timedelta(seconds=1)), make_packet(rng, WINDOW_END)]
+    expected, _ = baseline_features(packets)
+    features = extract_features(packets, WINDOW_END).features
+    errors = []
+    if not math.isnan(expected[11]):
+        errors.append(f"2 пакета: исходная версия дала {expected[11]} вместо NaN")
+    if features[11] != 0.0:
+        errors.append(f"2 пакета: Std_Inter_Arrival_Time = {features[11]}, ожидалось 0.0")
+    for i, (want, got) in enumerate(zip(expected, features)):
+        if i != 11 and not math.isclose(want, got, rel_tol=TOLERANCE, abs_tol=TOLERANCE):
+            errors.append(f"2 пакета: признак {i + 1}: ожидалось {want}, получено {got}")
+    return errors
+
+
+if __name__ == '__main__':
+    rng = random.Random(SEED)
+    errors = []
+    windows = 0
+    for size in (1, 3, 4, 5, 10, 50, 200, 1000):
+        for _ in range(20):
+            errors += compare(make_window(rng, size), f"окно {windows} ({size} пакетов)")
+            windows += 1
+    # Все пакеты в один момент и пакеты ровно через BURST_WINDOW_SECONDS
+    errors += compare([make_packet(rng, WINDOW_END) for _ in range(30)], "одна метка")
+    step = timedelta(seconds=BURST_WINDOW_SECONDS)
+    errors += compare([make_packet(rng, WINDOW_END - step * i) for i in range(30)], "шаг BURST_WINDOW_SECONDS")
+    errors += check_two_packet_window(rng)
+
+    empty = extract_features([], WINDOW_END)
+    if empty.features != [0.0] * 13:
+        errors.append(f"пустое окно: {empty.features}")
+
+    for error in errors[:20]:
+        print(f"[TEST] {error}")
+    if errors:
+        print(f"[TEST] ПРОВАЛ: {len(errors)} расхождений")
+        sys.exit(1)
+    print(f"[TEST] OK: {windows + 2} окон совпали с исходной реализацией, окно из 2 пакетов даёт 0.0 вместо NaN")
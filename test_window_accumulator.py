@@ -0,0 +1,130 @@
+# test_window_accumulator.py (Регрессия потоковых признаков: WindowAccumulator и SlidingWindow против extract_features)
+#
+# Запуск: python test_window_accumulator.py
+# Случайные потоки пакетов (фиксированный seed) с пустыми шагами, шагами из 1-2 пакетов, одинаковыми
+# метками и пакетами ровно через BURST_WINDOW_SECONDS. Каждое полное окно SlidingWindow и каждое
+# окно WindowAccumulator сверяются с extract_features по тем же пакетам.
+import math
+import random
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from config import BURST_WINDOW_SECONDS
+from data_structures import PacketBatch, PROTO_TCP, PROTO_UDP, TCP_SYN, TCP_ACK, TCP_FIN
+from feature_engineer import extract_features
+from window_accumulator import SlidingWindow, WindowAccumulator
+
+SEED = 20240601
+TOLERANCE = 1e-9
+START = 1_700_000_000.0  # Метки - секунды эпохи, как у снифера
+
+
+def packet_fields(rng: random.Random, timestamp: float) -> tuple:
+    protocol = rng.choice((PROTO_TCP, PROTO_TCP, PROTO_UDP, 1))
+    flags = rng.choice((TCP_SYN, TCP_SYN | TCP_ACK, TCP_ACK, TCP_FIN | TCP_ACK)) if protocol == PROTO_TCP else 0
+    port = rng.choice((53, 80, 443, rng.randint(1, 65535))) if protocol != 1 else 0
+    return (timestamp, 0xC0A80100 + rng.randint(1, 12), 0x0A000000 + rng.randint(1, 40), rng.randint(1024, 65535),
+            port, rng.choice((60, 60, 1500, rng.randint(40, 9000))), flags, protocol, None)
+
+
+def make_stream(rng: random.Random, hops: int, hop: float) -> PacketBatch:
+    """Пакеты по шагам: пустые, из 1-2 пакетов и обычные; метки по возрастанию."""
+    timestamps = []
+    for index in range(hops):
+        start = START + index * hop
+        count = rng.choice((0, 0, 1, 2, rng.randint(3, 20), rng.randint(20, 200)))
+        for _ in range(count):
+            roll = rng.random()
+            if timestamps and roll < 0.15 and timestamps[-1] >= start:
+                timestamps.append(timestamps[-1])  # Одновременные пакеты
+            elif roll < 0.5:
+                # Сетка BURST_WINDOW_SECONDS: точные границы Burst_Rate
+                timestamps.append(start + BURST_WINDOW_SECONDS * rng.randint(0, int(hop / BURST_WINDOW_SECONDS) - 1))
+            else:
+                timestamps.append(start + rng.random() * hop)
+    stream = PacketBatch(max(len(timestamps), 1))
+    for timestamp in sorted(timestamps):
+        stream.append(*packet_fields(rng, timestamp))
+    return stream
+
+
+def mismatches(label: str, expected: list, got: list) -> list:
+    return [f"{label}: признак {i + 1}: ожидалось {want}, получено {value}"
+            for i, (want, value) in enumerate(zip(expected, got))
+            if not math.isclose(want, value, rel_tol=TOLERANCE, abs_tol=TOLERANCE)]
+
+
+def check_sliding(rng: random.Random, run: int) -> tuple:
+    """Один поток через SlidingWindow: (число сверенных окон, расхождения)."""
+    hop = rng.choice((0.5, 1.0))
+    hops_per_window = rng.choice((1, 2, 5, 10))
+    stream = make_stream(rng, rng.randint(5, 60), hop)
+    sliding = SlidingWindow(length=hop * hops_per_window, hop=hop, alignment=START)
+
+    # Снимки буфера режутся случайно и не совпадают с границами шагов
+    emitted, position, now = [], 0, START
+    end = START + (int((stream.timestamp[-1] - START) / hop) + 2) * hop if len(stream) else START + hop
+    while now < end:
+        now += rng.uniform(0.1, 2.5) * hop
+        upto = int(np.searchsorted(stream.timestamp, now, side='left'))
+        sliding.push(stream.select(np.arange(position, upto)))
+        position = upto
+        emitted += sliding.close(now)
+
+    errors, checked = [], 0
+    first_hop = int(math.floor((stream.timestamp[0] - START) / hop)) if len(stream) else None
+    for window_end, batch, full in emitted:
+        index = int(round((window_end - START) / hop)) - 1
+        if full != (index - first_hop >= hops_per_window - 1):
+            errors.append(f"поток {run}: окно {window_end}: неверный признак полноты {full}")
+        if not full:
+            continue
+        inside = (stream.timestamp >= window_end - sliding.length) & (stream.timestamp < window_end)
+        expected = extract_features(stream.select(np.flatnonzero(inside)), datetime.fromtimestamp(window_end))
+        errors += mismatches(f"поток {run}, окно до {window_end - START:.1f} с", expected.features,
+                             batch.stream_features)
+        checked += 1
+    # Каждое полное окно с пакетами должно быть выдано
+    expected_ends = set()
+    if first_hop is not None:
+        for index in range(first_hop + hops_per_window - 1, int(round((end - START) / hop))):
+            window_end = START + (index + 1) * hop
+            if np.any((stream.timestamp >= window_end - sliding.length) & (stream.timestamp < window_end)):
+                expected_ends.add(window_end)
+    missing = expected_ends - {window_end for window_end, _, full in emitted if full}
+    if missing:
+        errors.append(f"поток {run}: не выданы окна {sorted(window_end - START for window_end in missing)}")
+    return checked, errors
+
+
+def check_accumulator(rng: random.Random, run: int) -> list:
+    """Окно WindowAccumulator (пакеты по времени) против extract_features."""
+    stream = make_stream(rng, rng.choice((1, 1, 4)), rng.choice((0.5, 5.0)))
+    accumulator = WindowAccumulator()
+    for i in range(len(stream)):
+        accumulator.add(float(stream.timestamp[i]), int(stream.src_ip[i]), int(stream.dst_ip[i]),
+                        int(stream.dst_port[i]), int(stream.length[i]), int(stream.tcp_flags[i]),
+                        int(stream.protocol[i]))
+    expected = extract_features(stream, datetime.fromtimestamp(START))
+    return mismatches(f"накопитель {run} ({len(stream)} пакетов)", expected.features, accumulator.features())
+
+
+if __name__ == '__main__':
+    rng = random.Random(SEED)
+    errors = []
+    windows = 0
+    for run in range(60):
+        checked, run_errors = check_sliding(rng, run)
+        windows += checked
+        errors += run_errors
+    for run in range(300):
+        errors += check_accumulator(rng, run)
+
+    for error in errors[:20]:
+        print(f"[TEST] {error}")
+    if errors:
+        print(f"[TEST] ПРОВАЛ: {len(errors)} расхождений")
+        sys.exit(1)
+    print(f"[TEST] OK: {windows} скользящих окон и 300 окон накопителя совпали с extract_features")
@@ -0,0 +1,253 @@
+# traffic_store.py (Накопление статистики устройств и пакетная запись TrafficLog)
+
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Iterable, Optional
+
+from sqlalchemy import insert, update, select, delete, bindparam, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import TRAFFIC_FLUSH_INTERVAL
+
+
+class DeviceStatsAccumulator:
+    """
+    Копит статистику устройств (результат collect_device_stats) между окнами и раз в
+    flush_interval секунд записывает её одной пакетной вставкой: одна строка
+    TrafficLog на устройство за интервал вместо строки на устройство за каждое окно.
+    Протоколы объединяются в памяти, поэтому в базу попадают уже без повторов;
+    счётчики доменов складываются и пишутся в нормализованный индекс доменов.
+    """
+
+    def __init__(self, flush_interval: float = TRAFFIC_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.devices: Dict[str, dict] = {}
+        self.last_flush = time.monotonic()
+        self.stats = {"pending_devices": 0, "flushes": 0, "rows_written": 0, "last_rows": 0,
+                      "last_flush_ms": 0.0, "last_flush_at": None}
+
+    def add(self, device_stats: dict):
+        for ip, stats in device_stats.items():
+            device = self.devices.get(ip)
+            if device is None:
+                self.devices[ip] = {"bytes": stats["bytes"], "packets": stats["packets"],
+                                    "protocols": set(stats["protocols"]),
+                                    "domains": {name: dict(counts) for name, counts in stats["domains"].items()}}
+            else:
+                device["bytes"] += stats["bytes"]
+                device["packets"] += stats["packets"]
+                device["protocols"] |= stats["protocols"]
+                for name, counts in stats["domains"].items():
+                    total = device["domains"].setdefault(name, {"hits": 0, "bytes": 0})
+                    total["hits"] += counts["hits"]
+                    total["bytes"] += counts["bytes"]
+        self.stats["pending_devices"] = len(self.devices)
+
+    def is_due(self) -> bool:
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def discard(self):
+        """Сбрасывает накопленное без записи (некому писать: у панели нет владельца)."""
+        self.devices = {}
+        self.last_flush = time.monotonic()
+        self.stats["pending_devices"] = 0
+
+    def rows(self, user_id: int, timestamp: datetime) -> List[dict]:
+        return [{"user_id": user_id, "local_ip": ip, "total_bytes": device["bytes"], "packet_count": device["packets"],
+                 "protocols": ','.join(sorted(device["protocols"])), "timestamp": timestamp}
+                for ip, device in self.devices.items()]
+
+    def flush(self, session, table, user_id: int, rollup_tables: Optional[dict] = None,
+              domain_tables: Optional[tuple] = None) -> int:
+        """
+        Пишет накопленное в table (TrafficLog.__table__) одним executemany, в той же
+        транзакции обновляет агрегаты rollup_tables ({'minute': ..., 'hour': ...}) и
+        индекс доменов domain_tables ((Domain, DeviceDomainHour)), фиксирует
+        транзакцию и очищает счётчики. Возвращает число записанных строк.
+        """
+        started = time.perf_counter()
+        timestamp = datetime.utcnow()
+        rows = self.rows(user_id, timestamp)
+        if rows:
+            session.execute(insert(table), rows)
+            for granularity, rollup_table in (rollup_tables or {}).items():
+                merge_into_rollup(session, rollup_table, granularity, rows)
+            if domain_tables:
+                store_domain_hits(session, *domain_tables, [
+                    {"user_id": user_id, "local_ip": ip, "bucket": bucket_start(timestamp, 'hour'), "domain": name,
+                     "hits": counts["hits"], "total_bytes": counts["bytes"]}
+                    for ip, device in self.devices.items() for name, counts in device["domains"].items()])
+            session.commit()
+        self.devices = {}
+        self.last_flush = time.monotonic()
+        self.stats.update({"pending_devices": 0, "flushes": self.stats["flushes"] + 1,
+                           "rows_written": self.stats["rows_written"] + len(rows), "last_rows": len(rows),
+                           "last_flush_ms": round((time.perf_counter() - started) * 1000, 2),
+                           "last_flush_at": datetime.now().strftime('%H:%M:%S')})
+        return len(rows)
+
+
+# --- Агрегаты (rollup) для /statistics ---
+# Строка агрегата - (user_id, local_ip, bucket) с суммами байт/пакетов и уже
+# дедуплицированным множеством протоколов за минуту или час.
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _split(value: Optional[str]) -> set:
+    return set(filter(None, (value or '').split(',')))
+
+
+def _aggregate(rows: Iterable[dict], granularity: str) -> Dict[tuple, dict]:
+    """Строки в формате TrafficLog -> {(user_id, local_ip, bucket): агрегат}."""
+    buckets = {}
+    for row in rows:
+        key = (row["user_id"], row["local_ip"], bucket_start(row["timestamp"], granularity))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {"total_bytes": 0, "packet_count": 0, "protocols": set()}
+        bucket["total_bytes"] += row["total_bytes"] or 0
+        bucket["packet_count"] += row["packet_count"] or 0
+        bucket["protocols"] |= _split(row["protocols"])
+    return buckets
+
+
+def _insert_buckets(session, table, buckets: Dict[tuple, dict]):
+    if buckets:
+        session.execute(insert(table), [
+            {"user_id": user_id, "local_ip": ip, "bucket": bucket, "total_bytes": agg["total_bytes"],
+             "packet_count": agg["packet_count"], "protocols": ','.join(sorted(agg["protocols"]))}
+            for (user_id, ip, bucket), agg in buckets.items()])
+
+
+def merge_into_rollup(session, table, granularity: str, rows: List[dict]):
+    """Добавляет строки TrafficLog в агрегаты: существующие корзины дополняются, новые вставляются."""
+    buckets = _aggregate(rows, granularity)
+    updates = []
+    for user_id, bucket in {(user_id, bucket) for user_id, _, bucket in buckets}:
+        ips = [ip for u, ip, b in buckets if u == user_id and b == bucket]
+        for start in range(0, len(ips), 500):  # Ограничение SQLite на число параметров запроса
+            existing = session.execute(select(table).where(
+                table.c.user_id == user_id, table.c.bucket == bucket,
+                table.c.local_ip.in_(ips[start:start + 500]))).all()
+            for row in existing:
+                agg = buckets.pop((user_id, row.local_ip, bucket))
+                updates.append({"row_id": row.id, "total_bytes": row.total_bytes + agg["total_bytes"],
+                                "packet_count": row.packet_count + agg["packet_count"],
+                                "protocols": ','.join(sorted(_split(row.protocols) | agg["protocols"]))})
+    if updates:
+        session.execute(update(table).where(table.c.id == bindparam("row_id")).values(
+            total_bytes=bindparam("total_bytes"), packet_count=bindparam("packet_count"),
+            protocols=bindparam("protocols")), updates)
+    _insert_buckets(session, table, buckets)
+
+
+def rebuild_rollups(session, raw_table, rollup_tables: dict, chunk_size: int = 50000) -> int:
+    """
+    Пересчитывает агрегаты по сырому TrafficLog (для истории, накопленной до
+    появления агрегатов). Пересчитывается только диапазон, который ещё покрыт
+    сырыми строками: более старые агрегаты после очистки (retention.py) остаются
+    как есть. Строки читаются по времени; корзина записывается, как только поток
+    ушёл за её час, поэтому в памяти - не больше часа данных.
+    Возвращает число обработанных строк.
+    """
+    first = session.execute(select(func.min(raw_table.c.timestamp))).scalar()
+    if first is None:
+        return 0
+    since = bucket_start(first, 'hour')
+    # Если есть агрегаты старше первого сырого часа, очистка могла удалить его начало - этот час не трогаем
+    if first != since and any(session.execute(select(table.c.id).where(table.c.bucket < since).limit(1)).first()
+                              for table in rollup_tables.values()):
+        since += timedelta(hours=1)
+    for rollup_table in rollup_tables.values():
+        session.execute(delete(rollup_table).where(rollup_table.c.bucket >= since))
+
+    processed, pending, current_hour = 0, [], None
+
+    def write_pending():
+        for granularity, rollup_table in rollup_tables.items():
+            _insert_buckets(session, rollup_table, _aggregate(pending, granularity))
+
+    columns = [raw_table.c.user_id, raw_table.c.local_ip, raw_table.c.timestamp, raw_table.c.total_bytes,
+               raw_table.c.packet_count, raw_table.c.protocols]
+    result = session.execute(select(*columns).where(raw_table.c.timestamp >= since)
+                             .order_by(raw_table.c.timestamp).execution_options(yield_per=chunk_size))
+    for row in result.mappings():
+        hour = bucket_start(row["timestamp"], 'hour')
+        if hour != current_hour and pending:
+            write_pending()
+            pending = []
+        current_hour = hour
+        pending.append(dict(row))
+        processed += 1
+    if pending:
+        write_pending()
+    session.commit()
+    return processed
+
+
+# --- Нормализованный индекс доменов ---
+# Domain - словарь имён с целочисленными id; DeviceDomainHour - (пользователь,
+# устройство, домен, час) с числом пакетов и байт. Повторная запись той же
+# четвёрки складывает счётчики (UPSERT), поэтому чтение перед записью не нужно.
+
+def domain_ids(session, domain_table, names: Iterable[str]) -> Dict[str, int]:
+    """id доменов по именам; отсутствующие имена добавляются в словарь."""
+    names = sorted(set(names))
+    if not names:
+        return {}
+    session.execute(sqlite_insert(domain_table).on_conflict_do_nothing(), [{"name": name} for name in names])
+    ids = {}
+    for start in range(0, len(names), 500):  # Ограничение SQLite на число параметров запроса
+        chunk = names[start:start + 500]
+        ids.update(session.execute(select(domain_table.c.name, domain_table.c.id)
+                                   .where(domain_table.c.name.in_(chunk))).all())
+    return ids
+
+
+def store_domain_hits(session, domain_table, hits_table, hits: List[dict]):
+    """hits - {"user_id", "local_ip", "bucket", "domain", "hits", "total_bytes"}; счётчики суммируются."""
+    if not hits:
+        return
+    ids = domain_ids(session, domain_table, (hit["domain"] for hit in hits))
+    statement = sqlite_insert(hits_table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'domain_id', 'bucket', 'local_ip'],
+        set_={"hits": hits_table.c.hits + statement.excluded.hits,
+              "total_bytes": hits_table.c.total_bytes + statement.excluded.total_bytes})
+    session.execute(statement, [
+        {"user_id": hit["user_id"], "local_ip": hit["local_ip"], "domain_id": ids[hit["domain"]],
+         "bucket": hit["bucket"], "hits": hit["hits"], "total_bytes": hit["total_bytes"]}
+        for hit in hits])
+
+
+def migrate_domain_blobs(session, raw_table, domain_table, hits_table, chunk_size: int = 500) -> int:
+    """
+    Переносит старые строки TrafficLog.domains (домены через запятую) в индекс
+    доменов и очищает перенесённые строки. Старый формат не хранил счётчиков по
+    доменам, поэтому каждая строка лога даёт домену 1 попадание и 0 байт.
+    Повторный запуск продолжает с оставшихся строк. Возвращает число строк.
+    """
+    migrated = 0
+    while True:
+        rows = session.execute(select(raw_table.c.id, raw_table.c.user_id, raw_table.c.local_ip,
+                                      raw_table.c.timestamp, raw_table.c.domains)
+                               .where(raw_table.c.domains.is_not(None), raw_table.c.domains != '')
+                               .order_by(raw_table.c.id).limit(chunk_size)).all()
+        if not rows:
+            return migrated
+        hits = {}
+        for row in rows:
+            bucket = bucket_start(row.timestamp or datetime.utcnow(), 'hour')
+            for name in _split(row.domains):
+                key = (row.user_id, row.local_ip, bucket, name)
+                hits[key] = hits.get(key, 0) + 1
+        store_domain_hits(session, domain_table, hits_table, [
+            {"user_id": user_id, "local_ip": ip, "bucket": bucket, "domain": name, "hits": count, "total_bytes": 0}
+            for (user_id, ip, bucket, name), count in hits.items()])
+        session.execute(update(raw_table).where(raw_table.c.id.in_([row.id for row in rows])).values(domains=None))
+        session.commit()
+        migrated += len(rows)
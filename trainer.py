@@ -0,0 +1,218 @@
+# trainer.py (Фоновое обучение моделей в пуле процессов)
+
+import os
+import queue
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import TIME_WINDOW, WINDOW_HOP, TRAIN_DURATION_MINUTES, TRAIN_PCAP_FILE, TRAINING_WORKERS
+
+# Очередь прогресса, общая для дочерних процессов пула (задаётся инициализатором пула)
+_progress_queue = None
+
+
+class TrainingCancelled(Exception):
+    """Модель удалили из базы, пока она обучалась."""
+
+
+def _init_training_process(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _model_exists(db_path: str, model_table: str, model_id: int) -> bool:
+    connection = sqlite3.connect(db_path, timeout=5.0)
+    try:
+        return connection.execute(f"SELECT 1 FROM {model_table} WHERE id = ?", (model_id,)).fetchone() is not None
+    finally:
+        connection.close()
+
+
+def remove_model_files(model_path: str, scaler_path: str):
+    for path in (f"{model_path}.joblib", f"{model_path}.keras", f"{model_path}_threshold.joblib", scaler_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def train_model_job(model_id: int, model_type: str, X_train: Optional[np.ndarray], model_path: str, scaler_path: str,
+                    db_path: str, model_table: str, pcap_path: Optional[str] = None) -> int:
+    """
+    Выполняется в дочернем процессе пула. Если X_train не передан, выборка строится
+    из pcap_path. Отмена - это удаление строки модели из базы: она проверяется
+    между эпохами, и тогда уже записанные файлы модели удаляются.
+    Возвращает размер обучающей выборки.
+    """
+    from ml_model import create_detector
+
+    def report(phase: str, done: int, total: int):
+        if not _model_exists(db_path, model_table, model_id):
+            raise TrainingCancelled()
+        if _progress_queue is not None:
+            _progress_queue.put((model_id, phase, done, total))
+
+    if X_train is None:
+        from replay import PcapReplaySource
+
+        report('replay', 0, 1)
+        X_train = PcapReplaySource(pcap_path).feature_matrix()
+    if len(X_train) < 2:
+        raise ValueError(f"Недостаточно данных для обучения: {len(X_train)} окон")
+
+    report('training', 0, 1)
+    try:
+        create_detector(model_type).train_and_save_model(
+            np.asarray(X_train), model_path, scaler_path,
+            progress_callback=lambda done, total: report('training', done, total))
+        report('training', 1, 1)
+    except TrainingCancelled:
+        remove_model_files(model_path, scaler_path)
+        raise
+    return len(X_train)
+
+
+class TrainingJob:
+    """Одна модель в очереди: сбор окон из основного захвата, затем обучение в пуле."""
+
+    def __init__(self, model_id: int, name: str, model_type: str, target_windows: int):
+        self.model_id = model_id
+        self.name = name
+        self.model_type = model_type
+        self.phase = 'collecting'
+        self.done, self.total = 0, target_windows
+        self.X_train: List[np.ndarray] = []
+        self.model_path = None
+        self.future = None
+        self.error = None
+        self.cancelled = False
+        self.samples = 0
+
+    @property
+    def progress(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+    def to_status(self) -> dict:
+        return {"model_id": self.model_id, "name": self.name, "type": self.model_type, "phase": self.phase,
+                "done": self.done, "total": self.total, "progress": round(self.progress, 3)}
+
+
+class TrainingManager:
+    """
+    Очередь обучения главного воркера. Данные для live-обучения берутся из окон
+    основного сниффера (add_window), поэтому мониторинг и сбор TrafficLog не
+    прерываются; само обучение идёт в ProcessPoolExecutor (до max_workers моделей
+    параллельно). Процессы запускаются через spawn: воркер к этому моменту уже мог
+    загрузить TensorFlow для мониторинга, а fork такого процесса небезопасен.
+    """
+
+    def __init__(self, db_path: str, model_table: str, max_workers: int = TRAINING_WORKERS,
+                 train_pcap_file: Optional[str] = TRAIN_PCAP_FILE, model_dir: str = os.path.join('models', 'system')):
+        self.db_path = db_path
+        self.model_table = model_table
+        self.max_workers = max_workers
+        self.train_pcap_file = train_pcap_file
+        self.model_dir = model_dir
+        # Со скользящими окнами окно закрывается на каждом шаге
+        self.target_windows = int(TRAIN_DURATION_MINUTES * 60 // (WINDOW_HOP or TIME_WINDOW))
+        self.jobs: Dict[int, TrainingJob] = {}
+        self._executor = None
+        self._progress_queue = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._progress_queue = context.Queue()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                 initializer=_init_training_process,
+                                                 initargs=(self._progress_queue,))
+        return self._executor
+
+    @property
+    def collecting(self) -> bool:
+        return any(job.phase == 'collecting' for job in self.jobs.values())
+
+    def submit(self, model_id: int, name: str, model_type: str) -> TrainingJob:
+        job = TrainingJob(model_id, name, model_type, self.target_windows)
+        self.jobs[model_id] = job
+        if self.train_pcap_file:
+            self._start_training(job)
+        return job
+
+    def add_window(self, features: Optional[np.ndarray]):
+        """
+        Окно основного захвата для всех собирающих задач; None - пустое окно (учитывается, но не в выборку).
+        Матрица (FEATURE_GROUPING) добавляет в выборку все строки окна, но считается одним окном.
+        """
+        for job in list(self.jobs.values()):
+            if job.phase != 'collecting':
+                continue
+            job.done += 1
+            if features is not None:
+                job.X_train.extend(features) if features.ndim == 2 else job.X_train.append(features)
+            if job.done >= job.total:
+                self._start_training(job)
+
+    def _start_training(self, job: TrainingJob):
+        os.makedirs(self.model_dir, exist_ok=True)
+        base_filename = f'{job.model_type}_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}_{job.model_id}'
+        job.model_path = os.path.join(self.model_dir, base_filename)
+        X_train = np.array(job.X_train) if not self.train_pcap_file else None
+        job.X_train = []
+        job.phase, job.done, job.total = ('replay' if X_train is None else 'queued'), 0, 1
+        job.future = self._get_executor().submit(
+            train_model_job, job.model_id, job.model_type, X_train, job.model_path,
+            f"{job.model_path}_scaler.joblib", self.db_path, self.model_table, self.train_pcap_file)
+
+    def cancel(self, model_id: int):
+        """Собирающая задача снимается сразу, ожидающая в пуле - отменяется; запущенная остановится сама."""
+        job = self.jobs.get(model_id)
+        if job is None:
+            return
+        job.cancelled = True
+        if job.future is None or job.future.cancel():
+            del self.jobs[model_id]
+
+    def sync(self, untrained_ids: set):
+        """Отменяет задачи моделей, которых больше нет среди необученных."""
+        for model_id in [m for m in self.jobs if m not in untrained_ids and not self.jobs[m].cancelled]:
+            self.cancel(model_id)
+
+    def poll(self) -> List[TrainingJob]:
+        """Обновляет прогресс и возвращает завершившиеся задачи (успех, ошибка или отмена)."""
+        while self._progress_queue is not None:
+            try:
+                model_id, phase, done, total = self._progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs.get(model_id)
+            if job is not None and job.future is not None:
+                job.phase, job.done, job.total = phase, done, total
+
+        finished = []
+        for model_id, job in list(self.jobs.items()):
+            if job.future is None or not job.future.done():
+                continue
+            del self.jobs[model_id]
+            exception = job.future.exception()
+            if isinstance(exception, TrainingCancelled):
+                job.cancelled = True
+            elif exception is not None:
+                job.error = str(exception) or type(exception).__name__
+                if isinstance(exception, BrokenProcessPool):
+                    self._executor = None  # Процесс пула упал - следующая задача создаст новый пул
+            else:
+                job.samples = job.future.result()
+            finished.append(job)
+        return finished
+
+    def status(self) -> List[dict]:
+        return [job.to_status() for job in self.jobs.values()]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,402 @@
+# window_accumulator.py (Потоковые признаки окна: обновление на каждом пакете и скользящие окна по шагам)
+
+import math
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (BURST_WINDOW_SECONDS, NUM_FEATURES, TIME_WINDOW, WINDOW_HOP, WINDOW_ALIGNMENT,
+                    WINDOW_LATENESS)
+from data_structures import PacketBatch, PROTO_TCP, PROTO_UDP, TCP_SYN, TCP_ACK
+
+# Как и в feature_engineer: полмикросекунды запаса на границе окна Burst_Rate
+_BURST_EPSILON = 5e-7
+# Медиана длины - по двухуровневой гистограмме 256 x 256 корзин; длины больше
+# 65535 (кадры после GRO) попадают в последнюю корзину
+_LENGTH_LIMIT = 0xFFFF
+
+
+def _xlog2x(count: int) -> float:
+    return count * math.log2(count) if count > 1 else 0.0
+
+
+class WindowAccumulator:
+    """
+    Те же 13 признаков, что у extract_features, но состояние окна обновляется в
+    add() на каждом пакете за O(1), а features() при закрытии окна не проходит по
+    пакетам:
+      счётчики и суммы байт/протоколов/SYN;
+      частоты портов назначения и сумма c*log2(c) - энтропия за O(1);
+      частоты адресов источника и назначения - число различных;
+      Welford для межпакетных интервалов - среднее и несмещённое отклонение;
+      очередь времён за последние BURST_WINDOW_SECONDS - Burst_Rate пакета;
+      гистограмма длин 256 x 256 - точная медиана за 512 шагов.
+    Пакеты должны приходить по времени; более ранняя метка считается равной
+    предыдущей (extract_features в этом случае сортирует окно).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.packets = 0
+        self.bytes = 0
+        self.tcp = 0
+        self.udp = 0
+        self.syn_only = 0
+        self.ported = 0  # Пакеты TCP/UDP - база энтропии портов
+        self.port_counts: Dict[int, int] = {}
+        self._port_xlogx = 0.0
+        self.src_counts: Dict[int, int] = {}
+        self.dst_counts: Dict[int, int] = {}
+        self.first_ts = None
+        self.last_ts = None
+        self._gaps = 0
+        self._gap_mean = 0.0
+        self._gap_m2 = 0.0
+        self._recent = deque()  # Времена пакетов за последние BURST_WINDOW_SECONDS
+        self.burst = 0
+        self._coarse = [0] * 256
+        self._fine: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return self.packets
+
+    def add(self, timestamp: float, src_ip: int, dst_ip: int, dst_port: int, length: int, tcp_flags: int,
+            protocol: int):
+        self.packets += 1
+        self.bytes += length
+        if protocol == PROTO_TCP or protocol == PROTO_UDP:
+            if protocol == PROTO_TCP:
+                self.tcp += 1
+                if tcp_flags & (TCP_SYN | TCP_ACK) == TCP_SYN:
+                    self.syn_only += 1
+            else:
+                self.udp += 1
+            self.ported += 1
+            count = self.port_counts.get(dst_port, 0)
+            self.port_counts[dst_port] = count + 1
+            self._port_xlogx += _xlog2x(count + 1) - _xlog2x(count)
+        self.src_counts[src_ip] = self.src_counts.get(src_ip, 0) + 1
+        self.dst_counts[dst_ip] = self.dst_counts.get(dst_ip, 0) + 1
+
+        clipped = length if length < _LENGTH_LIMIT else _LENGTH_LIMIT
+        self._coarse[clipped >> 8] += 1
+        fine = self._fine.get(clipped >> 8)
+        if fine is None:
+            fine = self._fine[clipped >> 8] = [0] * 256
+        fine[clipped & 0xFF] += 1
+
+        if self.last_ts is None:
+            self.first_ts = self.last_ts = timestamp
+        else:
+            if timestamp < self.last_ts:
+                timestamp = self.last_ts
+            gap = timestamp - self.last_ts
+            self.last_ts = timestamp
+            self._gaps += 1
+            delta = gap - self._gap_mean
+            self._gap_mean += delta / self._gaps
+            self._gap_m2 += delta * (gap - self._gap_mean)
+
+        recent = self._recent
+        recent.append(timestamp)
+        horizon = timestamp - BURST_WINDOW_SECONDS - _BURST_EPSILON
+        while recent[0] < horizon:
+            recent.popleft()
+        if len(recent) > self.burst:
+            self.burst = len(recent)
+
+    def _length_at(self, rank: int) -> int:
+        """Длина пакета с номером rank (с нуля) в порядке возрастания."""
+        for bucket, count in enumerate(self._coarse):
+            if rank < count:
+                for offset, fine_count in enumerate(self._fine[bucket]):
+                    if rank < fine_count:
+                        return bucket << 8 | offset
+                    rank -= fine_count
+            rank -= count
+        raise IndexError(rank)
+
+    def median_length(self) -> float:
+        if not self.packets:
+            return 0.0
+        return (self._length_at((self.packets - 1) // 2) + self._length_at(self.packets // 2)) / 2
+
+    def port_entropy(self) -> float:
+        if not self.ported:
+            return 0.0
+        # H = log2(N) - sum(c*log2(c)) / N; отрицательный ноль от округления отсекается
+        return max(math.log2(self.ported) - self._port_xlogx / self.ported, 0.0)
+
+    def features(self) -> List[float]:
+        """Вектор из NUM_FEATURES признаков текущего окна (нули для пустого окна)."""
+        if not self.packets:
+            return [0.0] * NUM_FEATURES
+        total = self.packets
+        timing = (0.0, 0.0, 0.0)
+        if total > 1:
+            std = math.sqrt(self._gap_m2 / (self._gaps - 1)) if self._gaps > 1 else 0.0
+            timing = (self._gap_mean, std, float(self.burst))
+        return [
+            float(total), float(self.bytes), self.median_length(), self.port_entropy(),
+            self.syn_only / self.tcp if self.tcp else 0.0, self.udp / total, float(len(self.src_counts)),
+            self.tcp / total, (total - self.tcp - self.udp) / total, float(len(self.dst_counts)),
+            *timing,
+        ]
+
+
+# --- Скользящие окна по меткам пакетов ---
+
+def seconds_to_next_hop(now: float, hop: float = WINDOW_HOP, alignment: float = WINDOW_ALIGNMENT,
+                        lateness: float = WINDOW_LATENESS) -> float:
+    """Сколько ждать до конца текущего шага плюс запас на опоздавшие пакеты."""
+    return alignment + (math.floor((now - alignment) / hop) + 1) * hop + lateness - now
+
+
+def _xlog2x_array(counts: np.ndarray) -> np.ndarray:
+    counts = counts.astype(np.float64)
+    return counts * np.log2(np.maximum(counts, 1.0))
+
+
+def _combine(total: tuple, part: tuple, sign: int = 1) -> tuple:
+    """(n, среднее, M2) двух наборов (формулы Чана); sign=-1 вычитает part из total."""
+    n, mean, m2 = total
+    n_part, mean_part, m2_part = part
+    if sign > 0:
+        n_new = n + n_part
+        if not n_new:
+            return 0, 0.0, 0.0
+        delta = mean_part - mean
+        return n_new, mean + delta * n_part / n_new, m2 + m2_part + delta * delta * n * n_part / n_new
+    n_new = n - n_part
+    if n_new <= 0:
+        return 0, 0.0, 0.0
+    mean_new = (n * mean - n_part * mean_part) / n_new
+    delta = mean_part - mean_new
+    return n_new, mean_new, max(m2 - m2_part - delta * delta * n_new * n_part / n, 0.0)
+
+
+class _Hop:
+    """Сводка одного шага: всё, что нужно, чтобы добавить шаг в окно и потом вычесть его."""
+
+    def __init__(self, index: int, batch: PacketBatch, tail: np.ndarray):
+        self.index = index
+        self.seen_packets, self.seen_bytes = batch.seen_packets, batch.seen_bytes
+        self.timestamps = np.sort(batch.timestamp)
+        self.kept = len(batch)
+        is_tcp, is_udp = batch.protocol == PROTO_TCP, batch.protocol == PROTO_UDP
+        self.tcp, self.udp = int(np.count_nonzero(is_tcp)), int(np.count_nonzero(is_udp))
+        self.syn_only = int(np.count_nonzero(is_tcp & ((batch.tcp_flags & (TCP_SYN | TCP_ACK)) == TCP_SYN)))
+        self.ports, self.port_counts = np.unique(batch.dst_port[is_tcp | is_udp], return_counts=True)
+        self.sources, self.source_counts = np.unique(batch.src_ip, return_counts=True)
+        self.destinations, self.destination_counts = np.unique(batch.dst_ip, return_counts=True)
+        self.lengths, self.length_counts = np.unique(np.minimum(batch.length, _LENGTH_LIMIT), return_counts=True)
+
+        gaps = np.diff(self.timestamps)
+        self.gaps = (gaps.size, float(gaps.mean()), float(((gaps - gaps.mean()) ** 2).sum())) if gaps.size \
+            else (0, 0.0, 0.0)
+        self.incoming = None  # Интервал от последнего пакета окна до первого пакета шага
+
+        # Burst_Rate каждого пакета: пакеты за BURST_WINDOW_SECONDS до него, включая хвост прошлых шагов
+        joined = np.concatenate((tail, self.timestamps))
+        self.bursts = np.searchsorted(joined, self.timestamps, side='right') - \
+            np.searchsorted(joined, self.timestamps - BURST_WINDOW_SECONDS - _BURST_EPSILON, side='left')
+        self.max_burst = int(self.bursts.max())
+
+
+class SlidingWindow:
+    """
+    Окна длиной length секунд с шагом hop по меткам времени пакетов: шаг k -
+    [alignment + k*hop, alignment + (k+1)*hop), окно шага k - последние length/hop
+    шагов. Каждый шаг сводится один раз (_Hop: уникальные порты/адреса/длины,
+    моменты интервалов, Burst_Rate пакетов), добавляется в состояние окна и
+    вычитается, когда выходит из окна, поэтому стоимость шага зависит от числа его
+    пакетов, а не от length/hop. Признаки окна совпадают с extract_features по
+    пакетам всех его шагов.
+
+    push() принимает снимки буфера захвата с любыми метками; close(watermark)
+    закрывает шаги, закончившиеся до watermark. Пакеты уже закрытых шагов
+    (опоздавшие дольше WINDOW_LATENESS) попадают в первый открытый шаг с его
+    начальной меткой. Первые length/hop - 1 окон после старта неполные: их шаги
+    выдаются без признаков (для статистики устройств), но не оцениваются.
+    """
+
+    def __init__(self, length: float = TIME_WINDOW, hop: Optional[float] = WINDOW_HOP,
+                 alignment: float = WINDOW_ALIGNMENT):
+        self.hop = float(hop or length)
+        self.hops_per_window = max(int(round(length / self.hop)), 1)
+        self.length = self.hop * self.hops_per_window
+        self.alignment = float(alignment)
+        self._pending: Dict[int, List[PacketBatch]] = {}
+        self._next: Optional[int] = None
+        self._first: Optional[int] = None
+        self._hops = deque()  # Непустые шаги окна по возрастанию index
+        self._max_bursts = deque()  # (index, max_burst), max_burst убывает - максимум по шагам окна
+        self._tail = np.zeros(0)
+        self.seen_packets = self.seen_bytes = self.kept = 0
+        self.tcp = self.udp = self.syn_only = self.ported = 0
+        self._port_counts = np.zeros(0x10000, dtype=np.int64)
+        self._port_xlogx = 0.0
+        self._sources: Dict[int, int] = {}
+        self._destinations: Dict[int, int] = {}
+        self._coarse = np.zeros(256, dtype=np.int64)
+        self._fine = np.zeros(0x10000, dtype=np.int64)
+        self._gaps = (0, 0.0, 0.0)
+
+    def _hop_of(self, timestamps: np.ndarray) -> np.ndarray:
+        return np.floor((timestamps - self.alignment) / self.hop).astype(np.int64)
+
+    def push(self, batch: PacketBatch):
+        if not batch:
+            return
+        hops = self._hop_of(batch.timestamp)
+        late = hops < self._next if self._next is not None else None
+        if late is not None and late.any():
+            hops[late] = self._next
+        else:
+            late = None
+        keys = np.unique(hops)
+        if keys.size == 1 and late is None:
+            pieces = [batch]
+        else:
+            pieces = [batch.select(np.flatnonzero(hops == key)) for key in keys]
+            # Отброшенные буфером пакеты учитываются в итогах последнего шага снимка
+            pieces[-1].seen_packets += batch.seen_packets - len(batch)
+            pieces[-1].seen_bytes += batch.seen_bytes - int(batch.length.sum())
+            pieces[-1].dropped_packets = batch.dropped_packets
+            if late is not None:
+                # Опоздавшие - в первом открытом шаге; метки сдвигаются в копии, снимок не меняется
+                pieces[0].timestamp[late[hops == keys[0]]] = self.alignment + self._next * self.hop
+        for key, piece in zip(keys.tolist(), pieces):
+            self._pending.setdefault(key, []).append(piece)
+
+    def close(self, watermark: float) -> List[Tuple[float, PacketBatch, bool]]:
+        """
+        Закрывает шаги, закончившиеся до watermark: [(конец окна, пакеты шага, окно полное)].
+        У пакетов шага полного окна stream_features - признаки всего окна; шаги неполных окон
+        после старта приходят без признаков. Шаги без пакетов при пустом окне пропускаются.
+        """
+        last = int(math.floor((watermark - self.alignment) / self.hop)) - 1
+        if self._next is None:
+            if not self._pending:
+                return []
+            self._next = self._first = min(self._pending)
+        windows = []
+        while self._next <= last:
+            index = self._next
+            if not self._hops:
+                upcoming = min(self._pending, default=None)
+                if upcoming is None or upcoming > last:
+                    self._next = last + 1
+                    break
+                index = max(index, upcoming)
+            while self._hops and self._hops[0].index <= index - self.hops_per_window:
+                self._evict()
+            pieces = self._pending.pop(index, None)
+            batch = PacketBatch.concat(pieces) if pieces else PacketBatch(1)
+            if batch:
+                self._add(_Hop(index, batch, self._tail))
+            self._next = index + 1
+            full = index - self._first >= self.hops_per_window - 1
+            if self._hops and full:
+                batch.stream_features = self.features()
+            if self._hops and (full or batch):
+                windows.append((self.alignment + (index + 1) * self.hop, batch, full))
+        return windows
+
+    def _add(self, hop: _Hop):
+        if self._hops:
+            hop.incoming = float(hop.timestamps[0] - self._hops[-1].timestamps[-1])
+            self._gaps = _combine(self._gaps, (1, hop.incoming, 0.0))
+        self._hops.append(hop)
+        self._apply(hop, 1)
+        while self._max_bursts and self._max_bursts[-1][1] <= hop.max_burst:
+            self._max_bursts.pop()
+        self._max_bursts.append((hop.index, hop.max_burst))
+        joined = np.concatenate((self._tail, hop.timestamps))
+        self._tail = joined[joined >= joined[-1] - BURST_WINDOW_SECONDS - _BURST_EPSILON]
+
+    def _evict(self):
+        hop = self._hops.popleft()
+        self._apply(hop, -1)
+        if self._max_bursts and self._max_bursts[0][0] == hop.index:
+            self._max_bursts.popleft()
+        # Интервал от вышедшего шага к следующему больше не внутри окна
+        if self._hops and self._hops[0].incoming is not None:
+            self._gaps = _combine(self._gaps, (1, self._hops[0].incoming, 0.0), -1)
+            self._hops[0].incoming = None
+        if not self._hops:
+            self._gaps, self._port_xlogx = (0, 0.0, 0.0), 0.0  # Сброс накопленной ошибки округления
+
+    def _apply(self, hop: _Hop, sign: int):
+        """Добавляет (sign=1) или вычитает (sign=-1) сводку шага из состояния окна."""
+        self.seen_packets += sign * hop.seen_packets
+        self.seen_bytes += sign * hop.seen_bytes
+        self.kept += sign * hop.kept
+        self.tcp += sign * hop.tcp
+        self.udp += sign * hop.udp
+        self.syn_only += sign * hop.syn_only
+
+        before = self._port_counts[hop.ports]
+        after = before + sign * hop.port_counts
+        self._port_counts[hop.ports] = after
+        self._port_xlogx += float(np.sum(_xlog2x_array(after) - _xlog2x_array(before)))
+        self.ported += sign * int(hop.port_counts.sum())
+
+        for counts, keys, values in ((self._sources, hop.sources, hop.source_counts),
+                                     (self._destinations, hop.destinations, hop.destination_counts)):
+            for key, value in zip(keys.tolist(), values.tolist()):
+                count = counts.get(key, 0) + sign * value
+                if count:
+                    counts[key] = count
+                else:
+                    del counts[key]
+
+        self._fine[hop.lengths] += sign * hop.length_counts
+        np.add.at(self._coarse, hop.lengths >> 8, sign * hop.length_counts)
+        self._gaps = _combine(self._gaps, hop.gaps, sign)
+
+    def _length_at(self, rank: int) -> int:
+        cumulative = np.cumsum(self._coarse)
+        bucket = int(np.searchsorted(cumulative, rank, side='right'))
+        rank -= int(cumulative[bucket - 1]) if bucket else 0
+        fine = np.cumsum(self._fine[bucket << 8:(bucket + 1) << 8])
+        return bucket << 8 | int(np.searchsorted(fine, rank, side='right'))
+
+    def _burst(self) -> float:
+        """
+        Burst_Rate окна. Пакетам дальше BURST_WINDOW_SECONDS от начала окна подходит
+        посчитанный при добавлении шага; у более ранних часть предшественников уже
+        вне окна, и их максимум - число пакетов окна в первые BURST_WINDOW_SECONDS.
+        """
+        cut = self._hops[0].timestamps[0] + BURST_WINDOW_SECONDS + _BURST_EPSILON
+        burst, last_scanned = 0, None
+        for hop in self._hops:
+            if hop.timestamps[0] > cut:
+                break
+            inside = int(np.searchsorted(hop.timestamps, cut, side='right'))
+            burst += inside
+            if inside < hop.kept:
+                burst = max(burst, int(hop.bursts[inside:].max()))
+            last_scanned = hop.index
+        rest = next((value for index, value in self._max_bursts if last_scanned is None or index > last_scanned), 0)
+        return float(max(burst, rest))
+
+    def features(self) -> List[float]:
+        if not self.kept:
+            return [0.0] * NUM_FEATURES
+        total = self.kept
+        timing = (0.0, 0.0, 0.0)
+        if total > 1:
+            n_gaps, mean_gap, m2 = self._gaps
+            timing = (mean_gap, math.sqrt(m2 / (n_gaps - 1)) if n_gaps > 1 else 0.0, self._burst())
+        entropy = max(math.log2(self.ported) - self._port_xlogx / self.ported, 0.0) if self.ported else 0.0
+        return [
+            float(self.seen_packets), float(self.seen_bytes),
+            (self._length_at((total - 1) // 2) + self._length_at(total // 2)) / 2, entropy,
+            self.syn_only / self.tcp if self.tcp else 0.0, self.udp / total, float(len(self._sources)),
+            self.tcp / total, (total - self.tcp - self.udp) / total, float(len(self._destinations)),
+            *timing,
+        ]
@@ -1,181 +1,351 @@
 # worker.py (ФИНАЛЬНАЯ УПРОЩЕННАЯ ВЕРСИЯ)
 import time
-from datetime import datetime
-from collections import deque, defaultdict
+import queue
+from datetime import datetime, timedelta
+from collections import deque
 import numpy as np
-import ipaddress
 import os
 import json
 import traceback
+from typing import Dict, Optional
 
 from config import *
-from sniffer import PacketSniffer
-from feature_engineer import extract_features
-from ml_model import IsolationForestDetector, TFAutoencoderDetector
-from scapy.all import get_if_list
+from db_watch import DataVersionWatcher
+from trainer import TrainingManager, remove_model_files
+from traffic_store import DeviceStatsAccumulator
+from retention import RetentionEngine, RetentionPolicy
+from score_store import insert_score_records
+from interface_monitor import InterfaceMonitor, InterfaceCache, parse_interface_spec
+from pipeline import ProcessingPipeline, process_window
+from window_accumulator import seconds_to_next_hop
+from ml_model import create_detector
 
 
-def is_local_ip(ip_str: str) -> bool:
-    try:
-        return ipaddress.ip_address(ip_str).is_private
-    except ValueError:
-        return False
+def read_control_fingerprint(connection) -> tuple:
+    """Всё, на что реагирует воркер: состояние мониторинга и очередь необученных моделей."""
+    from app import Model, ActiveState
+
+    return (
+        connection.execute(f"SELECT is_monitoring, active_model_id, interface FROM {ActiveState.__tablename__} "
+                           f"WHERE id = 1").fetchone(),
+        connection.execute(f"SELECT group_concat(id) FROM {Model.__tablename__} WHERE model_path IS NULL").fetchone(),
+    )
+
+
+# Поля статуса, смена которых отправляется в /status/stream событием state
+STREAM_STATE_KEYS = ("mode", "interface", "primary_interface", "model_id", "training")
+
+
+def write_worker_status(connection, status_json: Optional[str], events: list = (), user_id: Optional[int] = None,
+                        score_records: list = ()):
+    """
+    Статус, новые события (kind, payload) для /status/stream и оценки окон пишутся одной
+    транзакцией через соединение наблюдателя, чтобы не будить его собственной записью.
+    """
+    from app import ActiveState, WorkerEvent, ScoreRecord
+
+    with connection:
+        if status_json is not None:
+            connection.execute(f"UPDATE {ActiveState.__tablename__} SET worker_status_json = ? WHERE id = 1",
+                               (status_json,))
+        if events and user_id is not None:
+            now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+            connection.executemany(
+                f"INSERT INTO {WorkerEvent.__tablename__} (user_id, timestamp, kind, payload) VALUES (?, ?, ?, ?)",
+                [(user_id, now, kind, json.dumps(payload, ensure_ascii=False)) for kind, payload in events])
+        if score_records and user_id is not None:
+            insert_score_records(connection, ScoreRecord.__tablename__, user_id, score_records)
 
 
 def run_main_worker():
-    from app import app, db, Model, TrafficLog, ActiveState
+    # Роль задаётся до импорта app: воркер получает одно соединение-писатель (db_setup.py)
+    os.environ.setdefault('MLIDS_DB_ROLE', 'worker')
+    from app import (app, db, Model, TrafficLog, ActiveState, ROLLUP_TABLES, DOMAIN_TABLES, TrafficRollupMinute,
+                     TrafficRollupHour, Domain, DeviceDomainHour, WorkerEvent, ScoreRecord)
 
     print("[WORKER] Запуск главного воркера...")
+    if FEATURE_GROUPING and WINDOW_HOP:
+        # Строки узлов/потоков считаются по пакетам окна, а у скользящего окна это пакеты одного
+        # шага (WINDOW_HOP с) - модель же обучена на строках окон TIME_WINDOW: признаки бы не совпали
+        print(f"[WORKER] FEATURE_GROUPING='{FEATURE_GROUPING}' не работает вместе с WINDOW_HOP={WINDOW_HOP}: "
+              f"строки узлов/потоков считаются только по окнам TIME_WINDOW. Задайте в config.py "
+              f"WINDOW_HOP = None или FEATURE_GROUPING = None. Воркер не запущен.")
+        return
 
-    sniffer = None
-    ml_detector = None
-    active_model_in_memory = None
+    monitors: Dict[str, InterfaceMonitor] = {}  # Интерфейс -> захват и модель, в порядке из ActiveState.interface
+    interface_cache = InterfaceCache()
+    # Список интерфейсов публикуется в статусе: веб-процесс берёт его оттуда и не импортирует Scapy
+    interfaces = interface_cache.get()
 
     local_status = {
-        "log": deque(maxlen=50), "mode": "Инициализация...", "interface": None,
+        "log": deque(maxlen=50), "mode": "Инициализация...", "interface": None, "interfaces": interfaces,
         "is_running": True, "model_id": None, "current_score": 0.0,
         "adaptive_threshold": -0.1, "is_anomaly": False,
+        "capture": {"seen": 0, "kept": 0, "dropped": 0}, "training": [],
+        "primary_interface": None, "monitors": {},
     }
 
+    # События для /status/stream, накопленные за итерацию цикла
+    pending_events = []
+    pending_scores = []
+
     def _log(message, category='info'):
         timestamp = datetime.now().strftime('%H:%M:%S')
         log_line = f"[{timestamp}] [{category.upper()}] {message}"
         local_status["log"].appendleft(log_line)
+        pending_events.append(("log", {"line": log_line}))
         print(log_line)
 
+    def _refresh_monitor_status():
+        """
+        Сводка по интерфейсам. Поля верхнего уровня (score, порог, model_id) - как и раньше
+        для одного интерфейса - берутся у первого интерфейса с моделью: его рисует график.
+        """
+        local_status["interface"] = ", ".join(monitors) or None
+        local_status["monitors"] = {name: dict(monitor.status) for name, monitor in monitors.items()}
+        local_status["capture"] = {key: sum(monitor.status["capture"][key] for monitor in monitors.values())
+                                   for key in ("seen", "kept", "dropped")}
+        dns = {key: sum(monitor.status["dns_cache"][key] for monitor in monitors.values())
+               for key in ("entries", "size", "hits", "misses", "evicted", "expired")}
+        lookups = dns["hits"] + dns["misses"]
+        local_status["dns_cache"] = {**dns, "hit_rate": dns["hits"] / lookups if lookups else 0.0}
+        scored = [monitor for monitor in monitors.values() if monitor.detector]
+        primary = scored[0] if scored else next(iter(monitors.values()), None)
+        local_status["primary_interface"] = primary.name if primary else None
+        if scored:
+            model_types = sorted({monitor.model_type for monitor in scored})
+            local_status.update({"mode": f"Мониторинг ({', '.join(model_types)})", "model_id": primary.model_id,
+                                 "adaptive_threshold": primary.status["threshold"],
+                                 "current_score": primary.status["score"] or 0.0,
+                                 "is_anomaly": primary.status["is_anomaly"]})
+        else:
+            local_status.update({"mode": "Сбор статистики" if monitors else "Инициализация...", "model_id": None})
+
+    watcher = None
+    trainer = None
+    pipeline = None
+    traffic_stats = DeviceStatsAccumulator()
+    owner_id = None
+    control_fingerprint = None
+    state_changed = True
+    next_window_at = time.monotonic() + TIME_WINDOW
+    last_status_json = None
+    last_stream_state = None
+
     while True:
         try:
             with app.app_context():
-                # 1. Логика обучения (если есть необученные модели)
-                untrained_model = Model.query.filter_by(model_path=None).first()
-                if untrained_model:
-                    _log(f"Начинаю обучение модели: '{untrained_model.name}' (тип: {untrained_model.model_type})")
-                    local_status["mode"] = f"Обучение ({untrained_model.model_type})"
-
-                    train_iface = get_if_list()[0]
-                    _log(f"Использую интерфейс '{train_iface}' для сбора данных.")
-                    train_sniffer = PacketSniffer()
-                    train_sniffer.set_config(train_iface, BPF_FILTER)
-                    train_sniffer.start_sniffing()
-
-                    X_train_list, num_cycles = [], (TRAIN_DURATION_MINUTES * 60) // TIME_WINDOW
-                    for i in range(num_cycles):
-                        time.sleep(TIME_WINDOW)
-                        snapshot = train_sniffer.get_and_clear_buffer()
-                        if not snapshot: continue
-                        X_train_list.append(extract_features(snapshot, datetime.now()).features)
-                        _log(f"Сбор данных для обучения: {i + 1}/{num_cycles}")
-                    train_sniffer.stop_sniffing()
-
-                    if len(X_train_list) < 2:
-                        _log("Недостаточно данных для обучения. Модель удалена.", "danger")
-                        db.session.delete(untrained_model)
+                if watcher is None:
+                    watcher = DataVersionWatcher(db.engine.url.database)
+                    trainer = TrainingManager(watcher.db_path, Model.__tablename__)
+                    retention = RetentionEngine(watcher.db_path, [
+                        RetentionPolicy(TrafficLog.__tablename__, 'timestamp', timedelta(hours=RETENTION_RAW_HOURS)),
+                        RetentionPolicy(TrafficRollupMinute.__tablename__, 'bucket',
+                                        timedelta(days=RETENTION_MINUTE_ROLLUP_DAYS)),
+                        RetentionPolicy(TrafficRollupHour.__tablename__, 'bucket',
+                                        timedelta(days=RETENTION_HOUR_ROLLUP_DAYS)),
+                        RetentionPolicy(DeviceDomainHour.__tablename__, 'bucket', timedelta(days=RETENTION_DOMAIN_DAYS)),
+                        RetentionPolicy(WorkerEvent.__tablename__, 'timestamp', timedelta(hours=RETENTION_EVENT_HOURS)),
+                        RetentionPolicy(ScoreRecord.__tablename__, 'ts', timedelta(days=RETENTION_SCORE_DAYS), epoch=True),
+                    ], orphan_cleanup=(Domain.__tablename__, DeviceDomainHour.__tablename__, 'domain_id'))
+                    retention.start()
+                    local_status["retention"] = retention.stats
+                    if PIPELINE_WORKERS > 0:
+                        # Ячейка общей памяти вмещает окно шага, собранное из нескольких снимков буфера
+                        pipeline = ProcessingPipeline(PIPELINE_WORKERS, CAPTURE_BUFFER_SIZE * (
+                            max(int(round(TIME_WINDOW / WINDOW_HOP)), 1) if WINDOW_HOP else 1))
+                        _log(f"Обработка окон вынесена в {PIPELINE_WORKERS} процесс(а/ов) конвейера")
+
+                # Шаги 1-3 выполняются только когда веб-приложение что-то изменило в базе
+                if state_changed:
+                    # 1. Очередь обучения: новые модели ставятся в очередь, удалённые - отменяются
+                    untrained_models = Model.query.filter_by(model_path=None).all()
+                    trainer.sync({model.id for model in untrained_models})
+                    for model in untrained_models:
+                        if model.id not in trainer.jobs:
+                            trainer.submit(model.id, model.name, model.model_type)
+                            source = f"запись '{TRAIN_PCAP_FILE}'" if TRAIN_PCAP_FILE else "окна основного захвата"
+                            _log(f"Модель '{model.name}' (тип: {model.model_type}) поставлена в очередь обучения, "
+                                 f"данные: {source}")
+
+                    # 2. Интерфейсы: у каждого свой снифер, окна и (необязательно) своя модель
+                    active_state_from_db = db.session.get(ActiveState, 1) or ActiveState(id=1)
+                    control_fingerprint = read_control_fingerprint(watcher.connection)
+                    owner_id = active_state_from_db.user_id  # Статистика пишется владельцу панели
+
+                    interfaces = interface_cache.get()
+                    local_status["interfaces"] = interfaces
+                    wanted = parse_interface_spec(active_state_from_db.interface) or (
+                        {interfaces[0]: None} if interfaces else {})
+
+                    # 3. Постоянный сбор статистики на всех выбранных интерфейсах
+                    for name in [name for name, monitor in monitors.items()
+                                 if name not in wanted or not monitor.is_running]:
+                        monitors.pop(name).stop()
+                        _log(f"Сборщик трафика на интерфейсе {name} остановлен")
+                    for name in wanted:
+                        if name not in monitors:
+                            monitor = InterfaceMonitor(name, "ip or udp port 53")
+                            monitor.start()
+                            monitors[name] = monitor
+                            _log(f"Сборщик трафика запущен на интерфейсе {name}")
+
+                    # Модель интерфейса - своя (ActiveState.interface 'eth1=5') или выбранная на панели
+                    default_model_id = active_state_from_db.active_model_id
+                    loaded_models = {}  # Каждая модель загружается один раз, даже если нужна нескольким интерфейсам
+                    for name, monitor in monitors.items():
+                        model_id = (wanted[name] or default_model_id) if active_state_from_db.is_monitoring else None
+                        if model_id == monitor.model_id:
+                            continue
+                        if model_id is None:
+                            monitor.set_model(None)
+                            _log(f"Останавливаем ML-мониторинг на {name}.")
+                            continue
+                        _log(f"Запускаем/переключаем ML-мониторинг на {name}...")
+                        if model_id not in loaded_models:
+                            model = db.session.get(Model, model_id)
+                            detector = create_detector(model.model_type) if model and model.model_path else None
+                            if detector and not detector.load_model(model.model_path,
+                                                                    f"{model.model_path}_scaler.joblib"):
+                                detector = None
+                            loaded_models[model_id] = (model, detector)
+                        model, detector = loaded_models[model_id]
+                        if detector:
+                            monitor.set_model(model.id, model.model_type, detector, model.model_path)
+                            _log(f"Модель '{model.name}' успешно загружена и активна на {name}.", "success")
+                        else:
+                            monitor.set_model(None)
+                            _log(f"Ошибка загрузки модели ID {model_id}", "danger")
+                    _refresh_monitor_status()
+
+                    state_changed = False
+
+                window_due = time.monotonic() >= next_window_at
+                if window_due:
+                    # Скользящие окна: просыпаемся к концу шага (по часам эпохи, как и метки пакетов)
+                    next_window_at = time.monotonic() + (seconds_to_next_hop(time.time()) if WINDOW_HOP
+                                                         else TIME_WINDOW)
+                if window_due and monitors:
+                    now = time.time()
+                    windows = []  # (монитор, конец окна, пакеты, нужны ли признаки для обучения, окно полное)
+                    for index, monitor in enumerate(monitors.values()):
+                        snapshot = monitor.take_window()
+                        if snapshot.dropped_packets:
+                            _log(f"Буфер {monitor.name} переполнен: сохранено {len(snapshot)} из "
+                                 f"{snapshot.seen_packets} пакетов (политика {monitor.sniffer.buffer.overflow_policy})",
+                                 "warning")
+                        for window_end, batch, full in monitor.close_windows(snapshot, now):
+                            # Для обучения берутся окна первого интерфейса; неполные окна - только статистика
+                            windows.append((monitor, window_end, batch, full and index == 0 and trainer.collecting,
+                                            full))
+
+                    # 3a/3b. Статистика устройств, признаки и оценка - здесь или в процессах конвейера
+                    # Окна больше ячейки общей памяти обрабатываются здесь же
+                    results = [None] * len(windows)
+                    if pipeline is not None and windows:
+                        queued, tasks = [], []
+                        for i, (monitor, window_end, batch, for_training, full) in enumerate(windows):
+                            if pipeline.fits(batch):
+                                queued.append(i)
+                                tasks.append((batch, window_end, monitor.model_ref if full else None, for_training))
+                        try:
+                            for i, result in zip(queued, pipeline.process(tasks)):
+                                results[i] = result
+                        except queue.Empty:
+                            _log("Конвейер не ответил вовремя, окна обрабатываются в воркере.", "warning")
+                            pipeline.close()
+                            pipeline = None
+                    results = [result or process_window(batch, window_end, monitor.detector if full else None,
+                                                        for_training)
+                               for (monitor, window_end, batch, for_training, full), result in zip(windows, results)]
+
+                    training_features = []
+                    for (monitor, window_end, batch, for_training, full), result in zip(windows, results):
+                        if result.error:
+                            _log(f"Ошибка обработки окна {monitor.name}: {result.error}", "danger")
+                        # Статистика - в память; в базу - раз в TRAFFIC_FLUSH_INTERVAL
+                        traffic_stats.add(result.device_stats)
+                        if not full or (result.features is None and result.error):
+                            continue
+                        if for_training:
+                            training_features.append(result.features)
+                        if monitor.detector and result.group_scores is not None:
+                            threshold, alerts, worst = monitor.apply_group_scores(result.groups, result.group_scores)
+                            for i in np.flatnonzero(alerts)[:MONITOR_TOP_GROUPS]:
+                                _log(f"АНОМАЛИЯ на {monitor.name} от {result.groups.key(i)}! "
+                                     f"Score: {result.group_scores[i]:.4f}", "danger")
+                            # В хранилище оценок - самая аномальная строка окна
+                            pending_scores.append((window_end.timestamp(), monitor.model_id,
+                                                   float(result.group_scores[worst]), threshold, bool(alerts.any()),
+                                                   result.features[worst], monitor.name))
+                        elif monitor.detector and result.score is not None:
+                            threshold, is_alert = monitor.apply_score(result.score)
+                            if is_alert: _log(f"АНОМАЛИЯ на {monitor.name}! Score: {result.score:.4f}", "danger")
+                            pending_scores.append((window_end.timestamp(), monitor.model_id, result.score, threshold,
+                                                   is_alert, result.features, monitor.name))
+                    for features in training_features or [None]:
+                        trainer.add_window(features)
+                    _refresh_monitor_status()
+
+                    pending_events.append(("window", {
+                        "monitoring": local_status["model_id"] is not None, "model_type": local_status["mode"],
+                        "score": local_status["current_score"], "threshold": local_status["adaptive_threshold"],
+                        "is_anomaly": local_status["is_anomaly"], "capture": local_status["capture"],
+                        "interface": local_status["primary_interface"], "monitors": local_status["monitors"]}))
+
+                    if traffic_stats.is_due():
+                        if owner_id is not None:
+                            traffic_stats.flush(db.session, TrafficLog.__table__, owner_id, ROLLUP_TABLES,
+                                                DOMAIN_TABLES)
+                        else:
+                            # Без владельца статистика не копится: иначе первый flush записал бы весь
+                            # трафик с запуска воркера одной строкой на устройство в одну минуту
+                            traffic_stats.discard()
+                    local_status["traffic_log"] = traffic_stats.stats
+
+                # 3c. Завершившиеся задачи обучения
+                for job in trainer.poll():
+                    model = db.session.get(Model, job.model_id)
+                    if job.cancelled or model is None:
+                        if job.model_path: remove_model_files(job.model_path, f"{job.model_path}_scaler.joblib")
+                        _log(f"Обучение модели '{job.name}' отменено.", "warning")
+                    elif job.error:
+                        _log(f"Ошибка обучения модели '{job.name}': {job.error}. Модель удалена.", "danger")
+                        db.session.delete(model)
                     else:
-                        detector = TFAutoencoderDetector() if untrained_model.model_type == 'tensorflow' else IsolationForestDetector()
-                        user_model_dir = os.path.join('models', 'system')
-                        os.makedirs(user_model_dir, exist_ok=True)
-                        base_filename = f'{untrained_model.model_type}_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}'
-                        model_path = os.path.join(user_model_dir, base_filename)
-                        scaler_path = f"{model_path}_scaler.joblib"
-                        detector.train_and_save_model(np.array(X_train_list), model_path, scaler_path)
-
-                        untrained_model.model_path = model_path
-                        untrained_model.timestamp = datetime.utcnow()
-                        _log(f"Обучение модели '{untrained_model.name}' завершено.", "success")
+                        model.model_path = job.model_path
+                        model.timestamp = datetime.utcnow()
+                        _log(f"Обучение модели '{job.name}' завершено ({job.samples} окон).", "success")
                     db.session.commit()
-                    continue
-
-                # 2. Логика Мониторинга
-                active_state_from_db = db.session.get(ActiveState, 1) or ActiveState(id=1)
-
-                is_monitoring_active_in_db = active_state_from_db.is_monitoring
-                is_monitoring_active_in_memory = ml_detector is not None
-
-                if is_monitoring_active_in_db != is_monitoring_active_in_memory or \
-                        (is_monitoring_active_in_db and active_state_from_db.active_model_id != (
-                        active_model_in_memory.id if active_model_in_memory else None)):
-
-                    if is_monitoring_active_in_db:
-                        _log("Запускаем/переключаем ML-мониторинг...")
-                        active_model = db.session.get(Model, active_state_from_db.active_model_id)
-                        if active_model and active_model.model_path:
-                            detector = TFAutoencoderDetector() if active_model.model_type == 'tensorflow' else IsolationForestDetector()
-                            scaler_path = f"{active_model.model_path}_scaler.joblib"
-                            if detector.load_model(active_model.model_path, scaler_path):
-                                ml_detector = detector
-                                active_model_in_memory = active_model
-                                local_status["mode"] = f"Мониторинг ({active_model.model_type})"
-                                local_status["model_id"] = active_model.id
-                                _log(f"Модель '{active_model.name}' успешно загружена и активна.", "success")
-                            else:
-                                _log(f"Ошибка загрузки модели ID {active_model.id}", "danger");
-                                ml_detector = None
-                    else:
-                        _log("Останавливаем ML-мониторинг.")
-                        ml_detector = None;
-                        active_model_in_memory = None
-                        local_status["mode"] = "Сбор статистики";
-                        local_status["model_id"] = None
-
-                # 3. Постоянный сбор статистики
-                current_iface = active_state_from_db.interface or (get_if_list()[0] if get_if_list() else None)
-                if current_iface and (not sniffer or not sniffer.is_running or sniffer.iface_to_use != current_iface):
-                    if sniffer: sniffer.stop_sniffing()
-                    sniffer = PacketSniffer()
-                    sniffer.set_config(current_iface, "ip or udp port 53")
-                    sniffer.start_sniffing()
-                    local_status["interface"] = current_iface
-                    if not ml_detector: local_status["mode"] = "Сбор статистики"
-                    _log(f"Сборщик трафика запущен на интерфейсе {current_iface}")
-
-                if sniffer and sniffer.is_running:
-                    snapshot = sniffer.get_and_clear_buffer()
-                    if snapshot:
-                        # 3a. Сбор статистики
-                        device_stats = defaultdict(
-                            lambda: {"bytes": 0, "packets": 0, "protocols": set(), "domains": set()})
-                        for packet in snapshot:
-                            local_ip = None
-                            if is_local_ip(packet.src_ip):
-                                local_ip = packet.src_ip
-                            elif is_local_ip(packet.dst_ip):
-                                local_ip = packet.dst_ip
-                            if local_ip:
-                                stats = device_stats[local_ip]
-                                stats["bytes"] += packet.length;
-                                stats["packets"] += 1
-                                stats["protocols"].add(packet.protocol)
-                                if packet.domain: stats["domains"].add(packet.domain)
-
-                        if device_stats:
-                            for ip, stats in device_stats.items():
-                                db.session.add(TrafficLog(local_ip=ip, total_bytes=stats["bytes"],
-                                                          packet_count=stats["packets"],
-                                                          protocols=','.join(stats["protocols"]),
-                                                          domains=','.join(stats["domains"])))
-
-                        # 3b. ML-Предсказание
-                        if ml_detector:
-                            feature_vector_obj = extract_features(snapshot, datetime.now())
-                            anomaly_score = ml_detector.predict(feature_vector_obj.get_ml_vector())
-                            is_alert = (
-                                        anomaly_score > ml_detector.initial_threshold) if active_model_in_memory.model_type == 'tensorflow' else (
-                                        anomaly_score < ml_detector.initial_threshold)
-                            local_status.update({"current_score": float(anomaly_score), "is_anomaly": bool(is_alert)})
-                            if is_alert: _log(f"АНОМАЛИЯ! Score: {anomaly_score:.4f}", "danger")
-
-                # 4. Запись статуса в БД
+                local_status["training"] = trainer.status()
+
+                # 4. Запись статуса в БД - только если он изменился - и новых событий для /status/stream
+                stream_state = {key: local_status[key] for key in STREAM_STATE_KEYS}
+                if stream_state != last_stream_state:
+                    pending_events.append(("state", stream_state))
+                    last_stream_state = stream_state
                 status_to_write = local_status.copy()
                 status_to_write["log"] = list(status_to_write["log"])
-                active_state_from_db.worker_status_json = json.dumps(status_to_write)
-                db.session.commit()
+                status_json = json.dumps(status_to_write)
+                if status_json != last_status_json or pending_events or pending_scores:
+                    write_worker_status(watcher.connection, status_json if status_json != last_status_json else None,
+                                        pending_events, owner_id, pending_scores)
+                    last_status_json = status_json
+                    pending_events.clear()
+                    pending_scores.clear()
 
         except Exception as e:
             print("--- КРИТИЧЕСКАЯ ОШИБКА ВОРКЕРА ---")
             traceback.print_exc()
             print("---------------------------------")
+            state_changed = True
+            time.sleep(TIME_WINDOW)
 
-        time.sleep(TIME_WINDOW)
+        # Ждём конца окна или изменения в базе (активация модели, остановка, смена интерфейса).
+        # data_version меняется и от собственных записей воркера через ORM, поэтому
+        # дополнительно сверяем отпечаток управляющего состояния.
+        if watcher is not None and watcher.wait_for_change(next_window_at - time.monotonic()):
+            state_changed = state_changed or read_control_fingerprint(watcher.connection) != control_fingerprint
 
 
 if __name__ == '__main__':